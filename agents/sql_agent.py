@@ -1,18 +1,38 @@
-from typing import TypedDict, Optional
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Set, TypedDict, Optional, Tuple
 import pandas as pd
+import pyarrow as pa
 from langgraph.graph import StateGraph, END
 from services.llm.factory import make_llm
-from tools.schema_loader import load_schema, extract_allowlists
-from tools.sql_validator import validate_read_only
+from tools.schema_loader import load_schema, extract_allowlists, extract_foreign_keys
+from tools.sql_validator import SqlValidator
 from tools.sql_executor import MsSqlExecutor
-from tools.prompt_builders import build_sql_generation_messages, build_beautify_messages
-from helpers.config import load_config
-from helpers.formatting import to_markdown
-from helpers.errors import ClarificationNeeded, ValidationError, ExecutionError
-from db.session import SessionLocal
-from db.models import ChatMessage
+from tools.result_cache import ResultCache
+from tools.query_registry import QueryRegistry
+from tools.paginator import (derive_key_columns, encode_cursor, decode_cursor, first_page_sql, keyset_page_sql,
+                             wrap_with_pagination)
+from tools.prompt_builders import (SchemaRenderer, build_schema_excerpt_with_stats,
+                                   build_sql_generation_messages, build_beautify_messages)
+from tools.sql_cache import SqlGenerationCache, normalize_question, history_hash
+from tools.answer_renderer import AnswerRenderer
+from tools.cost_guard import CostGuard, ShowplanProvider, StaticPlanProvider
+from tools.exporter import encode_batches, gzip_chunks
+from tools.chart_builder import ChartRenderer, infer_chart_spec
+from tools.result_profiler import build_result_context
+from tools.arrow_frames import table_to_frame
+from helpers.cache import TTLCache
+from helpers.components import ComponentRegistry
+from helpers.singleflight import SingleFlight
+from helpers.config import get_config
+from helpers.formatting import to_markdown, df_to_records
+from helpers.errors import (ClarificationNeeded, ValidationError, ExecutionError, ComponentUnavailable,
+                            PaginationError, QueryTooExpensive)
+from helpers.telemetry import telemetry
+from db.session import get_sqlite_engine
+from db.history import HistoryStore
 from tools.schema_retriever import SchemaRetriever
-from openai import RateLimitError, APIStatusError
 
 class AgentState(TypedDict):
     session_id: str
@@ -21,53 +41,167 @@ class AgentState(TypedDict):
     df: Optional[pd.DataFrame]
     explanation_md: Optional[str]
     needs_clarification: bool
-
-
-cfg = load_config()
-schema_json = load_schema(cfg.schema["path"])
-
-# NEW retriever setup
-retriever = None
-if cfg.retriever.get("enabled", False):
-    retriever = SchemaRetriever(
-        schema_json,
-        persist_path=cfg.retriever["persist_path"],
-        top_k=cfg.retriever["top_k"]
+    query_id: Optional[str]
+    has_more: bool
+    answer_source: Optional[str]   # "template" (fast path) or "llm"
+    exec_sql: Optional[str]        # cost-guard TOP rewrite of `sql` for page 1 (sql itself stays registered)
+    limit_reason: Optional[str]    # why the cost guard capped the rows, surfaced to callers
+
+
+cfg = get_config()
+logger = logging.getLogger("ai-sql-agent")
+telemetry.configure(cfg)
+
+
+@dataclass
+class SchemaContext:
+    schema_json: Dict
+    allow_tables: Set[str]               # allow-lists for validation
+    allow_cols: Dict[str, Set[str]]
+    foreign_keys: Dict                   # lets keyset pagination find a unique key for joined results
+    renderer: SchemaRenderer             # compact schema lines, precomputed once
+
+
+# ---- Heavy components: built lazily (first use or background warm-up) ----
+def _make_schema() -> SchemaContext:
+    schema_json = load_schema(cfg.schema["path"])
+    allow_tables, allow_cols = extract_allowlists(schema_json)
+    return SchemaContext(schema_json, allow_tables, allow_cols,
+                         extract_foreign_keys(schema_json), SchemaRenderer(schema_json))
+
+def _make_sql_validator() -> SqlValidator:
+    # compiled once from cfg.security; keeps a bounded verdict cache
+    schema = components.get("schema")
+    return SqlValidator.from_config(cfg, schema.allow_tables, schema.allow_cols)
+
+def _make_retriever() -> Optional[SchemaRetriever]:
+    if not cfg.retriever.get("enabled", False):
+        return None
+    # syncs on start: only new/changed tables are re-embedded
+    return SchemaRetriever.from_config(cfg, components.get("schema").schema_json)
+
+def _make_sql_cache() -> Optional[SqlGenerationCache]:
+    # Question -> SQL cache in front of llm.generate_sql_json
+    sql_cache_cfg = cfg.cache.get("sql_generation", {})
+    if not sql_cache_cfg.get("enabled", False):
+        return None
+    retriever = components.get("retriever")
+    return SqlGenerationCache(
+        schema_path=cfg.schema["path"],
+        embed_fn=retriever.embed if retriever else None,
+        max_entries=sql_cache_cfg.get("max_entries", 1000),
+        ttl_seconds=sql_cache_cfg.get("ttl_seconds", 86400),
+        similarity_threshold=sql_cache_cfg.get("similarity_threshold", 0.93),
     )
 
-# still keep allow-lists for validation
-ALLOW_TABLES, ALLOW_COLS = extract_allowlists(schema_json)
-
-llm = make_llm()
-executor = MsSqlExecutor(cfg.database["odbc_connect"], timeout=cfg.limits["query_timeout_seconds"])
-
+def _make_result_cache() -> Optional[ResultCache]:
+    # Fingerprinted result cache for repeated SELECTs
+    result_cache_cfg = cfg.cache.get("results", {})
+    if not result_cache_cfg.get("enabled", False):
+        return None
+    return ResultCache(
+        dialect=cfg.schema["dialect"],
+        ttl_seconds=result_cache_cfg.get("ttl_seconds", 60),
+        max_bytes=int(result_cache_cfg.get("max_bytes_mb", 256) * 1024 * 1024),
+        max_entries=result_cache_cfg.get("max_entries", 10000),
+        compression=result_cache_cfg.get("compression", "zstd"),
+    )
 
-def node_generate_sql(state: AgentState) -> AgentState:
+def _make_executor() -> MsSqlExecutor:
+    return MsSqlExecutor(cfg.database["odbc_connect"], timeout=cfg.limits["query_timeout_seconds"],
+                         result_cache=components.get("result_cache"),
+                         pool_size=cfg.database.get("pool_size", 5),
+                         max_overflow=cfg.database.get("max_overflow", 10),
+                         fetch_batch_size=cfg.limits.get("fetch_batch_size", 1000),
+                         categorical_max_ratio=cfg.limits.get("categorical_max_ratio", 0.5))
+
+def _make_cost_guard() -> Optional[CostGuard]:
+    guard_cfg = cfg.cost_guard
+    if not guard_cfg.get("enabled", False):
+        return None
+    if guard_cfg.get("provider", "showplan") == "static":
+        provider = StaticPlanProvider(guard_cfg.get("static_table_rows"), guard_cfg.get("static_default_rows", 1000),
+                                      dialect=cfg.schema["dialect"])
+    else:
+        provider = ShowplanProvider(components.get("executor").engine)
+    return CostGuard.from_config(cfg, provider)
+
+def _make_history_store() -> Optional[HistoryStore]:
+    if not cfg.chat_history.get("enabled", False):
+        return None
+    return HistoryStore.from_config(cfg, get_sqlite_engine())
+
+
+components = ComponentRegistry(retry_after_seconds=cfg.app.get("component_retry_seconds", 30))
+components.register("schema", _make_schema)
+components.register("sql_validator", _make_sql_validator)
+components.register("llm", make_llm)
+components.register("executor", _make_executor)
+components.register("history", _make_history_store)
+# optional: on failure the agent degrades (lexical schema ranking, no caching)
+components.register("retriever", _make_retriever, required=False)
+components.register("sql_cache", _make_sql_cache, required=False)
+components.register("result_cache", _make_result_cache, required=False)
+components.register("cost_guard", _make_cost_guard, required=False)
+
+prompt_stats = {"excerpts": 0, "schema_tokens": 0, "schema_tokens_saved": 0, "tables_dropped": 0,
+                "result_summaries": 0, "result_tokens": 0}
+query_registry = QueryRegistry(ttl_seconds=cfg.limits.get("query_handle_ttl_seconds", 3600))
+# empty / single-value / small results are answered from a template instead of a second LLM call
+answer_renderer = AnswerRenderer.from_config(cfg)
+# on-demand LLM summaries, one per query handle
+summary_cache = TTLCache(max_entries=1000, ttl_seconds=cfg.limits.get("query_handle_ttl_seconds", 3600))
+# identical questions already in flight share one graph run (dashboard bursts)
+single_flight = SingleFlight()
+chart_cfg = cfg.ui.get("charts", {})
+# PNG renders keyed by a hash of the chart data; full-result specs per query handle
+chart_renderer = ChartRenderer(max_entries=chart_cfg.get("png_cache_entries", 256),
+                               max_bytes=int(chart_cfg.get("png_cache_mb", 64) * 1024 * 1024))
+chart_cache = TTLCache(max_entries=1000, ttl_seconds=cfg.limits.get("query_handle_ttl_seconds", 3600))
+
+
+async def _history_context(session_id: str, user_query: str) -> list:
+    """Last few messages of the session, minus the current question (already persisted)."""
+    history_store = await components.aget("history")
+    if history_store is None:
+        return []
+    # served from the session ring buffer; SQLite only on a cold session
+    with telemetry.stage("history_load"):
+        context = await history_store.arecent(session_id, limit=5)
+    if context and context[-1]["role"] == "user" and context[-1]["content"] == user_query:
+        context = context[:-1]
+    return context
+
+
+async def node_generate_sql(state: AgentState) -> AgentState:
     """Generate SQL with conversation context."""
-    
-    print("⚙️ node_generate_sql() called")
 
     # Load last few messages for context
-    history_messages = []
-    if cfg.chat_history.get("enabled", False):
-        with SessionLocal() as s:
-            rows = (
-                s.query(ChatMessage)
-                .filter(ChatMessage.session_id == state["session_id"])
-                .order_by(ChatMessage.id.desc())
-                .limit(5)
-                .all()
-            )
-            history_messages = [{"role": r.role, "content": r.content}
-                                for r in reversed(rows)]
+    context = await _history_context(state["session_id"], state["user_query"])
+    schema = await components.aget("schema")
+    retriever = await components.aget("retriever")
 
     # Build base messages
-    base_msgs = build_sql_generation_messages(state["user_query"], schema_json, retriever)
-
-    # Merge history before system+user prompts
-    msgs = history_messages + base_msgs
-    #print(f"🧠 Injected {len(history_messages)} previous messages into prompt: ", history_messages)
-    print(f"🧠 Injected LLM msg input: ", msgs)
+    # Retrieval embeds the question (CPU-bound) → keep it off the event loop
+    with telemetry.stage("retrieval", retriever=retriever is not None):
+        schema_excerpt, excerpt_stats = await asyncio.to_thread(
+            build_schema_excerpt_with_stats, state["user_query"], schema.schema_json, retriever,
+            mode=cfg.prompt.get("schema_format", "json"),
+            token_budget=cfg.prompt.get("schema_token_budget"),
+            max_tables=cfg.prompt.get("max_tables", 50),
+            renderer=schema.renderer,
+        )
+    prompt_stats["excerpts"] += 1
+    prompt_stats["schema_tokens"] += excerpt_stats["tokens"]
+    prompt_stats["schema_tokens_saved"] += excerpt_stats["tokens_saved"]
+    prompt_stats["tables_dropped"] += excerpt_stats.get("dropped_tables", 0)
+    logger.debug("🧮 Schema excerpt: %s", excerpt_stats)
+
+    # Static rules first, then schema, history and question (cache-friendly prefix)
+    msgs = build_sql_generation_messages(state["user_query"], schema.schema_json, retriever,
+                                         schema_excerpt=schema_excerpt, history=context)
+    if cfg.observability.get("log_prompts", False):
+        logger.debug("🧠 Injected LLM msg input: %s", msgs)
 
     mock_enabled = str(cfg.mock_flow.get("enabled", "0")) == "1"
     if mock_enabled:
@@ -79,9 +213,19 @@ def node_generate_sql(state: AgentState) -> AgentState:
             "message": ""
         }
     else:
-        out = llm.generate_sql_json(msgs, temperature=cfg.llm["temperature"])
-
-    print("🤖 LLM output:", out)
+        sql_cache = await components.aget("sql_cache")
+        llm = await components.aget("llm")
+        cache_key = sql_cache.key_for(state["user_query"], schema_excerpt, context) if sql_cache else None
+        out = await asyncio.to_thread(sql_cache.get, cache_key) if sql_cache else None
+        if sql_cache:
+            telemetry.record_cache("sql_generation", out is not None)
+        if out is None:
+            with telemetry.stage("llm_generate_sql"):
+                out = await llm.agenerate_sql_json(msgs, temperature=cfg.llm["temperature"])
+            if sql_cache:
+                sql_cache.put(cache_key, out)
+
+    logger.debug("🤖 LLM output: %s", out)
     if out.get("needs_clarification"):
         raise ClarificationNeeded(out.get("notes") or "Need clarification.")
 
@@ -92,20 +236,40 @@ def node_generate_sql(state: AgentState) -> AgentState:
 
 
 def node_validate(state: AgentState) -> AgentState:
-    print("running node_validate() before: ")
-    sql = state["sql"] or ""
-    validate_read_only(
-        sql=sql,
-        dialect=cfg.schema["dialect"],
-        allow_tables=ALLOW_TABLES,
-        allow_cols=ALLOW_COLS,
-        block_keywords=set(k.upper() for k in cfg.security["block_keywords"]),
-        block_functions=set(cfg.security["block_functions"]),
-        allow_ctes=cfg.security["allow_ctes"],
-    )
+    components.get("sql_validator").validate(state["sql"] or "")
     return state
 
-def node_execute(state: AgentState) -> AgentState:
+async def _cost_guard() -> Optional[CostGuard]:
+    """The configured cost guard; None when it is off or the mock flow runs (nothing is executed)."""
+    if str(cfg.mock_flow.get("enabled", "0")) == "1":
+        return None
+    return await components.aget("cost_guard")
+
+async def _guarded_sql(sql: str, max_rows: int) -> Tuple[str, Optional[str]]:
+    """
+    Cost-guard the statement that will actually run (TOP max_rows of `sql`).
+    Returns (sql to execute, limit reason or None); raises QueryTooExpensive.
+    """
+    run_sql = first_page_sql(sql, max_rows, dialect=cfg.schema["dialect"])
+    guard = await _cost_guard()
+    if guard is None:
+        return run_sql, None
+    with telemetry.stage("cost_guard"):
+        verdict = await asyncio.to_thread(guard.check, run_sql)
+    if verdict.action != "limited":
+        return run_sql, None
+    logger.info("🛡️ Cost guard limited the query: %s", verdict.reason)
+    return verdict.sql, f"Limited to {guard.limit_rows:,} rows by the cost guard ({verdict.reason})"
+
+async def node_cost_guard(state: AgentState) -> AgentState:
+    """Estimated-plan check of page 1: passes, swaps in a TOP-limited query, or raises QueryTooExpensive."""
+    run_sql, reason = await _guarded_sql(state["sql"], cfg.limits["default_page_size"])
+    if reason is not None:
+        # only page 1 runs the rewrite; the handle keeps the validated SQL
+        state["exec_sql"], state["limit_reason"] = run_sql, reason
+    return state
+
+async def node_execute(state: AgentState) -> AgentState:
    
     mock_enabled = str(cfg.mock_flow.get("enabled", "0")) == "1"
 
@@ -132,73 +296,121 @@ def node_execute(state: AgentState) -> AgentState:
     
      # Fallback: try real execution (if credentials available)
     page_size = cfg.limits["default_page_size"]
-    df = executor.run_select(state["sql"], page=1, page_size=page_size, hard_cap=cfg.limits["hard_row_cap"])
+    executor = await components.aget("executor")
+    schema = await components.aget("schema")
+    with telemetry.stage("db_fetch"):
+        df = await executor.arun_select(state.get("exec_sql") or state["sql"], page=1, page_size=page_size,
+                                        hard_cap=cfg.limits["hard_row_cap"])
+    fetch_stats = df.attrs.get("fetch_stats") or {}
+    telemetry.record_fetch(fetch_stats)
+    if executor.result_cache is not None:
+        telemetry.record_cache("results", bool(fetch_stats.get("cached")))
     state["df"] = df
+
+    # Handle for /api/query/{id}/page: keyset cursors when the result has a unique key
+    key_columns = derive_key_columns(state["sql"], schema.allow_cols, schema.foreign_keys, dialect=cfg.schema["dialect"])
+    # a cost-guard-limited answer stays limited when the client walks further pages
+    row_limit = (await _cost_guard()).limit_rows if state.get("limit_reason") else None
+    handle = query_registry.register(state["session_id"], state["sql"], key_columns, page_size,
+                                     question=state["user_query"], row_limit=row_limit)
+    state["query_id"] = handle.query_id
+    state["has_more"] = df.shape[0] >= page_size
     return state
 
-def node_beautify(state: AgentState) -> AgentState:
-    print("🤖 Generating SQL explanation...")
+def _beautify_messages(state: AgentState) -> list:
     df = state.get("df")
 
     # handle None or invalid cases
     if df is None or not isinstance(df, pd.DataFrame) or df.empty:
         df = pd.DataFrame()
 
-    table_md = to_markdown(df)
-    msgs = build_beautify_messages(state["user_query"], state["sql"], table_md)
-    md = llm.markdown(msgs, temperature=0.0)
-    state["explanation_md"] = md
-    print("🤖 SQL explanation:\n", md)
+    if cfg.prompt.get("result_format", "profile") != "profile":
+        return build_beautify_messages(state["user_query"], state["sql"], to_markdown(df))
+
+    # column profile over every fetched row + a few sample rows, under a token budget
+    with telemetry.stage("result_profile"):
+        text, stats = build_result_context(df, has_more=state.get("has_more", False),
+                                           token_budget=cfg.prompt.get("result_token_budget", 1200),
+                                           sample_rows=cfg.prompt.get("result_sample_rows", 10),
+                                           top_k=cfg.prompt.get("result_top_k", 5))
+    prompt_stats["result_summaries"] += 1
+    prompt_stats["result_tokens"] += stats["tokens"]
+    logger.debug("🧮 Result context: %s", stats)
+    return build_beautify_messages(state["user_query"], state["sql"], text, result_format="profile")
+
+def _template_answer(state: AgentState) -> Optional[str]:
+    md = answer_renderer.render(state["user_query"], state["sql"], state.get("df"), state.get("has_more", False))
+    telemetry.record_answer("llm" if md is None else "template")
+    return md
+
+async def node_beautify(state: AgentState) -> AgentState:
+    md = _template_answer(state)
+    if md is not None:
+        state["explanation_md"], state["answer_source"] = md, "template"
+        return state
+
+    msgs = _beautify_messages(state)
+    llm = await components.aget("llm")
+    with telemetry.stage("llm_beautify"):
+        md = await llm.amarkdown(msgs, temperature=0.0)
+    state["explanation_md"], state["answer_source"] = md, "llm"
     return state
 
 def node_end(state: AgentState) -> AgentState:
     return state
 
-graph = StateGraph(AgentState)
-graph.add_node("generate_sql", node_generate_sql)
-graph.add_node("validate", node_validate)
-graph.add_node("execute", node_execute)
-graph.add_node("beautify", node_beautify)
-graph.add_edge("generate_sql", "validate")
-graph.add_edge("validate", "execute")
-graph.add_edge("execute", "beautify")
-graph.add_edge("beautify", END)
-graph.set_entry_point("generate_sql")
-app_graph = graph.compile()
-
-def persist_message(session_id: str, role: str, content: str, provider: str = None, model: str = None):
-    if not cfg.chat_history["enabled"]:
+def build_graph(with_beautify: bool = True):
+    graph = StateGraph(AgentState)
+    graph.add_node("generate_sql", telemetry.node("generate_sql", node_generate_sql))
+    graph.add_node("validate", telemetry.node("validate", node_validate))
+    graph.add_node("cost_guard", telemetry.node("cost_guard", node_cost_guard))
+    graph.add_node("execute", telemetry.node("execute", node_execute))
+    graph.add_edge("generate_sql", "validate")
+    graph.add_edge("validate", "cost_guard")
+    graph.add_edge("cost_guard", "execute")
+    if with_beautify:
+        graph.add_node("beautify", telemetry.node("beautify", node_beautify))
+        graph.add_edge("execute", "beautify")
+        graph.add_edge("beautify", END)
+    else:
+        graph.add_edge("execute", END)
+    graph.set_entry_point("generate_sql")
+    return graph.compile()
+
+app_graph = build_graph()
+# Streaming endpoint runs beautify itself so tokens can be forwarded as they arrive
+query_graph = build_graph(with_beautify=False)
+
+async def persist_message(session_id: str, role: str, content: str, provider: str = None, model: str = None):
+    history_store = await components.aget("history")
+    if history_store is None:
         return
-    with SessionLocal() as s:
-        s.add(ChatMessage(session_id=session_id, role=role, content=content, provider=provider, model=model))
-        s.commit()
+    # write-behind: queued here, committed in batches by the history writer thread
+    await history_store.aappend(session_id, role, content, provider=provider, model=model)
 
-def run_agent(session_id: str, user_query: str) -> dict:
+async def run_agent(session_id: str, user_query: str) -> dict:
     """Main orchestrator for the SQL AI Agent."""
+    with telemetry.request("chat", session_id) as req:
+        response = await _run_agent(session_id, user_query)
+        req["outcome"] = _outcome(response)
+        return response
+
+
+async def _run_agent(session_id: str, user_query: str) -> dict:
     try:
         # 💾 Persist user query
-        persist_message(session_id, "user", user_query,
+        await persist_message(session_id, "user", user_query,
                         provider=cfg.llm["provider"], model=cfg.llm["model"])
 
-        # Create agent state
-        initial_state = AgentState(
-            session_id=session_id,
-            user_query=user_query,
-            sql=None,
-            df=None,
-            explanation_md=None,
-            needs_clarification=False
-        )
-
-        # Execute the state graph
-        final_state = app_graph.invoke(initial_state)
+        # Execute the state graph (shared with identical in-flight requests)
+        final_state = await _coalesced_run(session_id, user_query)
 
         # Extract results
         md = final_state.get("explanation_md") or "No result."
         sql = final_state.get("sql") or ""
 
         # 💾 Save assistant reply
-        persist_message(session_id, "assistant", md,
+        await persist_message(session_id, "assistant", md,
                         provider=cfg.llm["provider"], model=cfg.llm["model"])
 
         # ✅ Response
@@ -206,25 +418,354 @@ def run_agent(session_id: str, user_query: str) -> dict:
             "ok": True,
             "sql": sql,
             "markdown": md,
-            "session_id": session_id
+            "session_id": session_id,
+            "query_id": final_state.get("query_id"),
+            "has_more": final_state.get("has_more", False),
+            "answer_source": final_state.get("answer_source"),
+            "chart": _chart_spec(final_state.get("df")),
+            "limit_reason": final_state.get("limit_reason"),
         }
 
-    except ClarificationNeeded as ce:
-        msg = f"I need a bit more detail to run a safe query: {ce}"
-        persist_message(session_id, "assistant", msg)
+    except Exception as e:
+        return await _error_response(session_id, e)
+
+
+async def _coalesced_run(session_id: str, user_query: str) -> dict:
+    """
+    Single-flight graph run keyed on the normalized question and its history context:
+    concurrent identical requests share the final state (SQL, result handle, answer)
+    or the exception. Each caller still writes its own chat-history entries.
+    """
+    if not cfg.cache.get("single_flight", {}).get("enabled", True):
+        return await app_graph.ainvoke(_initial_state(session_id, user_query))
+    key = (normalize_question(user_query), history_hash(await _history_context(session_id, user_query)))
+    telemetry.record_cache("single_flight", key in single_flight)
+    return await single_flight.do(key, lambda: app_graph.ainvoke(_initial_state(session_id, user_query)))
+
+
+async def _error_response(session_id: str, e: Exception) -> dict:
+    if isinstance(e, ClarificationNeeded):
+        msg = f"I need a bit more detail to run a safe query: {e}"
+        await persist_message(session_id, "assistant", msg)
         return {"ok": False, "needs_clarification": True, "message": msg}
 
-    except ValidationError as ve:
-        msg = f"Query blocked by safety validator: {ve}"
-        persist_message(session_id, "assistant", msg)
-        return {"ok": False, "error": msg}
+    if isinstance(e, ValidationError):
+        msg = f"Query blocked by safety validator: {e}"
+    elif isinstance(e, QueryTooExpensive):
+        msg = f"Query rejected by cost guard: {e}"
+    elif isinstance(e, ExecutionError):
+        msg = f"Execution error: {e}"
+    elif isinstance(e, ComponentUnavailable):
+        msg = f"Service not ready: {e}"
+    else:
+        msg = f"Unexpected error: {e}"
+    await persist_message(session_id, "assistant", msg)
+    return {"ok": False, "error": msg}
+
+
+def _outcome(response: dict) -> str:
+    if response.get("ok"):
+        return "ok"
+    return "clarification" if response.get("needs_clarification") else "error"
+
+
+def _initial_state(session_id: str, user_query: str) -> AgentState:
+    return AgentState(
+        session_id=session_id,
+        user_query=user_query,
+        sql=None,
+        df=None,
+        explanation_md=None,
+        needs_clarification=False,
+        query_id=None,
+        has_more=False,
+        answer_source=None,
+        exec_sql=None,
+        limit_reason=None,
+    )
+
 
-    except ExecutionError as ee:
-        msg = f"Execution error: {ee}"
-        persist_message(session_id, "assistant", msg)
-        return {"ok": False, "error": msg}
+async def stream_agent(session_id: str, user_query: str) -> AsyncIterator[Tuple[str, dict]]:
+    """
+    Same flow as run_agent, but yields (event, payload) pairs as soon as each stage finishes:
+    status → sql (after validate) → preview, chart? (after execute) → token* (beautify) → done | error.
+    """
+    with telemetry.request("chat_stream", session_id) as req:
+        async for event, data in _stream_agent(session_id, user_query):
+            if event == "error":
+                req["outcome"] = _outcome(data)
+            yield event, data
+
+
+async def _stream_agent(session_id: str, user_query: str) -> AsyncIterator[Tuple[str, dict]]:
+    try:
+        await persist_message(session_id, "user", user_query,
+                              provider=cfg.llm["provider"], model=cfg.llm["model"])
+        yield "status", {"stage": "generate_sql"}
+
+        state = _initial_state(session_id, user_query)
+        async for update in query_graph.astream(state, stream_mode="updates"):
+            for node, node_state in update.items():
+                state.update(node_state or {})
+                if node == "generate_sql":
+                    yield "status", {"stage": "validate"}
+                elif node == "cost_guard":
+                    # after the cost guard: validated SQL, plus why rows are capped (if they are)
+                    yield "sql", {"sql": state["sql"], "limit_reason": state.get("limit_reason")}
+                    yield "status", {"stage": "execute"}
+                elif node == "execute":
+                    df = state.get("df")
+                    rows = 0 if df is None else int(df.shape[0])
+                    preview_rows = cfg.limits.get("stream_preview_rows", 20)
+                    yield "preview", {
+                        "columns": [] if df is None else [str(c) for c in df.columns],
+                        "rows": [] if df is None else df_to_records(df, max_rows=preview_rows),
+                        "row_count": rows,
+                    }
+                    chart = _chart_spec(df)
+                    if chart is not None:
+                        yield "chart", chart
+                    yield "status", {"stage": "beautify"}
+
+        md = _template_answer(state)
+        if md is not None:
+            state["answer_source"] = "template"
+            yield "token", {"text": md}
+        else:
+            parts = []
+            llm = await components.aget("llm")
+            with telemetry.stage("llm_beautify"):
+                async for token in llm.amarkdown_stream(_beautify_messages(state), temperature=0.0):
+                    parts.append(token)
+                    yield "token", {"text": token}
+            md = "".join(parts).strip() or "No result."
+            state["answer_source"] = "llm"
+
+        await persist_message(session_id, "assistant", md,
+                              provider=cfg.llm["provider"], model=cfg.llm["model"])
+        yield "done", {"ok": True, "sql": state.get("sql") or "", "markdown": md, "session_id": session_id,
+                       "query_id": state.get("query_id"), "has_more": state.get("has_more", False),
+                       "answer_source": state.get("answer_source"), "limit_reason": state.get("limit_reason")}
 
     except Exception as e:
-        msg = f"Unexpected error: {e}"
-        persist_message(session_id, "assistant", msg)
-        return {"ok": False, "error": msg}
+        yield "error", await _error_response(session_id, e)
+
+
+async def run_batch(session_id: str, questions: List[str], concurrency: Optional[int] = None) -> AsyncIterator[dict]:
+    """
+    Many independent questions with bounded fan-out; yields one run_agent response per
+    question (plus "index" and "question") in completion order. Each question runs in
+    its own "<session_id>:<index>" session so answers never depend on batch order.
+    """
+    with telemetry.request("chat_batch", session_id) as req:
+        retriever = await components.aget("retriever")
+        if retriever is not None and questions:
+            # one forward pass for the whole batch (not capped at embed_max_batch); every
+            # question's retrieval then hits the embedding LRU
+            with telemetry.stage("batch_embed"):
+                try:
+                    await asyncio.to_thread(retriever.prime, questions)
+                except Exception as e:
+                    logger.warning("⚠️ Batch pre-embedding failed, questions embed one by one: %s", e)
+
+        semaphore = asyncio.Semaphore(max(1, concurrency or cfg.batch.get("concurrency", 4)))
+
+        async def answer(index: int, question: str) -> dict:
+            async with semaphore:
+                # run_agent turns ClarificationNeeded / ValidationError / ... into an error response
+                response = await run_agent(f"{session_id}:{index}", question)
+            return {"index": index, "question": question, **response}
+
+        tasks = [asyncio.create_task(answer(i, q)) for i, q in enumerate(questions)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # client went away mid-batch: stop the questions that have not finished
+            for task in tasks:
+                task.cancel()
+        req["outcome"] = "ok"
+
+
+async def resync_retriever() -> Optional[Dict]:
+    """Re-read the schema file and re-embed only tables whose content changed."""
+    retriever = await components.aget("retriever")
+    if retriever is None:
+        return None
+    return await asyncio.to_thread(retriever.sync, load_schema(cfg.schema["path"]))
+
+
+async def fetch_page(query_id: str, cursor: Optional[str] = None, page_size: Optional[int] = None) -> Optional[dict]:
+    """
+    One page of a query returned by /api/chat. Keyset pages walk the result in
+    key order starting from the first row (cursor=None); queries without a
+    derivable key fall back to OFFSET pages under a stable ORDER BY.
+    Both modes stop at limits.hard_row_cap (and at the cost guard's TOP when the
+    chat answer was limited); the sorted page statement is cost-guarded first.
+    Returns None for unknown/expired query ids; raises QueryTooExpensive.
+    """
+    handle = query_registry.get(query_id)
+    if handle is None:
+        return None
+
+    page_size = max(1, min(page_size or handle.page_size, cfg.limits["max_page_size"]))
+    bound = min(cfg.limits["hard_row_cap"], handle.row_limit or cfg.limits["hard_row_cap"])
+    executor = await components.aget("executor")
+    position = decode_cursor(cursor) if cursor else {}
+    guard = await _cost_guard()
+
+    if handle.key_columns:
+        if guard is not None:
+            # every page sorts the whole derived table by the key; cursor values do not change the plan shape
+            with telemetry.stage("cost_guard"):
+                await asyncio.to_thread(guard.check, keyset_page_sql(handle.sql, handle.key_columns, None, page_size)[0])
+        served = int(position.get("served", 0))
+        if served >= bound:
+            raise PaginationError(f"Cursor is past this query's {bound:,}-row limit.")
+        df = await executor.arun_keyset_page(handle.sql, handle.key_columns, position.get("after"), page_size)
+        df = df.head(bound - served)
+        served += df.shape[0]
+        next_cursor = None
+        if df.shape[0] == page_size and served < bound:
+            last = df_to_records(df.tail(1))[0]
+            next_cursor = encode_cursor({"after": [last[c] for c in handle.key_columns], "served": served})
+        mode = "keyset"
+    else:
+        if guard is not None:
+            with telemetry.stage("cost_guard"):
+                await asyncio.to_thread(guard.check, wrap_with_pagination(handle.sql, 1, page_size))
+        page = int(position.get("page", 1))
+        start = (page - 1) * page_size
+        if start >= bound:
+            raise PaginationError(f"Cursor is past this query's {bound:,}-row limit.")
+        df = (await executor.arun_offset_page(handle.sql, page, page_size)).head(bound - start)
+        more = df.shape[0] == page_size and start + page_size < bound
+        next_cursor = encode_cursor({"page": page + 1}) if more else None
+        mode = "offset"
+
+    return {
+        "ok": True,
+        "query_id": query_id,
+        "mode": mode,
+        "columns": [str(c) for c in df.columns],
+        "rows": df_to_records(df),
+        "next_cursor": next_cursor,
+    }
+
+
+def _count_export(batches):
+    stats = {"rows": 0, "bytes": 0}
+    for batch in batches:
+        stats["rows"] += batch.num_rows
+        stats["bytes"] += batch.nbytes
+        yield batch
+    telemetry.record_fetch(stats)
+    logger.info("📦 Export finished: %s rows / %s Arrow bytes", stats["rows"], stats["bytes"])
+
+
+async def export_query(query_id: str, fmt: str, max_rows: Optional[int] = None,
+                       gzip: bool = False) -> Optional[Tuple[AsyncIterator[bytes], Optional[str]]]:
+    """
+    The full result of a /api/chat query as csv / parquet / arrow bytes. The validated SQL
+    is re-run and cursor batches go straight through the encoder (no DataFrame), capped at
+    limits.export_row_cap (and at the cost guard's TOP when it limits the export; the
+    reason is returned with the stream). The first chunk is produced before returning,
+    so SQL errors raise here instead of mid-response. Returns None for unknown/expired query ids.
+    """
+    handle = query_registry.get(query_id)
+    if handle is None:
+        return None
+
+    cap = cfg.limits.get("export_row_cap", 1_000_000)
+    max_rows = max(1, min(max_rows or cap, cap))
+    run_sql, limit_reason = await _guarded_sql(handle.sql, max_rows)
+    executor = await components.aget("executor")
+    chunks = encode_batches(_count_export(executor.iter_export(run_sql, max_rows)), fmt)
+    if gzip:
+        chunks = gzip_chunks(chunks)
+    stream = executor.aiterate(chunks)
+    try:
+        first = await stream.__anext__()
+    except StopAsyncIteration:
+        first = b""
+
+    async def body() -> AsyncIterator[bytes]:
+        if first:
+            yield first
+        async for chunk in stream:
+            yield chunk
+
+    return body(), limit_reason
+
+
+def _chart_spec(df: Optional[pd.DataFrame], max_points: Optional[int] = None) -> Optional[dict]:
+    """JSON chart spec for a result (None when charts are off or the result is not chartable)."""
+    if not cfg.ui.get("enable_charts", False) or df is None:
+        return None
+    try:
+        with telemetry.stage("chart_spec"):
+            return infer_chart_spec(df, max_points=max_points or chart_cfg.get("max_points", 1000),
+                                    method=chart_cfg.get("downsample", "lttb"),
+                                    max_categories=chart_cfg.get("max_categories", 50),
+                                    max_series=chart_cfg.get("max_series", 5))
+    except Exception as e:
+        # a chart is a nice-to-have: never fail the answer over it
+        logger.warning("⚠️ Chart inference failed: %s", e)
+        return None
+
+
+async def chart_query(query_id: str, max_points: Optional[int] = None) -> Optional[dict]:
+    """
+    Chart spec over the full result of a /api/chat query (up to ui.charts.max_rows rows,
+    not only the first page), downsampled to max_points. Cached per query handle.
+    Returns None for unknown/expired query ids.
+    """
+    handle = query_registry.get(query_id)
+    if handle is None:
+        return None
+    max_points = max(3, min(max_points or chart_cfg.get("max_points", 1000), 10 * chart_cfg.get("max_points", 1000)))
+    key = (query_id, max_points)
+    cached = chart_cache.get(key)
+    if cached is None:
+        max_rows = chart_cfg.get("max_rows", 100_000)
+        run_sql, limit_reason = await _guarded_sql(handle.sql, max_rows)
+        executor = await components.aget("executor")
+        with telemetry.stage("db_fetch"):
+            batches = [b async for b in executor.aiterate(executor.iter_export(run_sql, max_rows))]
+        df = await asyncio.to_thread(lambda: table_to_frame(pa.Table.from_batches(batches)))
+        cached = (await asyncio.to_thread(_chart_spec, df, max_points), limit_reason)
+        chart_cache.put(key, cached)
+    spec, limit_reason = cached
+    return {"ok": True, "query_id": query_id, "chart": spec, "limit_reason": limit_reason}
+
+
+async def chart_png(spec: dict) -> bytes:
+    """Rendered PNG of a chart spec (cached by data hash; raises ComponentUnavailable without plotly/kaleido)."""
+    renders = chart_renderer.renders
+    with telemetry.stage("chart_render"):
+        image = await asyncio.to_thread(chart_renderer.png, spec)
+    telemetry.record_cache("chart_png", chart_renderer.renders == renders)
+    return image
+
+
+async def summarize_query(query_id: str) -> Optional[dict]:
+    """
+    LLM summary for a result that was answered from a template (or again for any
+    query handle). Re-reads the first page (usually a result-cache hit).
+    Returns None for unknown/expired query ids.
+    """
+    handle = query_registry.get(query_id)
+    if handle is None:
+        return None
+    md = summary_cache.get(query_id)
+    if md is None:
+        executor = await components.aget("executor")
+        df = await executor.arun_select(handle.sql, page=1, page_size=handle.page_size,
+                                        hard_cap=cfg.limits["hard_row_cap"])
+        state = _initial_state(handle.session_id, handle.question)
+        state["sql"], state["df"] = handle.sql, df
+        llm = await components.aget("llm")
+        with telemetry.stage("llm_beautify"):
+            md = await llm.amarkdown(_beautify_messages(state), temperature=0.0)
+        summary_cache.put(query_id, md)
+    return {"ok": True, "query_id": query_id, "markdown": md}
@@ -0,0 +1,134 @@
+"""
+Schema retriever benchmark: Chroma vs the in-process NumPy index.
+
+    python -m benchmarks.bench_retriever --tables 3000 --queries 500
+    python -m benchmarks.bench_retriever --fake-embedder     # no model download
+
+Builds each backend over a synthetic schema in a temp directory and times
+SchemaRetriever.query(). With --fake-embedder a hashing embedder replaces
+sentence-transformers, so the numbers isolate index/search overhead.
+Backends whose dependencies are missing are skipped.
+"""
+import argparse
+import hashlib
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from typing import List, Sequence
+
+import numpy as np
+
+from tools.schema_retriever import SchemaRetriever
+
+WORDS = ["student", "payment", "invoice", "school", "grade", "teacher", "course", "fee", "budget",
+         "account", "transaction", "attendance", "class", "term", "refund", "discount", "parent"]
+
+
+class HashingEmbedder:
+    """Deterministic bag-of-words hashing embedder (benchmarking only)."""
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _vector(self, text: str) -> np.ndarray:
+        v = np.zeros(self.dim, dtype=np.float32)
+        for token in text.lower().replace(",", " ").replace(".", " ").split():
+            h = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little")
+            v[h % self.dim] += 1.0 if (h >> 63) else -1.0
+        n = np.linalg.norm(v)
+        return v / n if n else v
+
+    def __call__(self, input: Sequence[str]) -> np.ndarray:
+        return np.stack([self._vector(t) for t in input]) if len(input) else np.zeros((0, self.dim), np.float32)
+
+
+def synthetic_schema(n_tables: int, seed: int = 3) -> dict:
+    rnd = random.Random(seed)
+    tables = []
+    for i in range(n_tables):
+        schema = rnd.choice(["dbo", "epay", "hr", "bs"])
+        name = f"{rnd.choice(WORDS).title()}{rnd.choice(WORDS).title()}{i}"
+        cols = {"Id": "int"}
+        cols.update({f"{rnd.choice(WORDS).title()}{j}": "nvarchar(100)" for j in range(rnd.randint(4, 20))})
+        fks = [{"ParentColumn": f"{w.title()}Id", "ReferencedTable": f"dbo.{w.title()}s", "ReferencedColumn": "Id"}
+               for w in rnd.sample(WORDS, rnd.randint(0, 3))]
+        tables.append({"SchemaName": schema, "TableName": name, "FullTableName": f"{schema}.{name}",
+                       "Columns": cols, "ForeignKeys": fks})
+    return {"DatabaseSchema": tables}
+
+
+def questions(n: int, seed: int = 5) -> List[str]:
+    rnd = random.Random(seed)
+    return [f"total {rnd.choice(WORDS)} per {rnd.choice(WORDS)} for each {rnd.choice(WORDS)} last month"
+            for _ in range(n)]
+
+
+def chroma_embedding_fn(embedder):
+    """Wrap a plain callable so Chroma accepts it as an embedding function."""
+    from chromadb import EmbeddingFunction
+
+    class _Wrapped(EmbeddingFunction):
+        def __call__(self, input):
+            return embedder(input).tolist()
+
+    return _Wrapped()
+
+
+def bench(label: str, make, qs: List[str], top_k: int) -> None:
+    path = tempfile.mkdtemp(prefix="bench_retriever_")
+    try:
+        t0 = time.perf_counter()
+        try:
+            retriever = make(path)
+        except ImportError as e:
+            print(f"{label:<18} skipped ({e})")
+            return
+        build_s = time.perf_counter() - t0
+        retriever.query(qs[0])  # warm-up (model load, page-in)
+        samples = []
+        for q in qs:
+            t = time.perf_counter()
+            retriever.query(q)
+            samples.append((time.perf_counter() - t) * 1e3)
+        samples.sort()
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        print(f"{label:<18} build={build_s:7.2f}s  p50={statistics.median(samples):7.3f}ms  "
+              f"p95={p95:7.3f}ms  qps={len(samples) / (sum(samples) / 1e3):8.0f}  (top_k={top_k})")
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--tables", type=int, default=3000)
+    ap.add_argument("--queries", type=int, default=500)
+    ap.add_argument("--top-k", type=int, default=25)
+    ap.add_argument("--model", default="all-MiniLM-L6-v2")
+    ap.add_argument("--fake-embedder", action="store_true", help="hashing embedder instead of sentence-transformers")
+    args = ap.parse_args()
+
+    schema = synthetic_schema(args.tables)
+    qs = questions(args.queries)
+    embedder = HashingEmbedder() if args.fake_embedder else None
+    print(f"📊 {args.tables} tables, {args.queries} questions, "
+          f"{'hashing' if embedder else args.model} embeddings")
+
+    def numpy_backend(quantization):
+        return lambda path: SchemaRetriever(schema, persist_path=path, top_k=args.top_k, backend="numpy",
+                                            embedding_model=args.model, quantization=quantization,
+                                            embedding_fn=embedder)
+
+    def chroma_backend(path):
+        return SchemaRetriever(schema, persist_path=path, top_k=args.top_k, backend="chroma",
+                               embedding_model=args.model,
+                               embedding_fn=chroma_embedding_fn(embedder) if embedder else None)
+
+    bench("chroma", chroma_backend, qs, args.top_k)
+    bench("numpy float32", numpy_backend("float32"), qs, args.top_k)
+    bench("numpy int8", numpy_backend("int8"), qs, args.top_k)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Validator micro-benchmark.
+
+    python -m benchmarks.bench_sql_validator --queries 3000 --repeat 3
+
+Generates realistic SELECTs (joins, filters, aggregates, CTEs, a share of
+invalid ones) over a synthetic schema and reports per-query latency for
+the one-shot validate_read_only(), a SqlValidator with the verdict cache
+disabled (cold) and the same validator with the cache warm.
+"""
+import argparse
+import random
+import statistics
+import time
+from typing import Callable, List
+
+from helpers.errors import ValidationError
+from tools.sql_validator import SqlValidator, validate_read_only
+
+BLOCK_KW = ["INSERT", "UPDATE", "DELETE", "MERGE", "DROP", "ALTER", "CREATE", "TRUNCATE",
+            "GRANT", "REVOKE", "DENY", "EXEC", "EXECUTE", "BACKUP", "RESTORE", "SHUTDOWN", "RECONFIGURE"]
+BLOCK_FN = ["OPENROWSET", "OPENDATASOURCE", "OPENQUERY", "xp_cmdshell", "sp_configure", "sp_OA%"]
+
+
+def synthetic_schema(n_tables: int = 60, n_cols: int = 12):
+    schemas = ["dbo", "epay", "hr", "bs"]
+    tables = {}
+    for i in range(n_tables):
+        name = f"{schemas[i % len(schemas)]}.T{i}"
+        tables[name] = ["Id"] + [f"C{j}" for j in range(n_cols - 1)]
+    allow_cols = {}
+    for t, cols in tables.items():
+        allow_cols[t] = set(cols)
+        allow_cols.setdefault(t.split(".")[1], set()).update(cols)
+    return tables, allow_cols
+
+
+def generate_queries(tables, n: int, invalid_ratio: float = 0.1, seed: int = 7) -> List[str]:
+    rnd = random.Random(seed)
+    names = list(tables)
+    out = []
+    for _ in range(n):
+        a, b = rnd.sample(names, 2)
+        ca, cb = rnd.sample(tables[a][1:], 2)
+        shape = rnd.randrange(5)
+        if shape == 0:
+            sql = f"SELECT x.Id, x.{ca} FROM {a} x WHERE x.{cb} > {rnd.randint(0, 999)}"
+        elif shape == 1:
+            sql = (f"SELECT x.{ca}, y.{tables[b][1]} FROM {a} x JOIN {b} y ON y.Id = x.{cb} "
+                   f"WHERE x.{ca} IN ({', '.join(str(rnd.randint(0, 99)) for _ in range(5))})")
+        elif shape == 2:
+            sql = f"SELECT x.{ca}, COUNT(*) AS n, SUM(x.{cb}) AS total FROM {a} x GROUP BY x.{ca} ORDER BY n DESC"
+        elif shape == 3:
+            sql = (f"WITH recent AS (SELECT Id, {ca} FROM {a} WHERE {cb} >= '2024-01-01') "
+                   f"SELECT r.{ca}, y.{tables[b][2]} FROM recent r LEFT JOIN {b} y ON y.Id = r.Id")
+        else:
+            sql = (f"SELECT TOP 50 x.* FROM {a} x WHERE EXISTS "
+                   f"(SELECT 1 FROM {b} y WHERE y.Id = x.Id AND y.{tables[b][3]} LIKE 'A%')")
+        if rnd.random() < invalid_ratio:
+            sql = rnd.choice([
+                f"DELETE FROM {a} WHERE Id = 1",
+                f"SELECT * FROM secret.T{rnd.randint(0, 9)}",
+                f"{sql}; DROP TABLE {a}",
+                f"SELECT * FROM OPENROWSET('SQLNCLI', 'x', 'SELECT 1')",
+            ])
+        out.append(sql)
+    return out
+
+
+def timed(fn: Callable[[str], object], queries: List[str]) -> List[float]:
+    samples = []
+    for sql in queries:
+        t0 = time.perf_counter()
+        try:
+            fn(sql)
+        except ValidationError:
+            pass
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def report(label: str, samples: List[float]) -> None:
+    us = sorted(s * 1e6 for s in samples)
+    p99 = us[min(len(us) - 1, int(len(us) * 0.99))]
+    print(f"{label:<22} p50={statistics.median(us):9.1f}µs  p99={p99:9.1f}µs  "
+          f"qps={len(us) / (sum(us) / 1e6):10.0f}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--queries", type=int, default=3000)
+    ap.add_argument("--repeat", type=int, default=3, help="passes over the workload (repeats hit the cache)")
+    ap.add_argument("--invalid-ratio", type=float, default=0.1)
+    args = ap.parse_args()
+
+    tables, allow_cols = synthetic_schema()
+    allow_tables = set(tables)
+    queries = generate_queries(tables, args.queries, args.invalid_ratio)
+    workload = queries * args.repeat
+    print(f"📊 {len(queries)} distinct queries × {args.repeat} passes, {len(tables)} tables")
+
+    report("validate_read_only", timed(
+        lambda s: validate_read_only(s, "tsql", allow_tables, allow_cols,
+                                     set(BLOCK_KW), set(BLOCK_FN), True), workload))
+    cold = SqlValidator("tsql", allow_tables, allow_cols, BLOCK_KW, BLOCK_FN, cache_size=0)
+    report("SqlValidator (cold)", timed(cold.validate, workload))
+    warm = SqlValidator("tsql", allow_tables, allow_cols, BLOCK_KW, BLOCK_FN, cache_size=len(queries))
+    report("SqlValidator (cached)", timed(warm.validate, workload))
+    print(f"   verdict cache: {warm.stats()}")
+
+
+if __name__ == "__main__":
+    main()
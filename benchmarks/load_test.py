@@ -0,0 +1,300 @@
+"""
+Offline load test: the real FastAPI app and LangGraph flow against a local
+LLM stub and a SQLite copy of the schema. No API key, no SQL Server.
+
+    python -m benchmarks.load_test --requests 200 --concurrency 16
+    python -m benchmarks.load_test --endpoint stream --llm-latency-ms 150 --token-ms 5
+    python -m benchmarks.load_test --synthetic-tables 500 --rows 200 --json out.json
+
+Requests go through httpx's ASGI transport (in-process, no port), so the numbers
+cover routing, graph, validation, execution and history, minus the network.
+Reports p50/p95/p99 and requests/s for the endpoint and every graph node.
+Caches and the retriever are off unless --with-caches / --retriever are given.
+Run from the repository root (config/config.yaml is read relative to it).
+"""
+import argparse
+import asyncio
+import contextlib
+import functools
+import inspect
+import io
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.bench_retriever import synthetic_schema
+from benchmarks.sqlite_backend import SqliteExecutor, build_database
+from benchmarks.stub_llm import StubProfile, serve
+from helpers.config import get_config
+from tools.schema_loader import load_schema
+
+NODES = ("generate_sql", "validate", "cost_guard", "execute", "beautify")
+QUESTIONS = [
+    "How many records were created in the last 60 days?",
+    "Show the latest rows",
+    "Total per status",
+    "Top users by number of updates",
+    "List everything updated this month",
+    "Count rows grouped by type",
+]
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"n": 0}
+    s = sorted(samples)
+    pick = lambda q: s[min(len(s) - 1, int(len(s) * q))]
+    return {"n": len(s), "p50": statistics.median(s), "p95": pick(0.95), "p99": pick(0.99), "max": s[-1]}
+
+
+def _ms(p: Dict[str, float]) -> Dict[str, float]:
+    return {k: v if k == "n" else round(v * 1e3, 2) for k, v in p.items()}
+
+
+def configure(args, workdir: str) -> str:
+    """Point the shared config snapshot at the stand-ins before any component is built."""
+    cfg = get_config()
+    if args.synthetic_tables:
+        schema_path = os.path.join(workdir, "schema.json")
+        with open(schema_path, "w", encoding="utf-8") as f:
+            json.dump(synthetic_schema(args.synthetic_tables), f)
+    else:
+        schema_path = args.schema
+    cfg.schema["path"] = schema_path
+    cfg.chat_history["sqlite_path"] = os.path.join(workdir, "chat_history.sqlite3")
+    cfg.mock_flow["enabled"] = "0"
+    cfg.retriever["enabled"] = bool(args.retriever)
+    cfg.cache.setdefault("sql_generation", {})["enabled"] = bool(args.with_caches)
+    cfg.cache.setdefault("results", {})["enabled"] = bool(args.with_caches)
+    cfg.cache.setdefault("single_flight", {})["enabled"] = bool(args.with_caches)
+    # SQLite has no SHOWPLAN: estimate from the synthetic row counts instead
+    cfg.cost_guard.update(provider="static", static_default_rows=args.rows)
+    return schema_path
+
+
+def instrument_nodes(agent, timings: Dict[str, List[float]]) -> None:
+    """Wrap the graph nodes with timers and recompile both graphs."""
+    def timed(name, fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(state):
+                t0 = time.perf_counter()
+                try:
+                    return await fn(state)
+                finally:
+                    timings[name].append(time.perf_counter() - t0)
+        else:
+            @functools.wraps(fn)
+            def wrapper(state):
+                t0 = time.perf_counter()
+                try:
+                    return fn(state)
+                finally:
+                    timings[name].append(time.perf_counter() - t0)
+        return wrapper
+
+    for name in NODES:
+        setattr(agent, f"node_{name}", timed(name, getattr(agent, f"node_{name}")))
+    agent.app_graph = agent.build_graph()
+    agent.query_graph = agent.build_graph(with_beautify=False)
+
+
+async def asgi_stream(app, path: str, body: Dict):
+    """POST straight into the ASGI app and yield body chunks as they are sent
+    (httpx's ASGI transport buffers the whole response, hiding time-to-first-event)."""
+    payload = json.dumps(body).encode("utf-8")
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+             "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+             "root_path": "", "headers": [(b"content-type", b"application/json"),
+                                          (b"content-length", str(len(payload)).encode())],
+             "client": ("127.0.0.1", 0), "server": ("bench", 80)}
+    chunks: asyncio.Queue = asyncio.Queue()
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        await asyncio.Event().wait()  # no disconnect while the response streams
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            await chunks.put(message.get("body", b""))
+            if not message.get("more_body", False):
+                await chunks.put(None)
+
+    task = asyncio.create_task(app(scope, receive, send))
+    try:
+        while (chunk := await chunks.get()) is not None:
+            yield chunk
+    finally:
+        await task
+
+
+async def one_request(client: httpx.AsyncClient, app, endpoint: str, i: int, sessions: int) -> Dict:
+    body = {"session_id": f"bench-{i % sessions}", "message": QUESTIONS[i % len(QUESTIONS)]}
+    t0 = time.perf_counter()
+    if endpoint == "chat":
+        r = await client.post("/api/chat", json=body)
+        data = r.json() if r.status_code == 200 else {"ok": False, "error": f"HTTP {r.status_code}"}
+        return {"seconds": time.perf_counter() - t0, "ok": bool(data.get("ok")),
+                "error": data.get("error") or data.get("message")}
+
+    first_sql = first_token = None
+    last_event, error = None, None
+    async for chunk in asgi_stream(app, "/api/chat/stream", body):
+        for line in chunk.decode("utf-8").splitlines():
+            if line.startswith("event:"):
+                last_event = line.split(":", 1)[1].strip()
+                if last_event == "sql" and first_sql is None:
+                    first_sql = time.perf_counter() - t0
+                elif last_event == "token" and first_token is None:
+                    first_token = time.perf_counter() - t0
+            elif line.startswith("data:") and last_event == "error":
+                payload = json.loads(line[5:])
+                error = payload.get("error") or payload.get("message")
+    return {"seconds": time.perf_counter() - t0, "ok": last_event == "done", "error": error,
+            "first_sql": first_sql, "first_token": first_token}
+
+
+async def drive(app, args, timings: Dict[str, List[float]]) -> List[Dict]:
+    sem = asyncio.Semaphore(args.concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def bounded(i):
+            async with sem:
+                return await one_request(client, app, args.endpoint, i, args.concurrency)
+
+        # warm-up outside the measured window (first LLM connection, SQLite pages)
+        await one_request(client, app, args.endpoint, 0, 1)
+        timings.clear()
+        started = time.perf_counter()
+        results = await asyncio.gather(*(bounded(i) for i in range(args.requests)))
+        wall = time.perf_counter() - started
+    for r in results:
+        r["wall"] = wall
+    return results
+
+
+def report(args, results: List[Dict], timings: Dict[str, List[float]]) -> Dict:
+    wall = results[0]["wall"] if results else 0.0
+    ok = [r for r in results if r["ok"]]
+    summary = {
+        "endpoint": f"/api/chat{'/stream' if args.endpoint == 'stream' else ''}",
+        "requests": len(results), "ok": len(ok), "errors": len(results) - len(ok),
+        "concurrency": args.concurrency, "wall_seconds": round(wall, 3),
+        "rps": round(len(results) / wall, 2) if wall else 0.0,
+        "latency_ms": _ms(percentiles([r["seconds"] for r in results])),
+        "nodes_ms": {name: _ms(percentiles(timings[name])) for name in NODES if timings.get(name)},
+        "top_errors": Counter(str(r["error"])[:120] for r in results if not r["ok"]).most_common(5),
+    }
+    for key in ("first_sql", "first_token"):
+        samples = [r[key] for r in results if r.get(key) is not None]
+        if samples:
+            summary[f"{key}_ms"] = _ms(percentiles(samples))
+
+    def line(label, p):
+        if not p.get("n"):
+            return
+        print(f"{label:<18} n={p['n']:<6} p50={p['p50']:9.2f}ms  p95={p['p95']:9.2f}ms  "
+              f"p99={p['p99']:9.2f}ms  max={p['max']:9.2f}ms")
+
+    print(f"\n📊 {summary['endpoint']}: {summary['requests']} requests @ concurrency {args.concurrency} "
+          f"→ {summary['rps']} req/s, {summary['errors']} errors, {summary['wall_seconds']}s wall")
+    line("end-to-end", summary["latency_ms"])
+    for key in ("first_sql_ms", "first_token_ms"):
+        if key in summary:
+            line(key[:-3], summary[key])
+    for name, p in summary["nodes_ms"].items():
+        line(f"node {name}", p)
+    for err, n in summary["top_errors"]:
+        print(f"   ❌ {n}× {err}")
+    return summary
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--requests", type=int, default=100)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--endpoint", choices=["chat", "stream"], default="chat")
+    ap.add_argument("--schema", default="schema/database_schema.json")
+    ap.add_argument("--synthetic-tables", type=int, default=0, help="generate a schema with N tables instead")
+    ap.add_argument("--rows", type=int, default=2000, help="synthetic rows per table")
+    ap.add_argument("--llm-latency-ms", type=float, default=200.0, help="median stub time to first token")
+    ap.add_argument("--llm-sigma", type=float, default=0.25)
+    ap.add_argument("--token-ms", type=float, default=5.0, help="stub delay per streamed token")
+    ap.add_argument("--markdown-tokens", type=int, default=120)
+    ap.add_argument("--llm-error-rate", type=float, default=0.0)
+    ap.add_argument("--llm-rpm", type=int, default=0, help="stub answers 429 above this many requests/minute")
+    ap.add_argument("--with-caches", action="store_true", help="keep SQL-generation/result caches and single-flight on")
+    ap.add_argument("--retriever", action="store_true", help="keep the schema retriever on (downloads a model)")
+    ap.add_argument("--json", help="write the summary to this file")
+    ap.add_argument("--verbose", action="store_true", help="keep the agent's console output")
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="load_test_")
+    server = None
+    try:
+        schema_path = configure(args, workdir)
+        files = build_database(load_schema(schema_path), os.path.join(workdir, "db"), args.rows)
+
+        # imported after configure(): the app and agent read the config snapshot at import
+        import agents.sql_agent as agent
+        from main import app
+        from services.llm.dispatcher import RateLimitDispatcher
+        from services.llm.openai_compatible import OpenAICompatibleService
+
+        server, llm_url = serve(StubProfile(args.llm_latency_ms, args.llm_sigma, args.token_ms,
+                                            args.markdown_tokens, args.llm_error_rate, rpm_limit=args.llm_rpm))
+        os.environ.setdefault("STUB_LLM_API_KEY", "stub")
+        cfg = get_config()
+        rate_limits = cfg.llm.get("rate_limits") or {}
+        dispatcher = RateLimitDispatcher.from_config("openai:stub", rate_limits) \
+            if rate_limits.get("enabled", False) else None
+        agent.components.override("llm", OpenAICompatibleService(
+            base_url=llm_url, api_key_env="STUB_LLM_API_KEY", model="stub", timeout=60, max_retries=0,
+            provider_name="openai", dispatcher=dispatcher))
+        agent.components.override("executor", SqliteExecutor(
+            files, pool_size=cfg.database.get("pool_size", 5), max_overflow=cfg.database.get("max_overflow", 10),
+            result_cache=agent.components.get("result_cache"),
+            fetch_batch_size=cfg.limits.get("fetch_batch_size", 1000),
+            categorical_max_ratio=cfg.limits.get("categorical_max_ratio", 0.5)))
+
+        timings: Dict[str, List[float]] = defaultdict(list)
+        instrument_nodes(agent, timings)
+
+        async def run():
+            await agent.components.warm_up()
+            results = await drive(app, args, timings)
+            history_store = agent.components.peek("history")
+            if history_store is not None:
+                history_store.close()
+            return results
+
+        print(f"🧪 {len(files)} schema file(s), LLM stub at {llm_url}, {args.requests} requests")
+        quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with quiet:
+            results = asyncio.run(run())
+        summary = report(args, results, timings)
+        if dispatcher is not None:
+            summary["llm_dispatcher"] = dispatcher.stats()
+            print(f"🚦 LLM dispatcher: {summary['llm_dispatcher']}")
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(summary, f, indent=2)
+    finally:
+        if server is not None:
+            server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
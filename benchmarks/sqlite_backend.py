@@ -0,0 +1,162 @@
+"""
+SQLite stand-in for SQL Server, filled with synthetic rows that match
+database_schema.json (same schemas, tables, columns and FK ranges).
+
+    python -m benchmarks.sqlite_backend --schema schema/database_schema.json --out /tmp/bench_db --rows 5000
+
+Each SQL Server schema becomes one SQLite file ATTACHed under its own name, so
+`epay.Payments` resolves unchanged. SqliteExecutor runs the regular
+MsSqlExecutor paging code and transpiles the T-SQL to SQLite right before
+execution.
+"""
+import argparse
+import datetime as dt
+import os
+import random
+import re
+import sqlite3
+import time
+import uuid
+from typing import Dict, List, Optional
+
+import sqlglot
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
+
+from tools.schema_loader import load_schema
+from tools.sql_executor import MsSqlExecutor
+
+# dates fall in the year before today so "last N days" filters hit rows
+_BASE_DATE = dt.datetime.combine(dt.date.today(), dt.time())
+
+
+def _sqlite_type(sql_type: str) -> str:
+    t = (sql_type or "").lower()
+    if re.match(r"(tinyint|smallint|bigint|int|bit)\b", t):
+        return "INTEGER"
+    if re.match(r"(decimal|numeric|money|smallmoney|float|real)\b", t):
+        return "REAL"
+    return "TEXT"
+
+
+def _value(col: str, sql_type: str, rnd: random.Random, fk_max: Optional[int]):
+    t = (sql_type or "").lower()
+    if fk_max:
+        return rnd.randint(1, fk_max)
+    if t.startswith("bit"):
+        return rnd.randint(0, 1)
+    if re.match(r"(tinyint|smallint|bigint|int)\b", t):
+        # status/type columns stay low-cardinality so GROUP BY and filters are realistic
+        return rnd.randint(0, 9) if re.search(r"(status|type|state|kind)$", col, re.I) else rnd.randint(0, 999)
+    if re.match(r"(decimal|numeric|money|smallmoney|float|real)\b", t):
+        return round(rnd.uniform(0, 1_000), 3)
+    if "date" in t or "time" in t:
+        return (_BASE_DATE - dt.timedelta(minutes=rnd.randint(0, 365 * 24 * 60))).isoformat(sep=" ")
+    if t.startswith("uniqueidentifier"):
+        return str(uuid.UUID(int=rnd.getrandbits(128)))
+    return f"{col} {rnd.randint(0, 49)}"
+
+
+def _tables(schema_json: Dict) -> List[Dict]:
+    return [t for t in schema_json.get("DatabaseSchema", []) if t.get("TableName")]
+
+
+def build_database(schema_json: Dict, directory: str, rows_per_table: int = 1000, seed: int = 7) -> Dict[str, str]:
+    """
+    Create one SQLite file per schema with `rows_per_table` deterministic rows per table.
+    `Id` (or the first *Id column) is the INTEGER PRIMARY KEY; FK columns point at existing ids.
+    Returns {schema_name: file_path}.
+    """
+    os.makedirs(directory, exist_ok=True)
+    rnd = random.Random(seed)
+    files: Dict[str, str] = {}
+    connections: Dict[str, sqlite3.Connection] = {}
+    try:
+        for table in _tables(schema_json):
+            schema = table.get("SchemaName") or "dbo"
+            if schema not in connections:
+                files[schema] = os.path.join(directory, f"{schema}.sqlite3")
+                if os.path.exists(files[schema]):
+                    os.remove(files[schema])
+                connections[schema] = sqlite3.connect(files[schema])
+            conn = connections[schema]
+
+            columns = table.get("Columns") or {}
+            names = list(columns)
+            pk = next((c for c in names if c.lower() == "id"),
+                      next((c for c in names if c.lower().endswith("id") and "int" in columns[c].lower()), None))
+            fk_cols = {fk["ParentColumn"] for fk in table.get("ForeignKeys") or [] if fk.get("ParentColumn")}
+
+            ddl = ", ".join(
+                f'"{c}" {"INTEGER PRIMARY KEY" if c == pk else _sqlite_type(columns[c])}' for c in names
+            )
+            conn.execute(f'CREATE TABLE "{table["TableName"]}" ({ddl})')
+            rows = [
+                tuple(i if c == pk else _value(c, columns[c], rnd, rows_per_table if c in fk_cols else None)
+                      for c in names)
+                for i in range(1, rows_per_table + 1)
+            ]
+            marks = ", ".join("?" for _ in names)
+            conn.executemany(f'INSERT INTO "{table["TableName"]}" VALUES ({marks})', rows)
+            conn.commit()
+    finally:
+        for conn in connections.values():
+            conn.close()
+    return files
+
+
+def make_engine(files: Dict[str, str], pool_size: int = 5, max_overflow: int = 10):
+    """SQLAlchemy engine on an in-memory main DB with every schema file attached read-only."""
+    engine = create_engine("sqlite://", poolclass=QueuePool, pool_size=pool_size, max_overflow=max_overflow,
+                           connect_args={"check_same_thread": False, "uri": True})
+
+    @event.listens_for(engine, "connect")
+    def _attach(dbapi_conn, _record):
+        for schema, path in files.items():
+            dbapi_conn.execute(f"ATTACH DATABASE 'file:{path}?mode=ro' AS \"{schema}\"")
+
+    return engine
+
+
+class SqliteExecutor(MsSqlExecutor):
+    """MsSqlExecutor over the SQLite stand-in: same paging/caching, T-SQL transpiled at fetch time."""
+
+    def __init__(self, files: Dict[str, str], pool_size: int = 5, max_overflow: int = 10, **kwargs):
+        self._started: Dict[int, float] = {}
+        engine = make_engine(files, pool_size, max_overflow)
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def _mark_start(conn, cursor, statement, parameters, context, executemany):
+            self._started[id(conn.connection.dbapi_connection)] = time.monotonic()
+
+        super().__init__("", pool_size=pool_size, max_overflow=max_overflow, engine=engine, **kwargs)
+
+    def _apply_timeout(self, dbapi_conn, _record):
+        # sqlite3 has no statement timeout: abort from the progress handler once the statement runs too long
+        key = id(dbapi_conn)
+        dbapi_conn.set_progress_handler(
+            lambda: int(time.monotonic() - self._started.get(key, time.monotonic()) > self.timeout), 10_000)
+
+    @staticmethod
+    def _timed_out(error: Exception) -> bool:
+        return "interrupted" in str(error)
+
+    def _iter_batches(self, sql: str, params: Optional[dict] = None, max_rows: Optional[int] = None,
+                      on_open=None):
+        sqlite_sql = sqlglot.transpile(sql, read="tsql", write="sqlite")[0]
+        return super()._iter_batches(sqlite_sql, params, max_rows, on_open)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--schema", default="schema/database_schema.json")
+    ap.add_argument("--out", required=True, help="directory for the per-schema SQLite files")
+    ap.add_argument("--rows", type=int, default=1000, help="rows per table")
+    args = ap.parse_args()
+    files = build_database(load_schema(args.schema), args.out, args.rows)
+    for schema, path in files.items():
+        print(f"🗄️ {schema:<10} {path}")
+
+
+if __name__ == "__main__":
+    main()
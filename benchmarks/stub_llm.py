@@ -0,0 +1,275 @@
+"""
+Local OpenAI-compatible stub for load tests (no API key, no network).
+
+    python -m benchmarks.stub_llm --port 8901 --latency-ms 300 --token-ms 15
+
+Serves POST /v1/chat/completions, streaming and non-streaming:
+  - SQL-generation prompts (system prompt asks for JSON) get a JSON answer with
+    a SELECT built from the first tables of the "Schema excerpt" message
+  - everything else gets a markdown answer of ~--markdown-tokens tokens
+Latency is log-normal around --latency-ms (time to first token); streamed
+answers add --token-ms per token. `usage` is filled in, including a simulated
+prompt-cache hit for repeated prefixes of 1024+ tokens. With --rpm-limit the
+stub sends x-ratelimit-* headers and answers 429 (with retry-after) above quota.
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+_TABLE_LINE = re.compile(r"^([\w\[\]]+(?:\.[\w\[\]]+)?):\s*(.+)$")
+_WORDS = ("records", "total", "students", "payments", "increase", "period", "average", "schools",
+          "trend", "filters", "grouped", "status", "range", "result", "shows", "recent")
+
+
+@dataclass
+class StubProfile:
+    latency_ms: float = 300.0      # median time to first token
+    latency_sigma: float = 0.25    # log-normal spread
+    token_ms: float = 10.0         # per streamed token
+    markdown_tokens: int = 120     # mean completion length for markdown answers
+    error_rate: float = 0.0        # share of requests answered with HTTP 500
+    seed: Optional[int] = None
+    rpm_limit: int = 0             # requests per rolling minute before 429s (0 = unlimited)
+
+
+def _estimate_tokens(text: str) -> int:
+    return math.ceil(len(text or "") / 4)
+
+
+def _schema_tables(messages: List[Dict]) -> List[Tuple[str, List[Tuple[str, str]]]]:
+    """Tables from the schema excerpt (compact lines or the JSON dump)."""
+    excerpt = next((m["content"] for m in messages
+                    if m.get("role") == "system" and "Schema excerpt:" in (m.get("content") or "")), "")
+    excerpt = excerpt.split("Schema excerpt:", 1)[-1].strip()
+    tables = []
+    for line in excerpt.splitlines():
+        m = _TABLE_LINE.match(line.strip())
+        if m and "->" not in line and not line.startswith(("Tables", "Foreign")):
+            cols = [tuple((c.strip().split(" ", 1) + [""])[:2]) for c in m.group(2).split(",")]
+            tables.append((m.group(1), cols))
+    if tables:
+        return tables
+    try:
+        data = json.loads(excerpt.split("\n\n", 1)[0])
+    except (ValueError, TypeError):
+        return []
+    for t in data if isinstance(data, list) else []:
+        name = t.get("table") or t.get("FullTableName") or f"{t.get('SchemaName')}.{t.get('TableName')}"
+        cols = t.get("Columns") or t.get("columns") or []
+        cols = list(cols.items()) if isinstance(cols, dict) else [(c, "") for c in cols if isinstance(c, str)]
+        tables.append((name, cols))
+    return tables
+
+
+def _sql_for(question: str, tables, rnd: random.Random) -> Optional[str]:
+    if not tables:
+        return None
+    name, cols = tables[min(len(tables) - 1, rnd.randrange(3))]
+    names = [c for c, _ in cols if c] or ["*"]
+    numeric = [c for c, typ in cols if re.match(r"(int|bigint|smallint|tinyint|decimal|money|float)", typ or "")]
+    text_cols = [c for c, typ in cols if re.match(r"(n?varchar|n?char|text)", typ or "")]
+    shape = rnd.randrange(4)
+    if shape == 0 or names == ["*"]:
+        return f"SELECT {', '.join(names[:6])} FROM {name}"
+    if shape == 1 and numeric:
+        return f"SELECT {', '.join(names[:5])} FROM {name} WHERE {numeric[-1]} > {rnd.randint(0, 50)}"
+    if shape == 2:
+        return f"SELECT COUNT(*) AS total FROM {name}"
+    group = (text_cols or names)[0]
+    return f"SELECT {group}, COUNT(*) AS n FROM {name} GROUP BY {group}"
+
+
+class _State:
+    def __init__(self, profile: StubProfile):
+        self.profile = profile
+        self.rnd = random.Random(profile.seed)
+        self.lock = threading.Lock()
+        self.seen_prefixes = set()
+        self.requests = 0
+        self.rate_limited = 0
+        self._window = deque()   # admission times within the last minute
+
+    def admit(self) -> Tuple[bool, Dict[str, str]]:
+        """Rolling-minute request quota; returns (allowed, rate-limit headers)."""
+        limit = self.profile.rpm_limit
+        if not limit:
+            return True, {}
+        now = time.monotonic()
+        with self.lock:
+            while self._window and now - self._window[0] >= 60:
+                self._window.popleft()
+            allowed = len(self._window) < limit
+            if allowed:
+                self._window.append(now)
+            else:
+                self.rate_limited += 1
+            reset = 60 - (now - self._window[0]) if self._window else 0.0
+            headers = {
+                "x-ratelimit-limit-requests": str(limit),
+                "x-ratelimit-remaining-requests": str(limit - len(self._window)),
+                "x-ratelimit-reset-requests": f"{reset:.3f}s",
+            }
+        if not allowed:
+            headers["retry-after-ms"] = str(int(reset * 1000) + 1)
+        return allowed, headers
+
+    def draw(self, fn):
+        with self.lock:
+            return fn(self.rnd)
+
+
+def _answer(state: _State, body: Dict) -> Tuple[str, Dict]:
+    messages = body.get("messages") or []
+    system = " ".join(m.get("content") or "" for m in messages if m.get("role") == "system")
+    question = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+    prompt_tokens = sum(_estimate_tokens(m.get("content") or "") for m in messages)
+
+    # simulated provider prompt cache: first system message reused verbatim
+    prefix = messages[0].get("content", "") if messages else ""
+    prefix_tokens = _estimate_tokens(prefix)
+    key = hashlib.sha1(prefix.encode("utf-8")).hexdigest()
+    with state.lock:
+        hit = key in state.seen_prefixes
+        state.seen_prefixes.add(key)
+    cached = (prefix_tokens // 128) * 128 if hit and prefix_tokens >= 1024 else 0
+
+    if "JSON" in system:
+        sql = state.draw(lambda r: _sql_for(question, _schema_tables(messages), r))
+        content = json.dumps({
+            "sql": sql, "confidence": 0.9 if sql else 0.0, "needs_clarification": sql is None,
+            "notes": "stub" if sql else "No table in the schema excerpt.", "message": "",
+        })
+    else:
+        n = max(5, int(state.draw(lambda r: r.gauss(state.profile.markdown_tokens, state.profile.markdown_tokens * 0.2))))
+        words = state.draw(lambda r: [r.choice(_WORDS) for _ in range(n)])
+        content = "**Summary**\n\n" + " ".join(words) + "\n"
+
+    usage = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": _estimate_tokens(content),
+        "total_tokens": prompt_tokens + _estimate_tokens(content),
+        "prompt_tokens_details": {"cached_tokens": cached},
+    }
+    return content, usage
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: _State = None  # set per server class
+
+    def log_message(self, *args):  # keep benchmark output clean
+        pass
+
+    def _send_json(self, status: int, payload: Dict, headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            return self._send_json(200, {"object": "list", "data": [{"id": "stub", "object": "model"}]})
+        self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._send_json(404, {"error": {"message": "not found"}})
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        profile = self.state.profile
+        with self.state.lock:
+            self.state.requests += 1
+        allowed, rate_headers = self.state.admit()
+        if not allowed:
+            return self._send_json(429, {"error": {"message": "stub: rate limit reached", "type": "requests",
+                                                   "code": "rate_limit_exceeded"}}, rate_headers)
+        ttft = self.state.draw(lambda r: r.lognormvariate(math.log(max(profile.latency_ms, 0.01)), profile.latency_sigma))
+        time.sleep(ttft / 1000.0)
+        if profile.error_rate and self.state.draw(lambda r: r.random()) < profile.error_rate:
+            return self._send_json(500, {"error": {"message": "stub: injected failure", "type": "server_error"}},
+                                   rate_headers)
+
+        content, usage = _answer(self.state, body)
+        rid, created, model = f"chatcmpl-{uuid.uuid4().hex[:12]}", int(time.time()), body.get("model", "stub")
+        if not body.get("stream"):
+            return self._send_json(200, {
+                "id": rid, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage,
+            }, rate_headers)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        for name, value in rate_headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        def emit(payload):
+            data = f"data: {payload}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        def chunk(delta, finish=None):
+            return json.dumps({"id": rid, "object": "chat.completion.chunk", "created": created, "model": model,
+                               "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]})
+
+        emit(chunk({"role": "assistant", "content": ""}))
+        for piece in re.findall(r"\S+\s*", content):
+            emit(chunk({"content": piece}))
+            if profile.token_ms:
+                time.sleep(profile.token_ms / 1000.0)
+        emit(chunk({}, "stop"))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            emit(json.dumps({"id": rid, "object": "chat.completion.chunk", "created": created, "model": model,
+                             "choices": [], "usage": usage}))
+        emit("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def serve(profile: Optional[StubProfile] = None, host: str = "127.0.0.1", port: int = 0):
+    """Start the stub in a daemon thread. Returns (server, base_url); stop with server.shutdown()."""
+    handler = type("StubHandler", (_Handler,), {"state": _State(profile or StubProfile())})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-llm", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8901)
+    ap.add_argument("--latency-ms", type=float, default=300.0)
+    ap.add_argument("--latency-sigma", type=float, default=0.25)
+    ap.add_argument("--token-ms", type=float, default=10.0)
+    ap.add_argument("--markdown-tokens", type=int, default=120)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--rpm-limit", type=int, default=0)
+    args = ap.parse_args()
+    profile = StubProfile(args.latency_ms, args.latency_sigma, args.token_ms, args.markdown_tokens, args.error_rate,
+                          rpm_limit=args.rpm_limit)
+    server, url = serve(profile, args.host, args.port)
+    print(f"🧪 Stub LLM listening on {url} (set llm.base_url to this, any api key)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional
+
+from sqlalchemy import delete, insert, select
+
+from db.models import ChatMessage
+
+logger = logging.getLogger("ai-sql-agent")
+
+_STOP = object()
+
+
+class HistoryStore:
+    """
+    Write-behind chat history.
+
+    - recent messages per session live in an in-memory ring buffer (LRU over sessions)
+    - append() only touches memory and a queue; a background thread writes
+      queued messages in batches, one transaction per batch
+    - the writer trims each touched session to max_messages_per_session rows
+    """
+
+    def __init__(self, engine, max_messages_per_session: int = 30, max_sessions: int = 10000,
+                 batch_size: int = 256, flush_interval_ms: float = 50.0):
+        self.engine = engine
+        self.max_messages = max(1, int(max_messages_per_session))
+        self.max_sessions = max(1, int(max_sessions))
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = max(0.0, flush_interval_ms) / 1000.0
+
+        self._rings: "OrderedDict[str, Deque[dict]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._writer = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._closed = False
+        self.batches = 0
+        self.written = 0
+        self.trimmed = 0
+        self._writer.start()
+
+    @classmethod
+    def from_config(cls, cfg, engine) -> "HistoryStore":
+        ch = cfg.chat_history
+        return cls(
+            engine,
+            max_messages_per_session=ch.get("max_messages_per_session", 30),
+            max_sessions=ch.get("ring_max_sessions", 10000),
+            batch_size=ch.get("write_batch_size", 256),
+            flush_interval_ms=ch.get("flush_interval_ms", 50),
+        )
+
+    # ------------------------------------------------------------------ #
+    def _load(self, session_id: str) -> Deque[dict]:
+        """Ring for a session, read from SQLite on first use (caller holds no lock)."""
+        with self._lock:
+            ring = self._rings.get(session_id)
+            if ring is not None:
+                self._rings.move_to_end(session_id)
+                return ring
+        # the session may still have queued writes from before it was evicted
+        self.flush()
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(ChatMessage.role, ChatMessage.content)
+                .where(ChatMessage.session_id == session_id)
+                .order_by(ChatMessage.id.desc())
+                .limit(self.max_messages)
+            ).all()
+        loaded = deque(({"role": r.role, "content": r.content} for r in reversed(rows)), maxlen=self.max_messages)
+        with self._lock:
+            ring = self._rings.setdefault(session_id, loaded)
+            self._rings.move_to_end(session_id)
+            while len(self._rings) > self.max_sessions:
+                self._rings.popitem(last=False)
+            return ring
+
+    def is_cached(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._rings
+
+    def append(self, session_id: str, role: str, content: str,
+               provider: Optional[str] = None, model: Optional[str] = None) -> None:
+        if self._closed:
+            raise RuntimeError("HistoryStore is closed")
+        ring = self._load(session_id)
+        with self._lock:
+            ring.append({"role": role, "content": content})
+        self._queue.put({
+            "session_id": session_id, "role": role, "content": content,
+            "provider": provider, "model": model, "created_at": datetime.now(timezone.utc),
+        })
+
+    def recent(self, session_id: str, limit: Optional[int] = None) -> List[Dict]:
+        ring = self._load(session_id)
+        with self._lock:
+            items = list(ring)
+        return [dict(m) for m in (items[-limit:] if limit else items)]
+
+    # async wrappers: only a cold session touches SQLite, so only then use a thread
+    async def aappend(self, session_id: str, role: str, content: str,
+                      provider: Optional[str] = None, model: Optional[str] = None) -> None:
+        if self.is_cached(session_id):
+            self.append(session_id, role, content, provider, model)
+        else:
+            await asyncio.to_thread(self.append, session_id, role, content, provider, model)
+
+    async def arecent(self, session_id: str, limit: Optional[int] = None) -> List[Dict]:
+        if self.is_cached(session_id):
+            return self.recent(session_id, limit)
+        return await asyncio.to_thread(self.recent, session_id, limit)
+
+    # ------------------------------------------------------------------ #
+    def _collect(self) -> List:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and batch[-1] is not _STOP:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, rows: List[dict]) -> None:
+        sessions = {r["session_id"] for r in rows}
+        with self.engine.begin() as conn:
+            conn.execute(insert(ChatMessage), rows)
+            for sid in sessions:
+                keep = (select(ChatMessage.id)
+                        .where(ChatMessage.session_id == sid)
+                        .order_by(ChatMessage.id.desc())
+                        .limit(self.max_messages))
+                res = conn.execute(delete(ChatMessage)
+                                   .where(ChatMessage.session_id == sid, ChatMessage.id.not_in(keep)))
+                self.trimmed += res.rowcount or 0
+        self.batches += 1
+        self.written += len(rows)
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            rows = [item for item in batch if isinstance(item, dict)]
+            if rows:
+                try:
+                    self._write(rows)
+                except Exception as e:
+                    logger.error("❌ History write failed (%s messages dropped): %s", len(rows), e)
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+            if any(item is _STOP for item in batch):
+                return
+
+    def flush(self, timeout: Optional[float] = 10.0) -> bool:
+        """Block until everything queued so far is written."""
+        if not self._writer.is_alive():
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: Optional[float] = 10.0) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._writer.join(timeout)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            sessions = len(self._rings)
+        return {"sessions_cached": sessions, "queued": self._queue.qsize(), "batches": self.batches,
+                "written": self.written, "trimmed": self.trimmed}
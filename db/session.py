@@ -1,13 +1,30 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from helpers.config import load_config
+from sqlalchemy import create_engine, event
+from functools import lru_cache
+from helpers.config import get_config
 from db.models import Base
 
+# WAL lets readers run while the history writer commits; NORMAL sync is safe under WAL
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",      # ~16 MB page cache per connection
+    "PRAGMA mmap_size=134217728",    # 128 MB
+)
+
+def _apply_pragmas(dbapi_conn, _record):
+    cur = dbapi_conn.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cur.execute(pragma)
+    cur.close()
+
+# Created on first use (not at import) and shared afterwards.
+@lru_cache(maxsize=None)
 def get_sqlite_engine():
-    cfg = load_config()
+    cfg = get_config()
     sqlite_path = cfg.chat_history["sqlite_path"]
     engine = create_engine(f"sqlite:///{sqlite_path}", future=True)
+    event.listen(engine, "connect", _apply_pragmas)
     Base.metadata.create_all(engine)
     return engine
-
-SessionLocal = sessionmaker(bind=get_sqlite_engine(), autoflush=False, autocommit=False, future=True)
@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterator, Optional, Tuple
+
+
+class TTLCache:
+    """
+    Small thread-safe LRU cache with an optional per-entry TTL and byte budget.
+    Used by the SQL-generation cache, result cache and query registry.
+    `on_drop(key, value)` runs (under the cache lock) whenever an entry is evicted,
+    expires, is replaced or popped; clear() does not call it.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        sizeof: Optional[Callable[[Any], int]] = None,
+        on_drop: Optional[Callable[[Hashable, Any], None]] = None,
+    ):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda _: 0)
+        self.on_drop = on_drop
+        self._data: "OrderedDict[Hashable, Tuple[float, Any, int]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _expired(expires_at: float, now: float) -> bool:
+        return bool(expires_at) and expires_at <= now
+
+    def _drop(self, key: Hashable) -> Any:
+        _, value, size = self._data.pop(key)
+        self.bytes -= size
+        if self.on_drop is not None:
+            self.on_drop(key, value)
+        return value
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires_at, value, _ = item
+            if self._expired(expires_at, time.monotonic()):
+                self._drop(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None) -> bool:
+        """Insert/replace an entry. Returns False if the value alone exceeds the byte budget."""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        expires_at = time.monotonic() + ttl if ttl else 0.0
+        size = int(self.sizeof(value))
+        if self.max_bytes is not None and size > self.max_bytes:
+            return False
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (expires_at, value, size)
+            self.bytes += size
+            while len(self._data) > self.max_entries or (
+                self.max_bytes is not None and self.bytes > self.max_bytes
+            ):
+                self._drop(next(iter(self._data)))
+                self.evictions += 1
+        return True
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            return self._drop(key) if key in self._data else default
+
+    def remove_where(self, predicate: Callable[[Hashable, Any], bool]) -> int:
+        """Drop every entry for which predicate(key, value) is true; returns the count."""
+        with self._lock:
+            doomed = [k for k, (_, v, _) in self._data.items() if predicate(k, v)]
+            for key in doomed:
+                self._drop(key)
+        return len(doomed)
+
+    def items(self) -> Iterator[Tuple[Hashable, Any]]:
+        """Snapshot of live (non-expired) entries, oldest first. Does not touch LRU order."""
+        now = time.monotonic()
+        with self._lock:
+            for key in [k for k, (exp, _, _) in self._data.items() if self._expired(exp, now)]:
+                self._drop(key)
+            snapshot = [(k, v) for k, (_, v, _) in self._data.items()]
+        return iter(snapshot)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        out = {
+            "entries": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+        if self.max_bytes is not None:
+            out.update({"bytes": self.bytes, "max_bytes": self.max_bytes})
+        return out
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from helpers.errors import ComponentUnavailable
+
+logger = logging.getLogger("ai-sql-agent")
+
+PENDING, LOADING, READY, DISABLED, FAILED = "pending", "loading", "ready", "disabled", "failed"
+
+
+class _Slot:
+    def __init__(self, factory: Callable[[], Any], required: bool):
+        self.factory = factory
+        self.required = required
+        self.lock = threading.Lock()
+        self.state = PENDING
+        self.value: Any = None
+        self.error: Optional[str] = None
+        self.seconds: Optional[float] = None
+        self.failed_at = 0.0
+
+
+class ComponentRegistry:
+    """
+    Lazily-built process singletons (LLM client, retriever, executor, ...).
+
+    - get(name) builds the component on first use; concurrent callers wait on
+      the same build instead of racing
+    - a factory returning None means "disabled by config" (still ready)
+    - a failing optional component resolves to None; a failing required one
+      raises ComponentUnavailable; either is rebuilt after retry_after_seconds
+    - warm_up() builds everything concurrently in worker threads; factories
+      that need another component just call get() on it
+    """
+
+    def __init__(self, retry_after_seconds: float = 30.0):
+        self._slots: Dict[str, _Slot] = {}
+        self.retry_after = retry_after_seconds
+
+    def register(self, name: str, factory: Callable[[], Any], required: bool = True) -> None:
+        self._slots[name] = _Slot(factory, required)
+
+    def override(self, name: str, value: Any) -> None:
+        """Replace a component with a ready-made value (tests, harnesses)."""
+        slot = self._slots.setdefault(name, _Slot(lambda: value, required=False))
+        with slot.lock:
+            slot.value, slot.state, slot.error = value, (DISABLED if value is None else READY), None
+
+    def is_built(self, name: str) -> bool:
+        return self._slots[name].state in (READY, DISABLED)
+
+    def get(self, name: str) -> Any:
+        slot = self._slots[name]
+        if slot.state in (READY, DISABLED):
+            return slot.value
+        with slot.lock:
+            retry = slot.state == FAILED and time.monotonic() - slot.failed_at >= self.retry_after
+            if slot.state == PENDING or retry:
+                slot.state = LOADING
+                started = time.perf_counter()
+                try:
+                    slot.value = slot.factory()
+                    slot.state = DISABLED if slot.value is None else READY
+                    slot.error = None
+                except Exception as e:
+                    slot.value = None
+                    slot.state = FAILED
+                    slot.failed_at = time.monotonic()
+                    slot.error = f"{type(e).__name__}: {e}"
+                    logger.error("❌ Component '%s' failed to start: %s", name, slot.error)
+                finally:
+                    slot.seconds = round(time.perf_counter() - started, 3)
+            if slot.state == FAILED and slot.required:
+                raise ComponentUnavailable(f"{name} is unavailable ({slot.error})")
+            return slot.value
+
+    def peek(self, name: str) -> Any:
+        """The component if it is already built, else None (never triggers a build)."""
+        slot = self._slots.get(name)
+        return slot.value if slot is not None and slot.state == READY else None
+
+    async def aget(self, name: str) -> Any:
+        """get() for async callers; a cold build runs in a thread, not on the event loop."""
+        if self.is_built(name):
+            return self._slots[name].value
+        return await asyncio.to_thread(self.get, name)
+
+    async def warm_up(self, names: Optional[Iterable[str]] = None) -> Dict[str, Dict]:
+        names = list(names or self._slots)
+        started = time.perf_counter()
+        await asyncio.gather(*(self.aget(n) for n in names), return_exceptions=True)
+        logger.info("🔥 Warm-up finished in %.2fs", time.perf_counter() - started)
+        return self.status()
+
+    def status(self) -> Dict[str, Dict]:
+        return {
+            name: {"state": s.state, "required": s.required, "seconds": s.seconds, "error": s.error}
+            for name, s in self._slots.items()
+        }
+
+    def ready(self) -> bool:
+        """True when every required component is built (optional ones may have failed)."""
+        return all(s.state in (READY, DISABLED) or (not s.required and s.state == FAILED)
+                   for s in self._slots.values())
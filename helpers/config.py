@@ -1,5 +1,6 @@
 import os
 import yaml
+from functools import lru_cache
 from pathlib import Path
 from pydantic import BaseModel
 from dotenv import load_dotenv
@@ -15,9 +16,20 @@ class Config(BaseModel):
     ui: dict
     retriever: dict  
     mock_flow: dict  
+    cache: dict = {}
+    prompt: dict = {}
+    observability: dict = {}
+    answers: dict = {}
+    cost_guard: dict = {}
+    batch: dict = {}
 
 def load_config(path: str = "config/config.yaml") -> Config:
     load_dotenv()
     with open(path, "r", encoding="utf-8") as f:
         data = yaml.safe_load(f)
     return Config(**data)
+
+@lru_cache(maxsize=None)
+def get_config(path: str = "config/config.yaml") -> Config:
+    """Process-wide config snapshot: the YAML is parsed once, then shared."""
+    return load_config(path)
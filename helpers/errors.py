@@ -12,3 +12,9 @@ class PaginationError(Exception):
 
 class ClarificationNeeded(Exception):
     pass
+
+class ComponentUnavailable(Exception):
+    pass
+
+class QueryTooExpensive(Exception):
+    pass
@@ -1,3 +1,4 @@
+import orjson
 import pandas as pd
 
 def to_markdown(df: pd.DataFrame, max_rows: int = 50) -> str:
@@ -7,3 +8,17 @@ def to_markdown(df: pd.DataFrame, max_rows: int = 50) -> str:
     else:
         footer = ""
     return df.to_markdown(index=False) + footer
+
+def df_to_records(df: pd.DataFrame, max_rows: int = None) -> list:
+    """JSON-safe list of row dicts (dates as ISO strings, Decimals/UUIDs as str)."""
+    if max_rows is not None:
+        df = df.head(max_rows)
+    return orjson.loads(df.to_json(orient="records", date_format="iso", default_handler=str))
+
+def format_sse(event: str, data) -> bytes:
+    """Encode one Server-Sent-Events frame."""
+    return b"event: " + event.encode("utf-8") + b"\ndata: " + orjson.dumps(data, default=str) + b"\n\n"
+
+def format_ndjson(data) -> bytes:
+    """Encode one newline-delimited JSON line."""
+    return orjson.dumps(data, default=str) + b"\n"
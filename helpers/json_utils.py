@@ -1,9 +1,12 @@
 import json
+import logging
 import ast
 import re
 import textwrap
 import sqlparse
 
+logger = logging.getLogger("ai-sql-agent")
+
 
 class JsonSqlHelper:
     @staticmethod
@@ -18,13 +21,13 @@ class JsonSqlHelper:
                 try:
                     return json.loads(json_part)
                 except Exception as e:
-                    print("⚠️ Still failed parsing extracted JSON:", e)
+                    logger.warning("⚠️ Still failed parsing extracted JSON: %s", e)
 
             # Fallback: Python dict-style parse
             try:
                 return ast.literal_eval(content)
             except Exception as e2:
-                print("❌ Failed to parse content:", e2)
+                logger.warning("❌ Failed to parse content: %s", e2)
                 return {}
     
     
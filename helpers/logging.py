@@ -1,10 +1,34 @@
-import logging, sys
+import atexit, copy, logging, queue, sys
+from logging.handlers import QueueHandler, QueueListener
 from rich.logging import RichHandler
 
-def setup_logging(level="INFO"):
+FORMAT = "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
+
+class _InProcessQueueHandler(QueueHandler):
+    """
+    QueueHandler.prepare flattens exc_info into the message text (for pickling
+    queues); the listener here is a thread, so keep it and let RichHandler
+    render the traceback. Only the %-args are merged, before they can change.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        return record
+
+def setup_logging(level="INFO", queued=True):
+    console = RichHandler(rich_tracebacks=True, markup=True)
+    console.setFormatter(logging.Formatter(FORMAT))
+    handler = console
+    if queued:
+        # request handlers only enqueue records; a listener thread does the console writes
+        records = queue.SimpleQueue()
+        listener = QueueListener(records, console, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+        handler = _InProcessQueueHandler(records)
     logging.basicConfig(
         level=getattr(logging, level.upper(), logging.INFO),
-        format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
-        handlers=[RichHandler(rich_tracebacks=True, markup=True)],
+        handlers=[handler],
     )
     return logging.getLogger("ai-sql-agent")
@@ -0,0 +1,182 @@
+import contextvars
+import functools
+import inspect
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+try:
+    from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, GCCollector, Histogram,
+                                   ProcessCollector, generate_latest)
+except ImportError:  # metrics become no-ops; /metrics reports them as unavailable
+    CollectorRegistry = None
+
+logger = logging.getLogger("ai-sql-agent")
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# tags every span opened while a request is being served
+_session_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("session_id", default=None)
+
+
+class Telemetry:
+    """
+    Prometheus metrics plus optional OpenTelemetry spans for the agent.
+
+    - node(name, fn): wraps a LangGraph node with a timer and a span
+    - stage(name): times a sub-step (retrieval, history load, LLM call, fetch)
+    - record_*: tokens, rows/bytes fetched, cache hits, request outcomes
+    Spans carry session_id, provider and model. Without prometheus_client /
+    opentelemetry-api installed the corresponding half is a no-op.
+    """
+
+    def __init__(self):
+        self.provider: Optional[str] = None
+        self.model: Optional[str] = None
+        self._tracer = None
+        self.registry = CollectorRegistry() if CollectorRegistry is not None else None
+        if self.registry is None:
+            return
+        r = self.registry
+        ProcessCollector(registry=r)
+        GCCollector(registry=r)
+        self.requests = Counter("sql_agent_requests_total", "Chat requests by endpoint and outcome",
+                                ["endpoint", "outcome"], registry=r)
+        self.request_seconds = Histogram("sql_agent_request_seconds", "End-to-end chat request latency",
+                                         ["endpoint"], buckets=LATENCY_BUCKETS, registry=r)
+        self.node_seconds = Histogram("sql_agent_node_seconds", "LangGraph node latency",
+                                      ["node", "outcome"], buckets=LATENCY_BUCKETS, registry=r)
+        self.stage_seconds = Histogram("sql_agent_stage_seconds", "Latency of steps inside the nodes",
+                                       ["stage"], buckets=LATENCY_BUCKETS, registry=r)
+        self.llm_tokens = Counter("sql_agent_llm_tokens_total", "LLM tokens reported in usage blocks",
+                                  ["provider", "kind"], registry=r)
+        self.rows_fetched = Counter("sql_agent_rows_fetched_total", "Rows read from the database", registry=r)
+        self.bytes_fetched = Counter("sql_agent_bytes_fetched_total", "Arrow bytes read from the database",
+                                     registry=r)
+        self.answers = Counter("sql_agent_answers_total", "Answers by source (template fast path or LLM)",
+                               ["source"], registry=r)
+        self.cache_lookups = Counter("sql_agent_cache_lookups_total", "Cache lookups by cache and result",
+                                     ["cache", "result"], registry=r)
+        self.llm_throttle = Counter("sql_agent_llm_throttle_total",
+                                    "LLM calls delayed by the rate-limit budget or retried after 429/5xx",
+                                    ["provider", "reason"], registry=r)
+
+    def configure(self, cfg) -> None:
+        obs = getattr(cfg, "observability", None) or {}
+        self.provider, self.model = cfg.llm.get("provider"), cfg.llm.get("model")
+        if obs.get("otel_enabled", False):
+            try:
+                from opentelemetry import trace
+            except ImportError:
+                logger.warning("⚠️ observability.otel_enabled is set but opentelemetry-api is not installed")
+            else:
+                # exporters/SDK are configured by the host (e.g. opentelemetry-instrument)
+                self._tracer = trace.get_tracer("ai-sql-agent")
+
+    @property
+    def metrics_available(self) -> bool:
+        return self.registry is not None
+
+    # ------------------------------------------------------------------ #
+    @contextmanager
+    def span(self, name: str, **attributes):
+        if self._tracer is None:
+            yield None
+            return
+        attrs = {"session.id": _session_id.get(), "llm.provider": self.provider, "llm.model": self.model}
+        attrs.update(attributes)
+        with self._tracer.start_as_current_span(name, attributes={k: v for k, v in attrs.items() if v is not None}) as s:
+            yield s
+
+    @contextmanager
+    def request(self, endpoint: str, session_id: str):
+        """Root span + latency for one chat request; the caller sets `outcome` on the yielded dict."""
+        token = _session_id.set(session_id)
+        result = {"outcome": "ok"}
+        started = time.perf_counter()
+        try:
+            with self.span(f"chat {endpoint}", endpoint=endpoint):
+                yield result
+        except BaseException:
+            result["outcome"] = "exception"
+            raise
+        finally:
+            _session_id.reset(token)
+            if self.registry is not None:
+                self.requests.labels(endpoint, result["outcome"]).inc()
+                self.request_seconds.labels(endpoint).observe(time.perf_counter() - started)
+
+    @contextmanager
+    def stage(self, name: str, **attributes):
+        started = time.perf_counter()
+        try:
+            with self.span(name, **attributes) as s:
+                yield s
+        finally:
+            if self.registry is not None:
+                self.stage_seconds.labels(name).observe(time.perf_counter() - started)
+
+    def node(self, name: str, fn):
+        """Wrap a LangGraph node (sync or async) with a span and a latency histogram."""
+        def observe(started: float, outcome: str) -> None:
+            if self.registry is not None:
+                self.node_seconds.labels(name, outcome).observe(time.perf_counter() - started)
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(state):
+                started, outcome = time.perf_counter(), "error"
+                try:
+                    with self.span(f"node {name}"):
+                        result = await fn(state)
+                    outcome = "ok"
+                    return result
+                finally:
+                    observe(started, outcome)
+        else:
+            @functools.wraps(fn)
+            def wrapper(state):
+                started, outcome = time.perf_counter(), "error"
+                try:
+                    with self.span(f"node {name}"):
+                        result = fn(state)
+                    outcome = "ok"
+                    return result
+                finally:
+                    observe(started, outcome)
+        return wrapper
+
+    # ------------------------------------------------------------------ #
+    def record_tokens(self, provider: str, prompt: int, completion: int, cached: int) -> None:
+        if self.registry is None:
+            return
+        for kind, n in (("prompt", prompt), ("completion", completion), ("cached", cached)):
+            if n:
+                self.llm_tokens.labels(provider, kind).inc(n)
+
+    def record_fetch(self, fetch_stats: Optional[Dict]) -> None:
+        """Rows/bytes from df.attrs["fetch_stats"]; frames served from the result cache read nothing."""
+        if self.registry is None or not fetch_stats or fetch_stats.get("cached"):
+            return
+        self.rows_fetched.inc(fetch_stats.get("rows", 0))
+        self.bytes_fetched.inc(fetch_stats.get("bytes", 0))
+
+    def record_cache(self, cache: str, hit: bool) -> None:
+        if self.registry is not None:
+            self.cache_lookups.labels(cache, "hit" if hit else "miss").inc()
+
+    def record_throttle(self, provider: str, reason: str) -> None:
+        if self.registry is not None:
+            self.llm_throttle.labels(provider, reason).inc()
+
+    def record_answer(self, source: str) -> None:
+        if self.registry is not None:
+            self.answers.labels(source).inc()
+
+    def render(self) -> Tuple[bytes, str]:
+        return generate_latest(self.registry), CONTENT_TYPE_LATEST
+
+
+# process-wide, like prompt_cache_usage: services record here without holding a reference
+telemetry = Telemetry()
@@ -0,0 +1,6 @@
+import math
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English/SQL identifiers)."""
+    return math.ceil(len(text or "") / 4)
@@ -1,15 +1,22 @@
+import asyncio
 import orjson
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from agents.sql_agent import run_agent
+from contextlib import asynccontextmanager
+from agents.sql_agent import (run_agent, stream_agent, run_batch, fetch_page, summarize_query, export_query,
+                              chart_query, chart_png, resync_retriever,
+                              components, prompt_stats, single_flight, chart_renderer)
 from helpers.logging import setup_logging
-from helpers.config import load_config
-from db.session import SessionLocal
-from db.models import ChatMessage
-from typing import List
+from helpers.config import get_config
+from helpers.formatting import format_sse, format_ndjson
+from helpers.errors import PaginationError, ExecutionError, ComponentUnavailable, QueryTooExpensive
+from tools.exporter import EXPORT_FORMATS
+from helpers.telemetry import telemetry
+from typing import Any, Dict, List, Optional
 
-logger = setup_logging()
-cfg = load_config()
+cfg = get_config()
+logger = setup_logging(cfg.observability.get("log_level", "INFO"))
 
 class ChatIn(BaseModel):
     session_id: str
@@ -22,29 +29,229 @@ class ChatOut(BaseModel):
     needs_clarification: bool | None = None
     message: str | None = None
     error: str | None = None
+    query_id: str | None = None
+    has_more: bool | None = None
+    answer_source: str | None = None   # "template" → POST /api/query/{query_id}/summary for the LLM write-up
+    chart: Dict[str, Any] | None = None  # JSON chart spec of the returned rows (ui.enable_charts)
+    limit_reason: str | None = None      # set when the cost guard capped the rows
 
-app = FastAPI(title="AI SQL Agent", version="1.0.0")
+class PageOut(BaseModel):
+    ok: bool
+    query_id: str
+    mode: str
+    columns: List[str]
+    rows: List[Dict[str, Any]]
+    next_cursor: str | None = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # accept connections right away; /ready turns 200 once required components are built
+    warm_up = asyncio.create_task(components.warm_up()) if cfg.app.get("warm_up_on_start", True) else None
+    yield
+    if warm_up is not None and not warm_up.done():
+        warm_up.cancel()
+    # write-behind history: commit whatever is still queued before exit
+    history_store = components.peek("history")
+    if history_store is not None:
+        history_store.close()
+
+app = FastAPI(title="AI SQL Agent", version="1.0.0", lifespan=lifespan)
 
 @app.post("/api/chat", response_model=ChatOut)
-def chat(body: ChatIn):
-    return run_agent(body.session_id, body.message)
+async def chat(body: ChatIn):
+    return await run_agent(body.session_id, body.message)
+
+@app.post("/api/chat/stream")
+async def chat_stream(body: ChatIn):
+    """Server-Sent Events: status, sql, preview, chart (if chartable), token..., then done (or error)."""
+    async def events():
+        async for event, data in stream_agent(body.session_id, body.message):
+            yield format_sse(event, data)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+class BatchIn(BaseModel):
+    session_id: str
+    questions: List[str]
+    concurrency: int | None = None   # capped at batch.concurrency
+
+@app.post("/api/chat/batch")
+async def chat_batch(body: BatchIn):
+    """
+    NDJSON: one /api/chat response per line (plus "index" and "question") as each
+    question finishes, then a final {"done": true, ...} line. A failed question
+    is reported on its own line and does not stop the batch.
+    """
+    max_questions = cfg.batch.get("max_questions", 200)
+    if not body.questions or len(body.questions) > max_questions:
+        raise HTTPException(status_code=400, detail=f"Send between 1 and {max_questions} questions.")
+    limit = cfg.batch.get("concurrency", 4)
+    concurrency = min(body.concurrency or limit, limit)
+
+    async def lines():
+        failed = 0
+        async for item in run_batch(body.session_id, body.questions, concurrency):
+            failed += not item.get("ok")
+            yield format_ndjson(item)
+        yield format_ndjson({"done": True, "total": len(body.questions), "failed": failed})
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/api/query/{query_id}/page", response_model=PageOut)
+async def query_page(query_id: str, cursor: Optional[str] = None, page_size: Optional[int] = None):
+    """Fetch further rows of a chat result; pass back `next_cursor` until it is null."""
+    try:
+        page = await fetch_page(query_id, cursor, page_size)
+    except PaginationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except QueryTooExpensive as e:
+        raise HTTPException(status_code=422, detail=f"Query rejected by cost guard: {e}")
+    if page is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired query id.")
+    return page
+
+@app.get("/api/query/{query_id}/export")
+async def query_export(query_id: str, request: Request, format: str = "csv", max_rows: Optional[int] = None,
+                       compress: bool = True):
+    """
+    Full result as a download: csv, parquet or arrow (IPC stream), streamed from the
+    cursor with constant memory and capped at limits.export_row_cap rows. csv/arrow are
+    gzip-encoded when the client accepts it (parquet is already compressed).
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    gzip = compress and format != "parquet" and "gzip" in request.headers.get("accept-encoding", "")
+    try:
+        export = await export_query(query_id, format, max_rows, gzip=gzip)
+    except QueryTooExpensive as e:
+        raise HTTPException(status_code=422, detail=f"Query rejected by cost guard: {e}")
+    except ExecutionError as e:
+        raise HTTPException(status_code=502, detail=f"Execution error: {e}")
+    if export is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired query id.")
+    stream, limit_reason = export
+
+    media_type, extension = EXPORT_FORMATS[format]
+    headers = {"Content-Disposition": f'attachment; filename="query-{query_id}.{extension}"',
+               "Vary": "Accept-Encoding"}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    if limit_reason:
+        headers["X-Row-Limit-Reason"] = limit_reason
+    return StreamingResponse(stream, media_type=media_type, headers=headers)
+
+@app.get("/api/query/{query_id}/chart")
+async def query_chart(query_id: str, format: str = "json", max_points: Optional[int] = None):
+    """
+    Chart of the full result (not only the first page): a JSON spec downsampled to
+    max_points, or ?format=png for a rendered image (cached by data hash).
+    """
+    if not cfg.ui.get("enable_charts", False):
+        raise HTTPException(status_code=404, detail="Charts are disabled (ui.enable_charts).")
+    if format not in ("json", "png"):
+        raise HTTPException(status_code=400, detail="format must be json or png")
+    if format == "png" and not cfg.ui.get("charts", {}).get("png_enabled", True):
+        raise HTTPException(status_code=400, detail="PNG charts are disabled (ui.charts.png_enabled).")
+    try:
+        result = await chart_query(query_id, max_points)
+    except QueryTooExpensive as e:
+        raise HTTPException(status_code=422, detail=f"Query rejected by cost guard: {e}")
+    except ExecutionError as e:
+        raise HTTPException(status_code=502, detail=f"Execution error: {e}")
+    if result is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired query id.")
+    if format == "json":
+        return result
+    if result["chart"] is None:
+        raise HTTPException(status_code=422, detail="This result has no chartable columns.")
+    try:
+        image = await chart_png(result["chart"])
+    except ComponentUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return Response(image, media_type="image/png", headers={"Cache-Control": "private, max-age=300"})
+
+class SummaryOut(BaseModel):
+    ok: bool
+    query_id: str
+    markdown: str
+
+@app.post("/api/query/{query_id}/summary", response_model=SummaryOut)
+async def query_summary(query_id: str):
+    """LLM summary on demand, for answers that came from the template fast path."""
+    summary = await summarize_query(query_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired query id.")
+    return summary
 
 class Msg(BaseModel):
     role: str
     content: str
 
 @app.get("/api/history/{session_id}", response_model=List[Msg])
-def history(session_id: str):
-    if not cfg.chat_history["enabled"]:
+async def history(session_id: str):
+    history_store = await components.aget("history")
+    if history_store is None:
         return []
-    with SessionLocal() as s:
-        rows = (
-            s.query(ChatMessage)
-            .filter(ChatMessage.session_id == session_id)
-            .order_by(ChatMessage.id.asc())
-            .all()
-        )
-    return [Msg(role=r.role, content=r.content) for r in rows]
+    # the ring holds the same max_messages_per_session rows the writer keeps on disk
+    return [Msg(**m) for m in await history_store.arecent(session_id)]
+
+class InvalidateIn(BaseModel):
+    tables: List[str]
+
+@app.get("/api/cache/stats")
+def cache_stats():
+    # stats never force a component to load; unbuilt ones report null
+    def stats(name, method="stats"):
+        component = components.peek(name)
+        return getattr(component, method)() if component is not None else None
+
+    return {
+        "sql_generation": stats("sql_cache"),
+        "results": stats("result_cache"),
+        "validator_verdicts": stats("sql_validator"),
+        "cost_guard": stats("cost_guard"),
+        "retriever": stats("retriever"),
+        "single_flight": single_flight.stats(),
+        "chart_png": chart_renderer.stats(),
+        "prompt": {**prompt_stats, "provider_cache": stats("llm", "usage_stats")},
+        "llm_routing": stats("llm", "routing_stats"),
+        "history": stats("history"),
+    }
+
+@app.post("/api/cache/invalidate")
+def cache_invalidate(body: InvalidateIn):
+    """Hook for ETL jobs: drop cached results that read from the given tables."""
+    result_cache = components.peek("result_cache")
+    dropped = result_cache.invalidate_tables(body.tables) if result_cache else 0
+    return {"ok": True, "dropped": dropped}
+
+@app.post("/api/admin/retriever/resync")
+async def retriever_resync():
+    """Re-embed only new/changed tables after a schema refresh; dropped tables are removed."""
+    stats = await resync_retriever()
+    if stats is None:
+        raise HTTPException(status_code=409, detail="Retriever is disabled")
+    return {"ok": True, **stats}
+
+@app.get("/ready")
+def ready():
+    """Readiness probe: 503 until every required component is built; per-component detail either way."""
+    ok = components.ready()
+    return JSONResponse(status_code=200 if ok else 503,
+                        content={"ready": ok, "components": components.status()})
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus exposition: request/node/stage latency, LLM tokens, rows/bytes fetched, cache lookups."""
+    if not cfg.observability.get("metrics_enabled", True) or not telemetry.metrics_available:
+        raise HTTPException(status_code=404, detail="Metrics are disabled (or prometheus-client is not installed)")
+    body, content_type = telemetry.render()
+    return Response(content=body, media_type=content_type)
 
 @app.get("/")
 def root():
@@ -1,15 +1,66 @@
+import asyncio
+import json
 from abc import ABC, abstractmethod
-from typing import List, Dict
+from typing import AsyncIterator, List, Dict
 
 class LLMService(ABC):
     @abstractmethod
     def chat(self, messages: List[Dict], temperature: float = 0.0) -> str:
         ...
 
+    @staticmethod
+    def empty_sql_result(notes: str = "") -> dict:
+        """generate_sql_json result when no usable SQL came back."""
+        return {
+            "sql": None,
+            "confidence": 0.0,
+            "needs_clarification": True,
+            "notes": notes,
+            "message": ""
+        }
+
+    def parse_sql_json(self, content: str) -> dict:
+        """Model output → generate_sql_json result; providers with looser output override this."""
+        result = self.empty_sql_result()
+        try:
+            parsed = json.loads((content or "").strip())
+            result.update({
+                "sql": parsed.get("sql"),
+                "confidence": float(parsed.get("confidence", 0.9)),
+                "needs_clarification": bool(parsed.get("needs_clarification", False)),
+                "notes": parsed.get("notes", "Parsed from LLM JSON")
+            })
+        except Exception as e:
+            result["notes"] = f"Failed to parse LLM JSON: {e}"
+        return result
+
     def generate_sql_json(self, messages: List[Dict], temperature: float = 0.0) -> dict:
-        import json
-        text = self.chat(messages, temperature)
-        return json.loads(text)
+        try:
+            return self.parse_sql_json(self.chat(messages, temperature))
+        except Exception as e:
+            return self.empty_sql_result(str(e))
 
     def markdown(self, messages: List[Dict], temperature: float = 0.0) -> str:
         return self.chat(messages, temperature)
+
+    def usage_stats(self) -> Dict:
+        """Prompt/cached token counters; empty for providers that report none."""
+        return {}
+
+    def routing_stats(self) -> Dict:
+        """Per-backend latency / breaker state; empty unless this is a router."""
+        return {}
+
+    # Async counterparts; providers with a native async client override these.
+    async def achat(self, messages: List[Dict], temperature: float = 0.0) -> str:
+        return await asyncio.to_thread(self.chat, messages, temperature)
+
+    async def agenerate_sql_json(self, messages: List[Dict], temperature: float = 0.0) -> dict:
+        return await asyncio.to_thread(self.generate_sql_json, messages, temperature)
+
+    async def amarkdown(self, messages: List[Dict], temperature: float = 0.0) -> str:
+        return await asyncio.to_thread(self.markdown, messages, temperature)
+
+    async def amarkdown_stream(self, messages: List[Dict], temperature: float = 0.0) -> AsyncIterator[str]:
+        # Providers without streaming yield the whole answer as a single chunk.
+        yield await self.amarkdown(messages, temperature)
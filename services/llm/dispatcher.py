@@ -0,0 +1,335 @@
+import asyncio
+import random
+import re
+import threading
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from openai import APIConnectionError, APIStatusError, RateLimitError
+
+from helpers.telemetry import telemetry
+from helpers.tokens import estimate_tokens
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_UNIT_SECONDS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Rate-limit reset / retry-after values: "20ms", "1s", "6m0s", or plain seconds."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION.findall(value)
+    return sum(float(n) * _UNIT_SECONDS[u] for n, u in parts) if parts else None
+
+
+class TokenBucket:
+    """
+    `per_minute` units refilled continuously, holding at most one minute's worth.
+    reserve(n) takes the units right away (the level may go negative) and returns
+    how long the caller must wait, so concurrent callers queue up in order
+    instead of polling. per_minute=None means unlimited until set_rate().
+    """
+
+    def __init__(self, per_minute: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.per_minute = None
+        self.level = 0.0
+        self._updated = clock()
+        self.set_rate(per_minute)
+
+    def set_rate(self, per_minute: Optional[float]):
+        with self._lock:
+            first = self.per_minute is None
+            self.per_minute = float(per_minute) if per_minute else None
+            if first and self.per_minute:
+                self.level = self.per_minute
+            elif self.per_minute:
+                self.level = min(self.level, self.per_minute)
+            self._updated = self.clock()
+
+    def _refill(self, now: float):
+        if self.per_minute:
+            self.level = min(self.per_minute, self.level + (now - self._updated) * self.per_minute / 60.0)
+        self._updated = now
+
+    def reserve(self, n: float) -> float:
+        with self._lock:
+            if not self.per_minute:
+                return 0.0
+            now = self.clock()
+            self._refill(now)
+            self.level -= min(n, self.per_minute)   # a single call never waits for more than a minute's budget
+            return 0.0 if self.level >= 0 else -self.level * 60.0 / self.per_minute
+
+    def refund(self, n: float):
+        """Give back over-estimated units (negative n debits an under-estimate)."""
+        with self._lock:
+            if self.per_minute:
+                self._refill(self.clock())
+                self.level = min(self.per_minute, self.level + n)
+
+    def cap(self, remaining: float):
+        """The provider says only `remaining` units are left in its window."""
+        with self._lock:
+            if self.per_minute:
+                self._refill(self.clock())
+                self.level = min(self.level, remaining)
+
+
+class AdaptiveLimit:
+    """
+    AIMD concurrency window for async callers: +`increase` per window of
+    successful calls (limit += increase / limit), × `decrease` on throttling.
+    """
+
+    def __init__(self, initial: int = 4, minimum: int = 1, maximum: int = 32,
+                 increase: float = 1.0, decrease: float = 0.5):
+        self.minimum, self.maximum = max(1, minimum), max(1, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.increase, self.decrease = increase, decrease
+        self.in_flight = 0
+        self._cond: Optional[asyncio.Condition] = None
+
+    def _condition(self) -> asyncio.Condition:
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    async def acquire(self):
+        cond = self._condition()
+        async with cond:
+            await cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self):
+        cond = self._condition()
+        async with cond:
+            self.in_flight -= 1
+            cond.notify_all()
+
+    def on_success(self):
+        self.limit = min(self.maximum, self.limit + self.increase / self.limit)
+
+    def on_throttle(self):
+        self.limit = max(self.minimum, self.limit * self.decrease)
+
+
+class RateLimitDispatcher:
+    """
+    Sits in front of one provider's completion calls:
+      - requests/tokens-per-minute buckets, prompt tokens estimated before sending
+        (+ a completion reserve), corrected from `usage` afterwards
+      - buckets follow the provider's x-ratelimit-* headers (limit and remaining)
+      - async calls share an AIMD concurrency window
+      - 429 / 5xx / connection errors are retried here with jittered backoff
+        (honouring retry-after); a 429 pauses every caller, not just the one that hit it
+      - streams (astream) hold their concurrency slot until the last chunk and
+        settle tokens from the final usage chunk
+    The SDK's own retries should be off (max_retries=0) when this is in use.
+    """
+
+    def __init__(self, name: str, requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None, initial_concurrency: int = 4,
+                 min_concurrency: int = 1, max_concurrency: int = 32, max_retries: int = 3,
+                 backoff_seconds: float = 1.0, max_backoff_seconds: float = 30.0,
+                 completion_token_reserve: int = 400, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.clock = clock
+        self.requests = TokenBucket(requests_per_minute, clock)
+        self.tokens = TokenBucket(tokens_per_minute, clock)
+        self._configured = {"requests": requests_per_minute, "tokens": tokens_per_minute}
+        self.limit = AdaptiveLimit(initial_concurrency, min_concurrency, max_concurrency)
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.completion_token_reserve = completion_token_reserve
+        self._resume_at = 0.0
+        self._counts = {"calls": 0, "retries": 0, "rate_limited": 0, "server_errors": 0, "budget_waits": 0}
+
+    @classmethod
+    def from_config(cls, name: str, limits: Dict) -> "RateLimitDispatcher":
+        return cls(
+            name,
+            requests_per_minute=limits.get("requests_per_minute"),
+            tokens_per_minute=limits.get("tokens_per_minute"),
+            initial_concurrency=limits.get("initial_concurrency", 4),
+            min_concurrency=limits.get("min_concurrency", 1),
+            max_concurrency=limits.get("max_concurrency", 32),
+            max_retries=limits.get("max_retries", 3),
+            backoff_seconds=limits.get("backoff_seconds", 1.0),
+            max_backoff_seconds=limits.get("max_backoff_seconds", 30.0),
+            completion_token_reserve=limits.get("completion_token_reserve", 400),
+        )
+
+    def estimate(self, messages: List[Dict]) -> int:
+        # ~4 tokens of chat framing per message
+        return sum(estimate_tokens(m.get("content") or "") + 4 for m in messages) + self.completion_token_reserve
+
+    # ------------------------------------------------------------------ #
+    def _budget_wait(self, tokens: int) -> float:
+        wait = max(self._resume_at - self.clock(), self.requests.reserve(1), self.tokens.reserve(tokens), 0.0)
+        if wait > 0:
+            self._counts["budget_waits"] += 1
+            telemetry.record_throttle(self.name, "budget_wait")
+        return wait
+
+    def observe_headers(self, headers) -> None:
+        """Follow x-ratelimit-limit-* (when lower than configured) and x-ratelimit-remaining-*."""
+        if headers is None:
+            return
+        for kind, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+            limit, remaining = headers.get(f"x-ratelimit-limit-{kind}"), headers.get(f"x-ratelimit-remaining-{kind}")
+            try:
+                if limit is not None:
+                    limit = float(limit)
+                    configured = self._configured[kind]
+                    if bucket.per_minute != limit and (not configured or limit < configured):
+                        bucket.set_rate(limit)
+                if remaining is not None:
+                    bucket.cap(float(remaining))
+            except ValueError:
+                continue
+
+    def _unreserve(self, tokens: int) -> None:
+        """A failed attempt used nothing: give back its reservation (before headers cap the buckets)."""
+        self.requests.refund(1)
+        self.tokens.refund(tokens)
+
+    def _settle(self, estimated: int, usage) -> None:
+        total = getattr(usage, "total_tokens", None) if usage is not None else None
+        if total:
+            self.tokens.refund(estimated - int(total))
+
+    def _retry_delay(self, attempt: int, error: Exception) -> float:
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None) or {}
+        retry_after = parse_duration(f"{headers['retry-after-ms']}ms") if headers.get("retry-after-ms") \
+            else parse_duration(headers.get("retry-after"))
+        # full jitter: concurrent callers do not come back in lockstep
+        backoff = random.uniform(0, min(self.max_backoff_seconds, self.backoff_seconds * 2 ** attempt))
+        return max(retry_after or 0.0, backoff)
+
+    def _failed(self, error: Exception, attempt: int) -> Optional[float]:
+        """Delay before retrying `error`, or None when it should propagate."""
+        if isinstance(error, RateLimitError):
+            self._counts["rate_limited"] += 1
+            reason = "rate_limited"
+        elif isinstance(error, APIStatusError) and error.status_code >= 500:
+            self._counts["server_errors"] += 1
+            reason = "server_error"
+        elif isinstance(error, APIConnectionError):
+            reason = "connection_error"
+        else:
+            return None
+        telemetry.record_throttle(self.name, reason)
+        if reason != "connection_error":
+            self.limit.on_throttle()
+        self.observe_headers(getattr(getattr(error, "response", None), "headers", None))
+        if attempt >= self.max_retries:
+            return None
+        delay = self._retry_delay(attempt, error)
+        if reason == "rate_limited":
+            self._resume_at = max(self._resume_at, self.clock() + delay)
+        self._counts["retries"] += 1
+        return delay
+
+    async def _asend(self, send: Callable[[], Awaitable], tokens: int):
+        """One successful `send()` under the budgets, with retries; returns holding a concurrency slot."""
+        attempt = 0
+        while True:
+            wait = self._budget_wait(tokens)
+            if wait:
+                await asyncio.sleep(wait)
+            await self.limit.acquire()
+            try:
+                raw = await send()
+            except BaseException as e:
+                await self.limit.release()
+                self._unreserve(tokens)
+                if not isinstance(e, Exception):
+                    raise   # cancelled
+                delay = self._failed(e, attempt)
+                if delay is None:
+                    raise
+            else:
+                self.observe_headers(raw.headers)
+                self.limit.on_success()
+                return raw
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def acall(self, send: Callable[[], Awaitable], messages: List[Dict]):
+        """`send` makes one `with_raw_response` call; returns the parsed response."""
+        tokens = self.estimate(messages)
+        self._counts["calls"] += 1
+        raw = await self._asend(send, tokens)
+        try:
+            response = raw.parse()
+        finally:
+            await self.limit.release()
+        self._settle(tokens, getattr(response, "usage", None))
+        return response
+
+    async def astream(self, send: Callable[[], Awaitable], messages: List[Dict]) -> AsyncIterator:
+        """
+        acall for stream=True: yields the chunks. The concurrency slot is held until the
+        stream is exhausted or closed (close the generator when stopping early), and the
+        token bucket is corrected from the final usage chunk.
+        """
+        tokens = self.estimate(messages)
+        self._counts["calls"] += 1
+        raw = await self._asend(send, tokens)
+        usage, stream = None, None
+        try:
+            stream = raw.parse()
+            async for chunk in stream:
+                if getattr(chunk, "usage", None) is not None:
+                    usage = chunk.usage
+                yield chunk
+        finally:
+            close = getattr(stream, "close", None)
+            try:
+                if close is not None:
+                    await close()   # stopped early: drop the HTTP response too
+            finally:
+                await self.limit.release()
+                self._settle(tokens, usage)
+
+    def call(self, send: Callable, messages: List[Dict]):
+        """Blocking counterpart of acall (budgets and retries; the concurrency window is async-only)."""
+        tokens = self.estimate(messages)
+        self._counts["calls"] += 1
+        attempt = 0
+        while True:
+            wait = self._budget_wait(tokens)
+            if wait:
+                time.sleep(wait)
+            try:
+                raw = send()
+            except Exception as e:
+                self._unreserve(tokens)
+                delay = self._failed(e, attempt)
+                if delay is None:
+                    raise
+            else:
+                self.observe_headers(raw.headers)
+                response = raw.parse()
+                self._settle(tokens, getattr(response, "usage", None))
+                return response
+            attempt += 1
+            time.sleep(delay)
+
+    def stats(self) -> Dict:
+        out = dict(self._counts)
+        out.update({
+            "concurrency_limit": round(self.limit.limit, 2),
+            "in_flight": self.limit.in_flight,
+            "requests_per_minute": self.requests.per_minute,
+            "tokens_per_minute": self.tokens.per_minute,
+        })
+        return out
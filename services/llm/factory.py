@@ -1,14 +1,56 @@
-from helpers.config import load_config
+import logging
+from helpers.config import get_config
+from helpers.errors import ProviderError
+from services.llm.dispatcher import RateLimitDispatcher
 from services.llm.openai_compatible import OpenAICompatibleService
+from services.llm.router import LLMRouter
+
+logger = logging.getLogger("ai-sql-agent")
 
 def make_llm():
-    cfg = load_config().llm
-    provider = cfg["provider"]
-    model = cfg["model"]
-    base_url = cfg.get("base_url") or ""
+    cfg = get_config().llm
     timeout = cfg.get("timeout_seconds", 60)
-    max_retries = cfg.get("max_retries", 0)  # 👈 read from config
+    rate_limits = cfg.get("rate_limits") or {}
+    routing = cfg.get("routing") or {}
+    if not routing.get("enabled", False):
+        return make_backend(cfg["provider"], cfg["model"], cfg.get("base_url") or "", timeout,
+                            cfg.get("max_retries", 0), rate_limits)  # 👈 read from config
+
+    backends = []
+    for b in routing.get("backends") or [{"provider": cfg["provider"], "model": cfg["model"]}]:
+        try:
+            # the router fails over / hedges instead of the SDK retrying one provider for minutes
+            backends.append(make_backend(b["provider"], b.get("model", cfg["model"]), b.get("base_url") or "",
+                                         b.get("timeout_seconds", timeout), routing.get("max_retries", 0),
+                                         {**rate_limits, **(b.get("rate_limits") or {})}))
+        except ProviderError as e:
+            logger.warning("⚠️ LLM backend %s skipped: %s", b["provider"], e)
+    if not backends:
+        raise ProviderError("No LLM backend in llm.routing.backends could be created")
+    return LLMRouter(
+        backends,
+        hedge=routing.get("hedge", True),
+        hedge_quantile=routing.get("hedge_quantile", 0.95),
+        hedge_min_delay_seconds=routing.get("hedge_min_delay_ms", 300) / 1000,
+        hedge_default_delay_seconds=routing.get("hedge_default_delay_ms", 2000) / 1000,
+        min_samples=routing.get("min_samples", 20),
+        latency_window=routing.get("latency_window", 200),
+        breaker_failures=routing.get("breaker_failures", 5),
+        breaker_reset_seconds=routing.get("breaker_reset_seconds", 30),
+    )
+
+def make_backend(provider: str, model: str, base_url: str = "", timeout: int = 60, max_retries: int = 0,
+                 rate_limits: dict = None):
+    dispatcher = None
+    if (rate_limits or {}).get("enabled", False):
+        # 429s / 5xx are retried by the dispatcher (budget-aware, jittered), not blindly by the SDK
+        dispatcher = RateLimitDispatcher.from_config(f"{provider}:{model}", rate_limits)
+        max_retries = 0
+    service = _make_service(provider, model, base_url, timeout, max_retries)
+    service.dispatcher = dispatcher
+    return service
 
+def _make_service(provider: str, model: str, base_url: str, timeout: int, max_retries: int):
     if provider == "openai":
         return OpenAICompatibleService(base_url=None, api_key_env="OPENAI_API_KEY", model=model, timeout=timeout, max_retries = max_retries ,
                                        provider_name = provider)
@@ -1,123 +1,172 @@
 import os
-from typing import List, Dict, Optional
+from contextlib import aclosing
+from typing import AsyncIterator, List, Dict, Optional
 import json
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from helpers.errors import ProviderError
 from helpers.json_utils import JsonSqlHelper
+from services.llm.base import LLMService
+from services.llm.usage import prompt_cache_usage
 
 from dotenv import load_dotenv
 
 # ✅ Load environment variables immediately when this module is imported
 load_dotenv()
 
-class OpenAICompatibleService:
+# providers known to accept stream_options={"include_usage": True}
+STREAM_USAGE_PROVIDERS = {"openai", "deepseek"}
+
+
+class OpenAICompatibleService(LLMService):
     """
     Works with:
     - OpenAI cloud (default base_url)
     - DeepSeek (base_url=https://api.deepseek.com, api_key=DEEPSEEK_API_KEY)
     - Gemini via OpenAI-compatible endpoint (base_url=https://generativelanguage.googleapis.com/v1beta/openai/)  # :contentReference[oaicite:10]{index=10}
     - Ollama/local (base_url=http://localhost:11434/v1)  # :contentReference[oaicite:11]{index=11}
+
+    Every call has a sync form (OpenAI client) and an `a`-prefixed async form
+    (AsyncOpenAI client) so the agent graph can run under `ainvoke`.
     """
     def __init__(self, base_url: Optional[str], api_key_env: str, model: str, timeout: int = 60, max_retries: int = 2,
-                 provider_name: str = "openai"):
-     
+                 provider_name: str = "openai", dispatcher=None):
+
         api_key = os.getenv(api_key_env) or os.getenv("OPENAI_API_KEY")
- 
+
         if not api_key and (base_url or "openai" in api_key_env.lower()):
             raise ProviderError(f"Missing API key in env: {api_key_env} or OPENAI_API_KEY")
-        
+
 
         #self.client = OpenAI(base_url=base_url or None, api_key=api_key)
-        self.client = OpenAI(
+        client_kwargs = dict(
             base_url=base_url or None,
             api_key=api_key,
             timeout=timeout,
             max_retries= max_retries  # 👈 important
         )
+        self.client = OpenAI(**client_kwargs)
+        self.aclient = AsyncOpenAI(**client_kwargs)
 
         self.model = model
         self.timeout = timeout
         self.provider_name = provider_name
+        # optional RateLimitDispatcher: RPM/TPM budgets, AIMD concurrency, 429 handling
+        self.dispatcher = dispatcher
 
-   
-   
-   
 
-   
-   
-    def chat(self, messages: List[Dict], temperature: float = 0.0) -> str:
+
+
+
+    def _request(self, messages: List[Dict], temperature: float) -> dict:
         # Use Chat Completions for broad OpenAI-compatibility. :contentReference[oaicite:12]{index=12}
-        resp = self.client.chat.completions.create(
+        return dict(
             model=self.model,
             messages=messages,
             temperature=temperature,
             timeout=self.timeout,
         )
+
+    def _create(self, messages: List[Dict], temperature: float, **extra):
+        request = {**self._request(messages, temperature), **extra}
+        if self.dispatcher is None:
+            return self.client.chat.completions.create(**request)
+        # raw response: the dispatcher reads the x-ratelimit-* headers before parsing
+        return self.dispatcher.call(lambda: self.client.chat.completions.with_raw_response.create(**request), messages)
+
+    async def _acreate(self, messages: List[Dict], temperature: float, **extra):
+        request = {**self._request(messages, temperature), **extra}
+        if self.dispatcher is None:
+            return await self.aclient.chat.completions.create(**request)
+        return await self.dispatcher.acall(
+            lambda: self.aclient.chat.completions.with_raw_response.create(**request), messages)
+
+    async def _astream(self, messages: List[Dict], temperature: float, **extra) -> AsyncIterator:
+        """stream=True completion chunks; the HTTP response is closed when the consumer stops early."""
+        request = {**self._request(messages, temperature), "stream": True, **extra}
+        if self.dispatcher is None:
+            async with await self.aclient.chat.completions.create(**request) as stream:
+                async for chunk in stream:
+                    yield chunk
+            return
+        send = lambda: self.aclient.chat.completions.with_raw_response.create(**request)
+        async with aclosing(self.dispatcher.astream(send, messages)) as chunks:
+            async for chunk in chunks:
+                yield chunk
+
+    def chat(self, messages: List[Dict], temperature: float = 0.0) -> str:
+        resp = self._create(messages, temperature)
+        prompt_cache_usage.record(self.provider_name, getattr(resp, "usage", None))
         return resp.choices[0].message.content
 
-    def generate_sql_json(self, messages: list, temperature: float = 0.0) -> dict:
-        result = {
-            "sql": None,
-            "confidence": 0.0,
-            "needs_clarification": True,
-            "notes": "",
-            "message": ""
-        }
+    async def achat(self, messages: List[Dict], temperature: float = 0.0) -> str:
+        resp = await self._acreate(messages, temperature)
+        prompt_cache_usage.record(self.provider_name, getattr(resp, "usage", None))
+        return resp.choices[0].message.content
 
-        try:
-            resp = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=temperature,
-                timeout=self.timeout,
-            )
-            content = resp.choices[0].message.content.strip()
-
-            if self.provider_name == "ollama":
-          
-                parsed = JsonSqlHelper.safe_json_loads(content)
-        
-                
-                if not parsed:
-                    # fallback: check if raw SQL inside content
-                    if "SELECT" in content.upper():
-                        result.update({
-                            "sql": content,
-                            "confidence": 0.7,
-                            "needs_clarification": False,
-                            "notes": "Parsed as raw SQL from Ollama (fallback)"
-                        })
-                    else:
-                        result["notes"] = f"Ollama output unusable: {content[:100]}..."
-                    return result
-
-                sql_value = JsonSqlHelper.clean_sql(parsed.get("sql", ""))
- 
+    def usage_stats(self) -> dict:
+        return prompt_cache_usage.stats(self.provider_name)
+
+    def routing_stats(self) -> dict:
+        return {"rate_limits": self.dispatcher.stats()} if self.dispatcher is not None else {}
 
+    def parse_sql_json(self, content: str) -> dict:
+        result = self.empty_sql_result()
+        content = (content or "").strip()
 
+        if self.provider_name == "ollama":
+
+            parsed = JsonSqlHelper.safe_json_loads(content)
+
+
+            if not parsed:
+                # fallback: check if raw SQL inside content
+                if "SELECT" in content.upper():
+                    result.update({
+                        "sql": content,
+                        "confidence": 0.7,
+                        "needs_clarification": False,
+                        "notes": "Parsed as raw SQL from Ollama (fallback)"
+                    })
+                else:
+                    result["notes"] = f"Ollama output unusable: {content[:100]}..."
+                return result
+
+            sql_value = JsonSqlHelper.clean_sql(parsed.get("sql", ""))
+
+
+
+            result.update({
+                "sql": sql_value or None,
+                "confidence": float(parsed.get("confidence", 0.7)),
+                "needs_clarification": bool(parsed.get("needs_clarification", False)),
+                "notes": parsed.get("notes", "Parsed from Ollama JSON")
+            })
+
+        else:  # OpenAI/DeepSeek/Gemini
+            try:
+                parsed = json.loads(content)
                 result.update({
-                    "sql": sql_value or None,
-                    "confidence": float(parsed.get("confidence", 0.7)),
+                    "sql": parsed.get("sql"),
+                    "confidence": float(parsed.get("confidence", 0.9)),
                     "needs_clarification": bool(parsed.get("needs_clarification", False)),
-                    "notes": parsed.get("notes", "Parsed from Ollama JSON")
+                    "notes": parsed.get("notes", "Parsed from OpenAI JSON")
                 })
+            except Exception as e:
+                result["notes"] = f"Failed to parse LLM JSON: {e}"
 
-            else:  # OpenAI/DeepSeek/Gemini
-                try:
-                    parsed = json.loads(content)
-                    result.update({
-                        "sql": parsed.get("sql"),
-                        "confidence": float(parsed.get("confidence", 0.9)),
-                        "needs_clarification": bool(parsed.get("needs_clarification", False)),
-                        "notes": parsed.get("notes", "Parsed from OpenAI JSON")
-                    })
-                except Exception as e:
-                    result["notes"] = f"Failed to parse LLM JSON: {e}"
+        return result
 
+    def generate_sql_json(self, messages: list, temperature: float = 0.0) -> dict:
+        try:
+            return self.parse_sql_json(self.chat(messages, temperature))
         except Exception as e:
-            result["notes"] = str(e)
+            return self.empty_sql_result(str(e))
 
-        return result
+    async def agenerate_sql_json(self, messages: list, temperature: float = 0.0) -> dict:
+        try:
+            return self.parse_sql_json(await self.achat(messages, temperature))
+        except Exception as e:
+            return self.empty_sql_result(str(e))
 
 
     def markdown(self, messages: list, temperature: float = 0.0) -> str:
@@ -126,19 +175,40 @@ class OpenAICompatibleService:
         Works for OpenAI, Ollama, DeepSeek, and Gemini.
         """
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=temperature,
-                timeout=self.timeout,
-            )
-            return response.choices[0].message.content.strip()
+            return (self.chat(messages, temperature) or "").strip()
+        except Exception as e:
+            return f"⚠️ Markdown generation failed: {str(e)}"
+
+    async def amarkdown(self, messages: list, temperature: float = 0.0) -> str:
+        try:
+            return (await self.achat(messages, temperature) or "").strip()
         except Exception as e:
             return f"⚠️ Markdown generation failed: {str(e)}"
 
+    async def achat_stream(self, messages: list, temperature: float = 0.0) -> AsyncIterator[str]:
+        """Raw content deltas (stream=True completions); provider errors propagate."""
+        extra = {}
+        if self.provider_name in STREAM_USAGE_PROVIDERS:
+            # final chunk then carries `usage` (choices=[])
+            extra["stream_options"] = {"include_usage": True}
+        async with aclosing(self._astream(messages, temperature, **extra)) as chunks:
+            async for chunk in chunks:
+                if getattr(chunk, "usage", None) is not None:
+                    prompt_cache_usage.record(self.provider_name, chunk.usage)
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    yield delta
+
+    async def amarkdown_stream(self, messages: list, temperature: float = 0.0) -> AsyncIterator[str]:
+        """Yield markdown deltas as the provider streams them (stream=True completions)."""
+        try:
+            async for delta in self.achat_stream(messages, temperature):
+                yield delta
+        except Exception as e:
+            yield f"⚠️ Markdown generation failed: {str(e)}"
+
+
 
 
-    
 
-    
 
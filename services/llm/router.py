@@ -0,0 +1,281 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import aclosing
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from helpers.errors import ProviderError
+from services.llm.base import LLMService
+
+logger = logging.getLogger("ai-sql-agent")
+
+
+class LatencyWindow:
+    """Last `size` call latencies (seconds) of one backend."""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=max(1, int(size)))
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+class CircuitBreaker:
+    """
+    closed → open after `failures` consecutive errors; once `reset_seconds`
+    have passed, one probe call is let through (half-open): success closes
+    the breaker, failure opens it again.
+    """
+
+    def __init__(self, failures: int = 5, reset_seconds: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.failures = max(1, int(failures))
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self._errors = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "half_open" if self._probing or self.clock() - self._opened_at >= self.reset_seconds else "open"
+
+    def allow(self) -> bool:
+        if self._opened_at is None:
+            return True
+        if self._probing or self.clock() - self._opened_at < self.reset_seconds:
+            return False
+        self._probing = True
+        return True
+
+    def release(self):
+        """The half-open probe was cancelled before it could tell us anything."""
+        self._probing = False
+
+    def success(self):
+        self._errors, self._opened_at, self._probing = 0, None, False
+
+    def failure(self):
+        self._errors += 1
+        if self._probing or self._errors >= self.failures:
+            self._opened_at, self._probing = self.clock(), False
+
+
+class _Backend:
+    def __init__(self, service: LLMService, name: str, window: int, breaker: CircuitBreaker):
+        self.service = service
+        self.name = name
+        # full completions and stream time-to-first-token have very different latencies
+        self.latency = {"chat": LatencyWindow(window), "stream": LatencyWindow(window)}
+        self.breaker = breaker
+        self.calls = 0
+        self.errors = 0
+        self.wins = 0
+
+
+async def _first_chunk(stream: AsyncIterator[str]) -> Tuple[str, AsyncIterator[str]]:
+    """Wait for the first delta; the stream is closed if this gets cancelled (lost the hedge) or fails."""
+    try:
+        return await stream.__anext__(), stream
+    except StopAsyncIteration:
+        return "", stream
+    except BaseException:
+        await stream.aclose()
+        raise
+
+
+class LLMRouter(LLMService):
+    """
+    Routes calls over several backends (first = primary):
+      - hedging: if the first call has not answered after the primary's observed
+        p95 (`hedge_quantile`), the same request goes to the next backend; the
+        first answer wins and the other call is cancelled
+      - failover: an error moves on to the next backend
+      - per-backend circuit breakers skip a backend that keeps failing
+    Streams are hedged on time-to-first-token.
+    """
+
+    provider_name = "router"
+
+    def __init__(self, backends: List[LLMService], hedge: bool = True, hedge_quantile: float = 0.95,
+                 hedge_min_delay_seconds: float = 0.3, hedge_default_delay_seconds: float = 2.0,
+                 min_samples: int = 20, latency_window: int = 200, breaker_failures: int = 5,
+                 breaker_reset_seconds: float = 30.0):
+        if not backends:
+            raise ValueError("LLMRouter needs at least one backend")
+        self.backends = [
+            _Backend(s, f"{getattr(s, 'provider_name', 'backend')}:{getattr(s, 'model', i)}", latency_window,
+                     CircuitBreaker(breaker_failures, breaker_reset_seconds))
+            for i, s in enumerate(backends)
+        ]
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay_seconds
+        self.hedge_default_delay = hedge_default_delay_seconds
+        self.min_samples = min_samples
+        self.hedges = 0
+        self.failovers = 0
+
+    def hedge_delay(self, backend: _Backend, kind: str) -> float:
+        window = backend.latency[kind]
+        observed = window.quantile(self.hedge_quantile) if len(window) >= self.min_samples else None
+        return max(self.hedge_min_delay, self.hedge_default_delay if observed is None else observed)
+
+    async def _timed(self, backend: _Backend, kind: str, op: Callable[[LLMService], Awaitable]):
+        backend.calls += 1
+        started = time.perf_counter()
+        try:
+            result = await op(backend.service)
+        except asyncio.CancelledError:
+            backend.breaker.release()
+            raise  # lost the hedge: neither a failure nor a latency sample
+        except Exception:
+            backend.errors += 1
+            backend.breaker.failure()
+            raise
+        backend.latency[kind].add(time.perf_counter() - started)
+        backend.breaker.success()
+        return result
+
+    async def _call(self, kind: str, op: Callable[[LLMService], Awaitable]):
+        """Run `op` hedged/failing over across backends; returns (result, backend that answered)."""
+        pending: Dict[asyncio.Task, _Backend] = {}
+        errors: List[str] = []
+        remaining = iter(self.backends)
+
+        def start(backend: _Backend):
+            pending[asyncio.ensure_future(self._timed(backend, kind, op))] = backend
+
+        def launch_next() -> Optional[_Backend]:
+            # breakers are asked only when a call is really about to go out (half-open = one probe)
+            for backend in remaining:
+                if backend.breaker.allow():
+                    start(backend)
+                    return backend
+            return None
+
+        first = launch_next()
+        if first is None:
+            # every breaker open: still try the primary rather than fail without a call
+            first = self.backends[0]
+            start(first)
+        hedged = not self.hedge or len(self.backends) < 2
+        try:
+            while pending:
+                timeout = None if hedged else self.hedge_delay(first, kind)
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    backend = launch_next()
+                    if backend is not None:
+                        self.hedges += 1
+                        logger.debug("🏁 Hedging %s call to %s", kind, backend.name)
+                    continue
+                for task in done:
+                    backend = pending.pop(task)
+                    if task.exception() is None:
+                        backend.wins += 1
+                        return task.result(), backend
+                    errors.append(f"{backend.name}: {task.exception()}")
+                if not pending:
+                    backend = launch_next()
+                    if backend is not None:
+                        self.failovers += 1
+                        logger.warning("⚠️ LLM failover to %s after: %s", backend.name, errors[-1])
+            raise ProviderError("All LLM backends failed: " + "; ".join(errors))
+        finally:
+            for task in pending:
+                task.cancel()
+
+    # ------------------------------------------------------------------ #
+    def chat(self, messages: List[Dict], temperature: float = 0.0) -> str:
+        # sync path: failover only (no event loop to hedge on)
+        errors = []
+
+        def candidates():
+            # breakers are asked lazily, right before each call (allow() claims the half-open probe)
+            called = False
+            for backend in self.backends:
+                if backend.breaker.allow():
+                    called = True
+                    yield backend
+            if not called:
+                yield self.backends[0]   # every breaker open: still try the primary
+
+        for backend in candidates():
+            try:
+                result = backend.service.chat(messages, temperature)
+            except Exception as e:
+                backend.errors += 1
+                backend.breaker.failure()
+                errors.append(f"{backend.name}: {e}")
+                continue
+            backend.breaker.success()
+            return result
+        raise ProviderError("All LLM backends failed: " + "; ".join(errors))
+
+    async def achat(self, messages: List[Dict], temperature: float = 0.0) -> str:
+        result, _ = await self._call("chat", lambda s: s.achat(messages, temperature))
+        return result
+
+    async def agenerate_sql_json(self, messages: List[Dict], temperature: float = 0.0) -> dict:
+        try:
+            text, backend = await self._call("chat", lambda s: s.achat(messages, temperature))
+            # parsing is provider specific (Ollama gets the lenient parser)
+            return backend.service.parse_sql_json(text)
+        except Exception as e:
+            return self.empty_sql_result(str(e))
+
+    async def amarkdown(self, messages: List[Dict], temperature: float = 0.0) -> str:
+        try:
+            return (await self.achat(messages, temperature) or "").strip()
+        except Exception as e:
+            return f"⚠️ Markdown generation failed: {str(e)}"
+
+    async def amarkdown_stream(self, messages: List[Dict], temperature: float = 0.0) -> AsyncIterator[str]:
+        try:
+            (first, stream), _ = await self._call(
+                "stream", lambda s: _first_chunk(s.achat_stream(messages, temperature)))
+            async with aclosing(stream):   # the backend's dispatcher slot is held until the stream closes
+                if first:
+                    yield first
+                async for delta in stream:
+                    yield delta
+        except Exception as e:
+            yield f"⚠️ Markdown generation failed: {str(e)}"
+
+    def usage_stats(self) -> Dict:
+        out = {}
+        for b in self.backends:
+            out.update(b.service.usage_stats())
+        return out
+
+    def routing_stats(self) -> Dict:
+        return {
+            "hedges": self.hedges,
+            "failovers": self.failovers,
+            "backends": {
+                b.name: {
+                    "breaker": b.breaker.state,
+                    "calls": b.calls,
+                    "errors": b.errors,
+                    "wins": b.wins,
+                    "p50_ms": {k: round(w.quantile(0.5) * 1000, 1) if len(w) else None for k, w in b.latency.items()},
+                    "p95_ms": {k: round(w.quantile(0.95) * 1000, 1) if len(w) else None for k, w in b.latency.items()},
+                    "hedge_after_ms": {k: round(self.hedge_delay(b, k) * 1000, 1) for k in b.latency},
+                    "rate_limits": b.service.routing_stats().get("rate_limits"),
+                }
+                for b in self.backends
+            },
+        }
@@ -0,0 +1,53 @@
+import threading
+from typing import Dict, Optional
+from helpers.telemetry import telemetry
+
+
+class PromptCacheUsage:
+    """
+    Per-provider token counters taken from completion `usage` blocks.
+
+    cached tokens come from `prompt_tokens_details.cached_tokens` (OpenAI and
+    most compatible servers) or `prompt_cache_hit_tokens` (DeepSeek).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_provider: Dict[str, Dict[str, int]] = {}
+
+    @staticmethod
+    def cached_tokens(usage) -> int:
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) if details is not None else None
+        if cached is None:
+            cached = getattr(usage, "prompt_cache_hit_tokens", None)
+        if cached is None and isinstance(getattr(usage, "model_extra", None), dict):
+            cached = usage.model_extra.get("prompt_cache_hit_tokens")
+        return int(cached or 0)
+
+    def record(self, provider: str, usage) -> None:
+        if usage is None:
+            return
+        with self._lock:
+            row = self._by_provider.setdefault(
+                provider, {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+            )
+            prompt = int(getattr(usage, "prompt_tokens", 0) or 0)
+            completion = int(getattr(usage, "completion_tokens", 0) or 0)
+            cached = self.cached_tokens(usage)
+            row["requests"] += 1
+            row["prompt_tokens"] += prompt
+            row["completion_tokens"] += completion
+            row["cached_tokens"] += cached
+        telemetry.record_tokens(provider, prompt, completion, cached)
+
+    def stats(self, provider: Optional[str] = None) -> Dict:
+        with self._lock:
+            rows = {p: dict(r) for p, r in self._by_provider.items() if provider in (None, p)}
+        for r in rows.values():
+            r["cache_hit_rate"] = round(r["cached_tokens"] / r["prompt_tokens"], 4) if r["prompt_tokens"] else 0.0
+        return rows
+
+
+# process-wide: every provider instance records here, so stats survive re-creating services
+prompt_cache_usage = PromptCacheUsage()
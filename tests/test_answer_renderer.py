@@ -0,0 +1,50 @@
+import pandas as pd
+from tools.answer_renderer import AnswerRenderer, describe_sql
+
+SQL = ("SELECT COUNT(*) FROM epay.Payments WHERE Status = 3 "
+       "AND TransactionDate >= DATEADD(DAY, -60, GETDATE())")
+
+def test_describe_sql_reads_aggregates_filters_and_dates():
+    facts = describe_sql(SQL)
+    assert facts.tables == ["epay.Payments"] and facts.aggregates == ["number of rows"]
+    assert facts.filters == ["Status = 3", "TransactionDate in the last 60 days"]
+    assert describe_sql("SELECT a FROM t UNION SELECT b FROM u") is None
+
+def test_scalar_empty_and_small_table_answers():
+    r = AnswerRenderer(max_table_rows=3)
+    assert r.render("how many?", SQL, pd.DataFrame({"": [1234]})) == (
+        "The number of rows in epay.Payments where Status = 3 and TransactionDate in the last 60 days is **1,234**.")
+    assert r.render("any?", "SELECT * FROM dbo.Students WHERE Id > 5", pd.DataFrame()).startswith("No rows found")
+    table = r.render("per status", "SELECT Status, SUM(Amount) FROM epay.Payments GROUP BY Status",
+                     pd.DataFrame({"Status": [1, 2], "Total": [5.5, 6.0]}))
+    assert table.startswith("Total Amount per Status in epay.Payments:") and "|---" in table
+
+def test_policy_falls_back_to_llm():
+    r = AnswerRenderer(max_table_rows=3, llm_keywords=["why", "trend"])
+    big = pd.DataFrame({"a": range(10)})
+    assert r.render("list", "SELECT a FROM t", big) is None                          # too many rows
+    assert r.render("why so low?", SQL, pd.DataFrame({"n": [1]})) is None           # question asks for analysis
+    assert r.render("list", "SELECT a FROM t", big.head(2), has_more=True) is None   # more pages exist
+    assert AnswerRenderer(enabled=False).render("x", SQL, pd.DataFrame({"n": [1]})) is None
+
+def test_computed_values_are_not_described_as_bare_aggregates():
+    r = AnswerRenderer()
+    pct = ("SELECT COUNT(*) * 100.0 / (SELECT COUNT(*) FROM epay.Payments) AS PaidPct "
+           "FROM epay.Payments WHERE Status = 3")
+    assert describe_sql(pct).aggregates == [] and describe_sql(pct).values == ["PaidPct"]
+    assert r.render("share paid", pct, pd.DataFrame({"PaidPct": [42.5]})) == (
+        "The PaidPct in epay.Payments where Status = 3 is **42.50**.")
+    assert r.render("monthly", "SELECT SUM(Amount) / 12 FROM epay.Payments", pd.DataFrame({"": [1000]})) is None
+    table = r.render("per status", "SELECT Status, SUM(Amount) / 12 AS MonthlyAvg FROM epay.Payments GROUP BY Status",
+                     pd.DataFrame({"Status": [1, 2], "MonthlyAvg": [5.5, 6.0]}))
+    assert table.startswith("2 rows per Status in epay.Payments:")
+
+def test_null_checks_and_ordered_top():
+    facts = describe_sql("SELECT Name FROM dbo.Students WHERE Email IS NULL AND Phone IS NOT NULL")
+    assert facts.filters == ["Email has no value", "Phone has a value"]
+    r = AnswerRenderer()
+    top = "SELECT TOP 1 Name FROM dbo.Students ORDER BY Score DESC"
+    assert r.render("best student", top, pd.DataFrame({"Name": ["Al"]})) is None
+    ranked = r.render("best students", "SELECT TOP 2 Name, Score FROM dbo.Students ORDER BY Score DESC",
+                    pd.DataFrame({"Name": ["Al", "Bo"], "Score": [9, 8]}))
+    assert ranked.startswith("2 rows in dbo.Students (top 2 by Score descending):")
@@ -0,0 +1,36 @@
+import json
+import urllib.request
+from benchmarks.sqlite_backend import SqliteExecutor, build_database
+from benchmarks.stub_llm import StubProfile, serve
+
+SCHEMA = {"DatabaseSchema": [
+    {"SchemaName": "dbo", "TableName": "Students", "FullTableName": "dbo.Students",
+     "Columns": {"Id": "int", "Name": "nvarchar(100)", "Status": "int"}, "ForeignKeys": []},
+    {"SchemaName": "epay", "TableName": "Payments", "FullTableName": "epay.Payments",
+     "Columns": {"Id": "int", "StudentId": "int", "Amount": "decimal(18,3)", "TransactionDate": "datetime"},
+     "ForeignKeys": [{"ParentColumn": "StudentId", "ReferencedTable": "dbo.Students", "ReferencedColumn": "Id"}]},
+]}
+
+def test_sqlite_executor_runs_tsql_paging(tmp_path):
+    ex = SqliteExecutor(build_database(SCHEMA, str(tmp_path), rows_per_table=50))
+    df = ex.run_select("SELECT TOP 100 p.Id, s.Name FROM epay.Payments p JOIN dbo.Students s ON s.Id = p.StudentId "
+                       "WHERE p.TransactionDate >= DATEADD(DAY, -400, GETDATE())", 1, 20, 1000)
+    assert list(df.columns) == ["Id", "Name"] and df.shape[0] == 20
+    page = ex.run_keyset_page("SELECT Id, Status FROM dbo.Students", ["Id"], [45], 10)
+    assert page["Id"].tolist() == [46, 47, 48, 49, 50]
+
+def test_stub_llm_answers_sql_json():
+    server, url = serve(StubProfile(latency_ms=1, token_ms=0, seed=1))
+    try:
+        body = {"model": "stub", "messages": [
+            {"role": "system", "content": "Output JSON only."},
+            {"role": "system", "content": "Schema excerpt:\ndbo.Students: Id int, Name nvarchar(100)"},
+            {"role": "user", "content": "list students"},
+        ]}
+        req = urllib.request.Request(f"{url}/chat/completions", data=json.dumps(body).encode(),
+                                     headers={"Content-Type": "application/json"})
+        out = json.loads(urllib.request.urlopen(req).read())
+        answer = json.loads(out["choices"][0]["message"]["content"])
+        assert "dbo.Students" in answer["sql"] and out["usage"]["prompt_tokens"] > 0
+    finally:
+        server.shutdown()
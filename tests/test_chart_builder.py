@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+from tools.chart_builder import infer_chart_spec, is_id_name, lttb_indices, minmax_indices, spec_hash
+
+def test_downsamplers_keep_endpoints_and_spikes():
+    y = np.sin(np.arange(10_000) / 100.0)
+    y[4321] = 25.0
+    keep = lttb_indices(np.arange(y.size), y, 200)
+    assert keep.size == 200 and keep[0] == 0 and keep[-1] == y.size - 1
+    assert np.all(np.diff(keep) > 0) and 4321 in keep
+
+    y[777] = np.nan
+    keep = minmax_indices(np.column_stack([y, -y]), 50)
+    assert keep[0] == 0 and keep[-1] == y.size - 1 and 4321 in keep and 777 not in keep
+    assert keep.size <= 2 * 50 * 2 + 2
+
+def test_infer_chart_spec_from_dtypes():
+    n = 5000
+    series = pd.DataFrame({"PaymentId": range(n), "Day": pd.date_range("2025-01-01", periods=n, freq="h"),
+                           "Amount": np.random.default_rng(0).normal(size=n)})
+    spec = infer_chart_spec(series, max_points=100)
+    assert (spec["type"], spec["x"]["field"], [y["field"] for y in spec["y"]]) == ("line", "Day", ["Amount"])
+    assert spec["points"] == 100 and spec["rows"] == n and spec["downsampled"] == "lttb"
+    assert spec["data"]["Day"][0] == "2025-01-01T00:00:00.000"
+
+    # ISO date strings (SQLite / mock data) count as time; unsorted input is sorted
+    spec = infer_chart_spec(pd.DataFrame({"When": ["2025-09-08 22:07:57", "2025-08-01 10:00:00"], "Amount": [5.0, 50]}))
+    assert spec["type"] == "line" and spec["data"]["Amount"] == [50, 5]
+
+    bars = pd.DataFrame({"Region": pd.Categorical(["a", "b", "a", "c"]), "Sales": [1, 2, 3, 4.5]})
+    spec = infer_chart_spec(bars, max_categories=2)
+    assert spec["type"] == "bar" and spec["truncated"] and spec["data"] == {"Region": ["c", "a"], "Sales": [4.5, 4]}
+
+    assert infer_chart_spec(pd.DataFrame({"a": range(50), "b": range(50)}), max_points=10)["type"] == "scatter"
+    assert infer_chart_spec(pd.DataFrame({"Total": [5]})) is None                          # single value
+    assert infer_chart_spec(pd.DataFrame({"CustomerId": [1, 2], "Name": ["x", "y"]})) is None  # no measure
+
+def test_id_columns_are_not_measures():
+    assert all(map(is_id_name, ["Id", "ID", "id", "StudentId", "CustomerID", "student_id", "STUDENT_ID", "Store2Id"]))
+    assert not any(map(is_id_name, ["AmountPaid", "TotalPaid", "PAID", "Valid", "Period", "Width"]))
+    spec = infer_chart_spec(pd.DataFrame({"Region": ["a", "b"], "AmountPaid": [1, 2], "StudentId": [7, 8]}))
+    assert [y["field"] for y in spec["y"]] == ["AmountPaid"]
+
+def test_spec_hash_follows_the_data():
+    df = pd.DataFrame({"Region": ["a", "b"], "Sales": [1, 2]})
+    assert spec_hash(infer_chart_spec(df)) == spec_hash(infer_chart_spec(df.copy()))
+    assert spec_hash(infer_chart_spec(df)) != spec_hash(infer_chart_spec(df.assign(Sales=[1, 3])))
+
+def test_arrow_backed_frames():
+    import datetime, decimal
+    import pyarrow as pa
+    from tools.arrow_frames import rows_to_batch, table_to_frame
+    rows = [(datetime.date(2025, 1, 1 + i % 28), decimal.Decimal("1.50") * i, f"r{i % 3}") for i in range(60)]
+    df = table_to_frame(pa.Table.from_batches([rows_to_batch(rows, ["Day", "Amount", "Region"])]))
+    spec = infer_chart_spec(df, max_points=20)
+    assert spec["type"] == "line" and spec["points"] == 20 and spec["data"]["Day"][0] == "2025-01-01T00:00:00.000"
+    assert infer_chart_spec(df[["Region", "Amount"]])["data"]["Amount"] == [855, 885, 915]
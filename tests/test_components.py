@@ -0,0 +1,25 @@
+import asyncio
+import pytest
+from helpers.components import ComponentRegistry
+from helpers.errors import ComponentUnavailable
+
+def test_lazy_build_and_failure_isolation():
+    built = []
+    reg = ComponentRegistry(retry_after_seconds=0)
+    reg.register("config", lambda: built.append("config") or {"x": 1})
+    reg.register("client", lambda: {"cfg": reg.get("config")})
+    reg.register("disabled", lambda: None)
+    reg.register("index", lambda: 1 / 0, required=False)
+    reg.register("db", lambda: 1 / 0)
+    assert built == []                      # nothing built at registration
+
+    status = asyncio.run(reg.warm_up())
+    assert built == ["config"]              # shared dependency built once
+    assert status["client"]["state"] == "ready" and status["disabled"]["state"] == "disabled"
+    assert reg.get("index") is None         # optional failure degrades to None
+    assert not reg.ready() and "ZeroDivisionError" in status["db"]["error"]
+    with pytest.raises(ComponentUnavailable):
+        reg.get("db")
+
+    reg.override("db", object())
+    assert reg.ready()
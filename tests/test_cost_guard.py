@@ -0,0 +1,45 @@
+import pytest
+from helpers.errors import QueryTooExpensive
+from tools.cost_guard import CostGuard, StaticPlanProvider, parse_showplan_xml
+
+PLAN = """<ShowPlanXML xmlns="http://schemas.microsoft.com/sqlserver/2004/07/showplan" Version="1.5">
+  <BatchSequence><Batch><Statements>
+    <StmtSimple StatementText="SELECT * FROM epay.Payments" StatementEstRows="812345" StatementSubTreeCost="42.5"/>
+  </Statements></Batch></BatchSequence>
+</ShowPlanXML>"""
+
+def _guard(**kwargs):
+    provider = StaticPlanProvider({"epay.Payments": 50_000_000}, cost_per_row=0.00001)
+    return CostGuard(provider, max_estimated_rows=1_000_000, max_subtree_cost=100, limit_rows=500, **kwargs)
+
+def test_parse_showplan_xml():
+    plan = parse_showplan_xml(PLAN)
+    assert plan.estimated_rows == 812345 and plan.subtree_cost == 42.5
+
+def test_limits_plain_selects_and_rejects_aggregates():
+    guard = _guard()
+    assert guard.check("SELECT Id FROM dbo.Students").action == "pass"
+    verdict = guard.check("SELECT Id, Amount FROM epay.Payments")
+    assert verdict.action == "limited" and "TOP 500" in verdict.sql
+    with pytest.raises(QueryTooExpensive):
+        guard.check("SELECT Status, SUM(Amount) FROM epay.Payments GROUP BY Status")
+    with pytest.raises(QueryTooExpensive):
+        _guard(action="reject").check("SELECT Id, Amount FROM epay.Payments")
+    assert guard.stats()["limited"] == 1 and guard.stats()["rejected"] == 1
+
+def test_plan_cache_and_fail_open():
+    class Flaky:
+        calls = 0
+        def estimate(self, sql):
+            Flaky.calls += 1
+            raise RuntimeError("no showplan permission")
+
+    guard = CostGuard(Flaky(), cache_size=16)
+    assert guard.check("SELECT 1").action == "pass"
+    with pytest.raises(QueryTooExpensive):
+        CostGuard(Flaky(), fail_open=False).check("SELECT 1")
+
+    cached = _guard()
+    cached.check("SELECT Id FROM dbo.Students WHERE Id = 1")
+    cached.check("select  Id from dbo.Students where Id = 1")  # same fingerprint
+    assert cached.stats()["plan_cache"]["hits"] == 1
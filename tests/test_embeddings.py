@@ -0,0 +1,39 @@
+import threading
+import numpy as np
+from tools.embeddings import CachedQueryEmbedder
+
+class SlowEmbedder:
+    def __init__(self):
+        self.calls = []
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        threading.Event().wait(0.02)
+        return np.array([[len(t), 1.0] for t in texts], dtype=np.float32)
+
+def test_lru_keyed_by_normalized_text():
+    embed = SlowEmbedder()
+    cached = CachedQueryEmbedder(embed, window_ms=0)
+    a = cached(["Total payments?"])
+    b = cached(["  total   PAYMENTS "])
+    assert np.array_equal(a, b) and len(embed.calls) == 1
+
+def test_concurrent_queries_share_a_batch():
+    embed = SlowEmbedder()
+    cached = CachedQueryEmbedder(embed, window_ms=50)
+    threads = [threading.Thread(target=cached, args=([f"question {i % 5}"],)) for i in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(len(c) for c in embed.calls) <= 10
+    assert len(embed.calls) < 5
+
+def test_prime_embeds_a_batch_in_one_call():
+    embed = SlowEmbedder()
+    cached = CachedQueryEmbedder(embed, window_ms=0, max_batch=64)
+    cached(["question 0"])
+    questions = [f"Question {i}?" for i in range(200)] + ["question 5"]
+    assert cached.prime(questions) == 199
+    assert len(embed.calls) == 2 and len(embed.calls[1]) == 199      # one pass, past max_batch
+    cached(questions)
+    assert len(embed.calls) == 2 and cached.stats()["primed"] == 199
@@ -0,0 +1,30 @@
+import datetime
+import decimal
+import gzip
+import io
+import pyarrow as pa
+import pyarrow.parquet as pq
+from tools.arrow_frames import conform_batch, rows_to_batch, schema_from_description, stream_schema
+from tools.exporter import encode_batches, gzip_chunks
+
+def _batches():
+    schema = stream_schema(rows_to_batch([(1, None), (2, None)], ["id", "note"]))   # all-NULL column → text
+    yield conform_batch(rows_to_batch([(1, None), (2, None)], ["id", "note"]), schema)
+    yield conform_batch(rows_to_batch([(3, "x")], ["id", "note"]), schema)
+
+def test_csv_parquet_and_arrow_round_trip():
+    csv = b"".join(encode_batches(_batches(), "csv"))
+    assert csv.decode().splitlines() == ['"id","note"', "1,", "2,", '3,"x"']
+    table = pq.read_table(io.BytesIO(b"".join(encode_batches(_batches(), "parquet", row_group_rows=2))))
+    assert table.num_rows == 3 and pq.ParquetFile(io.BytesIO(b"".join(
+        encode_batches(_batches(), "parquet", row_group_rows=2)))).num_row_groups == 2
+    assert pa.ipc.open_stream(b"".join(encode_batches(_batches(), "arrow"))).read_all().column("note").to_pylist() \
+        == [None, None, "x"]
+    assert gzip.decompress(b"".join(gzip_chunks(encode_batches(_batches(), "csv")))) == csv
+
+def test_schema_from_pyodbc_description():
+    description = [("Id", int, None, 10, 10, 0, False), ("Amount", decimal.Decimal, None, 18, 18, 2, True),
+                   ("At", datetime.datetime, None, 23, 23, 3, True)]
+    schema = schema_from_description(description)
+    assert [str(f.type) for f in schema] == ["int64", "decimal128(18, 2)", "timestamp[us]"]
+    assert schema_from_description([("x", None, None, None, None, None, None)]) is None   # SQLite reports no types
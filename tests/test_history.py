@@ -0,0 +1,21 @@
+from sqlalchemy import create_engine, func, select
+from db.history import HistoryStore
+from db.models import Base, ChatMessage
+
+def test_write_behind_ring_and_retention(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'h.sqlite3'}")
+    Base.metadata.create_all(engine)
+    store = HistoryStore(engine, max_messages_per_session=4, flush_interval_ms=5)
+    for i in range(10):
+        store.append("s1", "user" if i % 2 == 0 else "assistant", f"m{i}")
+    store.append("s2", "user", "other")
+    assert [m["content"] for m in store.recent("s1", limit=2)] == ["m8", "m9"]
+
+    store.close()
+    with engine.connect() as conn:
+        assert conn.execute(select(func.count()).where(ChatMessage.session_id == "s1")).scalar() == 4
+    # a fresh process sees the retained tail from SQLite
+    reloaded = HistoryStore(engine, max_messages_per_session=4)
+    assert [m["content"] for m in reloaded.recent("s1")] == ["m6", "m7", "m8", "m9"]
+    assert reloaded.recent("s2") == [{"role": "user", "content": "other"}]
+    reloaded.close()
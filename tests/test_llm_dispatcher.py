@@ -0,0 +1,133 @@
+import asyncio
+import httpx
+import pytest
+from openai import RateLimitError
+from services.llm.dispatcher import RateLimitDispatcher, TokenBucket, parse_duration
+
+class Raw:
+    def __init__(self, headers=None):
+        self.headers = headers or {}
+
+    def parse(self):
+        return "ok"
+
+def _rate_limit_error(retry_after_ms="10"):
+    request = httpx.Request("POST", "http://llm/v1/chat/completions")
+    response = httpx.Response(429, headers={"retry-after-ms": retry_after_ms}, request=request)
+    return RateLimitError("rate limited", response=response, body=None)
+
+def test_parse_duration_and_bucket_reservations():
+    assert parse_duration("6m0s") == 360 and parse_duration("20ms") == 0.02 and parse_duration("1.5") == 1.5
+    now = [0.0]
+    bucket = TokenBucket(60, clock=lambda: now[0])      # one per second, burst of 60
+    assert [bucket.reserve(30), bucket.reserve(30)] == [0.0, 0.0]
+    assert bucket.reserve(2) == pytest.approx(2.0)     # queued behind the empty bucket
+    now[0] = 10
+    bucket.cap(1)                                       # provider: only 1 request left
+    assert bucket.reserve(2) == pytest.approx(1.0)
+
+def test_headers_lower_the_budget_and_429s_back_off():
+    d = RateLimitDispatcher("p", requests_per_minute=1000, initial_concurrency=8, backoff_seconds=0.001)
+    d.observe_headers({"x-ratelimit-limit-requests": "100", "x-ratelimit-remaining-requests": "5"})
+    assert d.requests.per_minute == 100 and d.requests.level == 5
+
+    calls = []
+
+    async def send():
+        calls.append(1)
+        if len(calls) == 1:
+            raise _rate_limit_error()
+        return Raw()
+
+    assert asyncio.run(d.acall(send, [{"role": "user", "content": "hi"}])) == "ok"
+    stats = d.stats()
+    assert stats["rate_limited"] == 1 and stats["retries"] == 1 and len(calls) == 2
+    assert 4 <= stats["concurrency_limit"] < 5       # halved from 8, then one additive step
+
+def test_gives_up_after_max_retries():
+    d = RateLimitDispatcher("p", max_retries=1, backoff_seconds=0.001)
+
+    def send():
+        raise _rate_limit_error("1")
+
+    with pytest.raises(RateLimitError):
+        d.call(send, [])
+    assert d.stats()["retries"] == 1
+
+class Chunk:
+    def __init__(self, usage=None):
+        self.usage = usage
+
+class Usage:
+    total_tokens = 50
+
+class Stream:
+    def __init__(self, n):
+        self.chunks = [Chunk() for _ in range(n)] + [Chunk(Usage())]
+        self.closed = False
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for chunk in self.chunks:
+            yield chunk
+
+    async def close(self):
+        self.closed = True
+
+class StreamRaw(Raw):
+    def __init__(self, stream):
+        super().__init__()
+        self.stream = stream
+
+    def parse(self):
+        return self.stream
+
+def test_streams_hold_the_slot_and_settle_from_usage():
+    d = RateLimitDispatcher("p", tokens_per_minute=10_000, completion_token_reserve=400, clock=lambda: 0.0)
+    messages = [{"role": "user", "content": "hi"}]
+    estimate = d.estimate(messages)
+
+    async def consume(stream, stop_after=None):
+        async def send():
+            return StreamRaw(stream)
+        seen = []
+        chunks = d.astream(send, messages)
+        async for chunk in chunks:
+            seen.append(d.limit.in_flight)
+            if stop_after is not None and len(seen) == stop_after:
+                await chunks.aclose()
+                break
+        return seen
+
+    stream = Stream(3)
+    assert asyncio.run(consume(stream)) == [1, 1, 1, 1] and d.limit.in_flight == 0 and stream.closed
+    assert d.tokens.level == 10_000 - 50            # estimate taken up front, refunded down to the real usage
+
+    stream = Stream(3)
+    assert asyncio.run(consume(stream, stop_after=1)) == [1] and d.limit.in_flight == 0 and stream.closed
+    assert d.tokens.level == 10_000 - 50 - estimate  # stopped before the usage chunk: the estimate stands
+
+def test_failed_attempts_give_back_their_reservation():
+    d = RateLimitDispatcher("p", requests_per_minute=100, tokens_per_minute=10_000, backoff_seconds=0.001,
+                            clock=lambda: 0.0)
+    messages = [{"role": "user", "content": "hi"}]
+    calls = []
+
+    async def send():
+        calls.append(1)
+        if len(calls) <= 2:
+            raise _rate_limit_error("1")
+        return Raw()
+
+    assert asyncio.run(d.acall(send, messages)) == "ok" and len(calls) == 3
+    # three attempts, one charge: only the call that went through counts against the buckets
+    assert d.requests.level == 99 and d.tokens.level == 10_000 - d.estimate(messages)
+
+    def failing():
+        raise _rate_limit_error("1")
+
+    with pytest.raises(RateLimitError):
+        d.call(failing, messages)
+    assert d.requests.level == 99 and d.tokens.level == 10_000 - d.estimate(messages)
@@ -0,0 +1,77 @@
+import asyncio
+from services.llm.base import LLMService
+from services.llm.router import CircuitBreaker, LLMRouter
+
+class Fake(LLMService):
+    def __init__(self, name, delay=0.0, fail=False):
+        self.provider_name, self.model, self.delay, self.fail, self.cancelled = name, "m", delay, fail, 0
+
+    def chat(self, messages, temperature=0.0):
+        raise NotImplementedError
+
+    async def achat(self, messages, temperature=0.0):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.fail:
+            raise RuntimeError(f"{self.provider_name} down")
+        return self.provider_name
+
+def test_hedges_slow_primary_and_cancels_the_loser():
+    slow, fast = Fake("slow", delay=0.5), Fake("fast", delay=0.01)
+    router = LLMRouter([slow, fast], hedge_min_delay_seconds=0.05, hedge_default_delay_seconds=0.05)
+    assert asyncio.run(router.achat([])) == "fast"
+    stats = router.routing_stats()
+    assert stats["hedges"] == 1 and slow.cancelled == 1 and stats["backends"]["fast:m"]["wins"] == 1
+
+def test_failover_and_circuit_breaker():
+    down, up = Fake("down", fail=True), Fake("up")
+    router = LLMRouter([down, up], hedge=False, breaker_failures=2, breaker_reset_seconds=60)
+
+    async def main():
+        return [await router.achat([]) for _ in range(3)]
+
+    assert asyncio.run(main()) == ["up", "up", "up"]
+    stats = router.routing_stats()
+    assert stats["failovers"] == 2 and stats["backends"]["down:m"]["calls"] == 2   # breaker opened after 2 errors
+    assert stats["backends"]["down:m"]["breaker"] == "open"
+
+def test_breaker_half_open_probe():
+    now = [0.0]
+    breaker = CircuitBreaker(failures=1, reset_seconds=10, clock=lambda: now[0])
+    breaker.failure()
+    assert not breaker.allow()
+    now[0] = 11
+    assert breaker.allow() and not breaker.allow()     # one probe at a time
+    breaker.success()
+    assert breaker.state == "closed"
+
+def test_sql_json_is_parsed_by_the_answering_backend():
+    class JsonFake(Fake):
+        async def achat(self, messages, temperature=0.0):
+            await super().achat(messages, temperature)
+            return '{"sql": "SELECT 1", "confidence": 0.8}'
+
+    router = LLMRouter([Fake("down", fail=True), JsonFake("json")], hedge=False)
+    out = asyncio.run(router.agenerate_sql_json([]))
+    assert (out["sql"], out["confidence"], out["needs_clarification"]) == ("SELECT 1", 0.8, False)
+
+    out = asyncio.run(LLMRouter([Fake("down", fail=True)], hedge=False).agenerate_sql_json([]))
+    assert out["sql"] is None and out["needs_clarification"] and "down" in out["notes"]
+
+def test_sync_chat_only_claims_the_probe_it_uses():
+    class SyncFake(Fake):
+        def chat(self, messages, temperature=0.0):
+            return self.provider_name
+
+    now = [0.0]
+    a, b = SyncFake("a"), SyncFake("b")
+    router = LLMRouter([a, b], hedge=False, breaker_failures=1, breaker_reset_seconds=10)
+    for backend in router.backends:
+        backend.breaker.clock = lambda: now[0]
+        backend.breaker.failure()
+    now[0] = 11                                          # both half-open
+    assert router.chat([]) == "a"
+    assert router.backends[1].breaker.state == "half_open" and router.backends[1].breaker.allow()
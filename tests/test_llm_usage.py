@@ -0,0 +1,14 @@
+from types import SimpleNamespace as NS
+from services.llm.usage import PromptCacheUsage
+
+def test_cached_tokens_openai_and_deepseek():
+    usage = PromptCacheUsage()
+    usage.record("openai", NS(prompt_tokens=2000, completion_tokens=50,
+                              prompt_tokens_details=NS(cached_tokens=1536)))
+    usage.record("deepseek", NS(prompt_tokens=1000, completion_tokens=20, prompt_tokens_details=None,
+                                prompt_cache_hit_tokens=640))
+    usage.record("ollama", None)
+    stats = usage.stats()
+    assert stats["openai"]["cache_hit_rate"] == 0.768
+    assert stats["deepseek"]["cached_tokens"] == 640
+    assert "ollama" not in stats
@@ -0,0 +1,16 @@
+import logging
+import queue
+from helpers.logging import _InProcessQueueHandler
+
+def test_queued_records_keep_exc_info_for_rich_tracebacks():
+    records = queue.SimpleQueue()
+    logger = logging.getLogger("test-queue-handler")
+    logger.propagate = False
+    logger.addHandler(_InProcessQueueHandler(records))
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        logger.exception("failed %s", "here")
+    record = records.get_nowait()
+    assert record.getMessage() == "failed here" and record.args is None
+    assert record.exc_info[0] is ZeroDivisionError and "Traceback" not in record.msg
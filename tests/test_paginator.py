@@ -0,0 +1,57 @@
+import pytest
+from helpers.errors import PaginationError
+from tools.paginator import (first_page_sql, derive_key_columns, keyset_page_sql,
+                             encode_cursor, decode_cursor)
+
+COLS = {"epay.Payments": {"PaymentId", "Amount", "StudentId"},
+        "dbo.Students": {"Id", "Name"},
+        "dbo.Enrollments": {"Id", "StudentId"}}
+FKS = {"epay.Payments": [("StudentId", "dbo.Students", "Id")],
+       "dbo.Enrollments": [("StudentId", "dbo.Students", "Id")]}
+
+def test_first_page_is_plain_top():
+    assert first_page_sql("SELECT Id, Name FROM dbo.Students", 200) == "SELECT TOP 200 Id, Name FROM dbo.Students"
+    assert first_page_sql("SELECT TOP 5 Id FROM dbo.Students", 200) == "SELECT TOP 5 Id FROM dbo.Students"
+    assert "ORDER BY Name" in first_page_sql("SELECT Id, Name FROM dbo.Students ORDER BY Name", 200)
+    # COUNT(*) has no column name, so it must not be wrapped in a derived table
+    assert first_page_sql("SELECT COUNT(*) FROM dbo.Students", 200) == "SELECT TOP 200 COUNT(*) FROM dbo.Students"
+
+def test_key_from_fk_join_is_root_key():
+    sql = "SELECT p.PaymentId, p.Amount, s.Name FROM epay.Payments p JOIN dbo.Students s ON p.StudentId = s.Id"
+    assert derive_key_columns(sql, COLS, FKS) == ["PaymentId"]
+    assert derive_key_columns(sql + " AND (s.Name <> '' AND p.Amount > 0)", COLS, FKS) == ["PaymentId"]
+
+def test_fk_equality_under_or_is_not_many_to_one():
+    # any payment can match several students here, so PaymentId alone is not unique
+    sql = ("SELECT p.PaymentId, p.Amount, s.Name FROM epay.Payments p "
+           "JOIN dbo.Students s ON p.StudentId = s.Id OR p.Amount = s.Id")
+    assert derive_key_columns(sql, COLS, FKS) is None
+    sql = ("SELECT p.PaymentId, s.Id AS StudentId FROM epay.Payments p "
+           "JOIN dbo.Students s ON (p.StudentId = s.Id OR s.Name = 'x')")
+    assert derive_key_columns(sql, COLS, FKS) == ["PaymentId", "StudentId"]
+
+def test_key_for_non_fk_join_needs_all_keys():
+    sql = "SELECT s.Id AS StudentId, e.Id AS EnrollId FROM dbo.Students s JOIN dbo.Enrollments e ON e.StudentId = s.Id"
+    assert derive_key_columns(sql, COLS, FKS) == ["StudentId", "EnrollId"]
+
+@pytest.mark.parametrize("sql", [
+    "SELECT Name FROM dbo.Students",
+    "SELECT COUNT(*) AS n FROM dbo.Students",
+    "SELECT Id, Name FROM dbo.Students ORDER BY Name",
+    "SELECT DISTINCT Id FROM dbo.Students",
+])
+def test_no_key(sql):
+    assert derive_key_columns(sql, COLS, FKS) is None
+
+def test_keyset_page_sql():
+    sql, params = keyset_page_sql("SELECT * FROM t;", ["a", "b"], [1, 2], 50)
+    assert sql == ("SELECT TOP (50) * FROM (SELECT * FROM t) AS _q "
+                   "WHERE (_q.[a] > :k0) OR (_q.[a] = :k0 AND _q.[b] > :k1) ORDER BY _q.[a], _q.[b]")
+    assert params == {"k0": 1, "k1": 2}
+    with pytest.raises(PaginationError):
+        keyset_page_sql("SELECT * FROM t", ["a"], [1, 2], 50)
+
+def test_cursor_roundtrip():
+    assert decode_cursor(encode_cursor({"after": [7, "x"]})) == {"after": [7, "x"]}
+    with pytest.raises(PaginationError):
+        decode_cursor("not a cursor")
@@ -4,3 +4,32 @@ def test_prompt_build():
     schema = {"DatabaseSchema":[{"TableName":"Students","Columns":[{"ColumnName":"ID"},{"ColumnName":"Name"}]}]}
     msgs = build_sql_generation_messages("Show students", schema)
     assert any("ONLY SELECT" in m["content"] for m in msgs if m["role"]=="system")
+
+def test_compact_excerpt_respects_budget():
+    from tools.prompt_builders import build_schema_excerpt_with_stats
+    schema = {"DatabaseSchema": [
+        {"SchemaName": "dbo", "TableName": "Students", "Columns": {"Id": "int", "Name": "nvarchar(100)"}},
+        {"SchemaName": "epay", "TableName": "Payments", "Columns": {"Id": "int", "StudentId": "int", "Amount": "money"},
+         "ForeignKeys": [{"ParentColumn": "StudentId", "ReferencedTable": "dbo.Students", "ReferencedColumn": "Id"}]},
+        {"SchemaName": "hr", "TableName": "Staff", "Columns": {"Id": "int", "Salary": "money"}},
+    ]}
+    text, stats = build_schema_excerpt_with_stats("total payment amount", schema, mode="compact", token_budget=60)
+    assert "epay.Payments: Id int, StudentId int, Amount money" in text
+    assert text.count("epay.Payments.StudentId -> dbo.Students.Id") == 1
+    assert "hr.Staff" not in text and stats["dropped_tables"] >= 1
+    assert stats["tokens"] <= 60 and stats["tokens_saved"] > 0
+
+def test_generation_messages_share_static_prefix():
+    a = build_sql_generation_messages("q1", {}, schema_excerpt="A: x int")
+    b = build_sql_generation_messages("q2", {}, schema_excerpt="B: y int",
+                                      history=[{"role": "user", "content": "earlier"}])
+    assert a[0] == b[0]
+    assert [m["role"] for m in b] == ["system", "system", "user", "user"]
+    assert b[-1]["content"] == "User request: q2"
+
+def test_beautify_instructions_follow_the_result_format():
+    from tools.prompt_builders import build_beautify_messages
+    table = build_beautify_messages("q", "SELECT 1", "| a |")[0]["content"]
+    profile = build_beautify_messages("q", "SELECT 1", "- a (number, int64): min 1", result_format="profile")[0]["content"]
+    assert "clean markdown table of the preview" in table and "column profile" not in table
+    assert "column profile" in profile and "already provided as markdown" not in profile
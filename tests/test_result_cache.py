@@ -0,0 +1,37 @@
+import pandas as pd
+from tools.result_cache import ResultCache, sql_fingerprint
+
+def test_fingerprint_ignores_whitespace_aliases_and_literal_order():
+    a = "SELECT s.ID, s.Name FROM Students s WHERE s.ID IN (3, 1, 2) AND s.Name = 'x'"
+    b = "select x.ID, x.Name\nfrom Students x\nwhere x.Name = 'x' and x.ID in (1,2,3);"
+    assert sql_fingerprint(a) == sql_fingerprint(b)
+    assert sql_fingerprint(a) != sql_fingerprint("SELECT s.ID FROM Students s")
+
+def test_roundtrip_and_paging_key():
+    cache = ResultCache()
+    df = pd.DataFrame({"ID": [1, 2], "Name": ["a", "b"]})
+    assert cache.put("SELECT * FROM Students", 1, 200, df=df)
+    # frames come back Arrow-backed, same values
+    pd.testing.assert_frame_equal(cache.get("select *  from Students", 1, 200), df, check_dtype=False)
+    assert cache.get("SELECT * FROM Students", 2, 200) is None
+
+def test_byte_budget_evicts_oldest():
+    df = pd.DataFrame({"v": range(2000)})
+    probe = ResultCache(compression=None)
+    probe.put("SELECT v FROM T", df=df)
+    size = probe.stats()["bytes"]
+    cache = ResultCache(compression=None, max_bytes=int(size * 2.5))
+    for i in range(3):
+        cache.put(f"SELECT v FROM T WHERE v > {i}", df=df)
+    assert cache.get("SELECT v FROM T WHERE v > 0") is None
+    assert cache.get("SELECT v FROM T WHERE v > 2") is not None
+    assert cache.stats()["bytes"] <= cache.stats()["max_bytes"]
+
+def test_invalidate_by_table():
+    cache = ResultCache()
+    df = pd.DataFrame({"x": [1]})
+    cache.put("SELECT x FROM BS.Budgets", df=df)
+    cache.put("SELECT x FROM dbo.Students", df=df)
+    assert cache.invalidate_table("BS.Budgets") == 1
+    assert cache.get("SELECT x FROM BS.Budgets") is None
+    assert cache.get("SELECT x FROM dbo.Students") is not None
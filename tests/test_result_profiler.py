@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+from helpers.tokens import estimate_tokens
+from tools.result_profiler import build_result_context, profile_frame
+
+def _payments(n=1000):
+    return pd.DataFrame({
+        "PaymentId": [f"p{i}" for i in range(n)],
+        "Amount": np.arange(n) * 0.5,
+        "Region": pd.Categorical(np.where(np.arange(n) % 4 == 0, "North", "South")),
+        "Paid": np.arange(n) % 2 == 0,
+        "TransactionDate": pd.date_range("2025-01-01", periods=n, freq="D"),
+        "StudentId": np.arange(n) % 10,
+        "AmountPaid": np.full(n, 2.0),
+    })
+
+def test_profile_covers_every_row():
+    df = _payments()
+    df.loc[::10, "Amount"] = np.nan
+    cols = {c["name"]: c for c in profile_frame(df, top_k=2)["columns"]}
+    assert cols["Amount"]["kind"] == "number" and cols["Amount"]["max"] == 499.5 and cols["Amount"]["nulls"] == 0.1
+    assert cols["Region"]["top"] == [("South", 750), ("North", 250)]
+    assert cols["Paid"]["true"] == 0.5 and cols["StudentId"] == {"name": "StudentId", "dtype": "int64", "nulls": 0.0, "kind": "id", "distinct": 10}
+    assert cols["AmountPaid"]["kind"] == "number" and cols["AmountPaid"]["sum"] == 2000
+    assert (cols["TransactionDate"]["min"], cols["TransactionDate"]["max"]) == (pd.Timestamp("2025-01-01"), pd.Timestamp("2027-09-27"))
+
+def test_result_context_stays_within_budget():
+    text, stats = build_result_context(_payments(), has_more=True, token_budget=400, sample_rows=10)
+    assert "Rows fetched: 1,000 (more rows exist beyond these)" in text
+    assert "- Amount (number, float64): min 0, max 499.5, mean 249.8, sum 249,750" in text
+    assert "- TransactionDate (datetime, datetime64[us]): 2025-01-01 → 2027-09-27" in text
+    assert 0 < stats["sample_rows"] <= 10 and stats["tokens"] <= 400
+
+    wide = pd.DataFrame(np.ones((5, 200)), columns=[f"Col{i}" for i in range(200)])
+    text, stats = build_result_context(wide, token_budget=300)
+    assert stats["tokens"] <= 300 and stats["sample_rows"] == 0
+    assert f"{200 - stats['columns_profiled']} more columns not profiled" in text
+    assert estimate_tokens(text) == stats["tokens"]
+
+def test_sample_rows_show_missing_values_as_null():
+    import datetime
+    import pyarrow as pa
+    df = pd.DataFrame({
+        "Name": pd.array(["Al", None], dtype=pd.ArrowDtype(pa.string())),
+        "Paid": pd.array([None, datetime.date(2025, 1, 2)], dtype=pd.ArrowDtype(pa.date32())),
+        "Note": ["x", None],
+        "Amount": [1.5, None],
+    })
+    text, stats = build_result_context(df, sample_rows=2)
+    sample = text[text.index("Sample rows"):]
+    assert stats["sample_rows"] == 2 and "nan" not in sample.lower() and "None" not in sample
+    assert sample.count("NULL") == 4 and "2025-01-02" in sample
@@ -0,0 +1,30 @@
+import numpy as np
+from tools.schema_retriever import SchemaRetriever
+
+def _schema(*tables):
+    return {"DatabaseSchema": [{"SchemaName": "dbo", "TableName": t, "Columns": cols} for t, cols in tables]}
+
+class CountingEmbedder:
+    def __init__(self):
+        self.seen = []
+    def __call__(self, texts):
+        self.seen += list(texts)
+        return np.array([[len(t), sum(map(ord, t)) % 97, 1.0] for t in texts], dtype=np.float32)
+
+def test_numpy_sync_reembeds_only_changes(tmp_path):
+    embed = CountingEmbedder()
+    base = _schema(("A", {"Id": "int"}), ("B", {"Id": "int"}), ("C", {"Id": "int"}))
+    r = SchemaRetriever(base, persist_path=str(tmp_path), backend="numpy", embedding_fn=embed)
+    assert len(embed.seen) == 3
+
+    embed.seen.clear()
+    stats = r.sync(_schema(("A", {"Id": "int"}), ("B", {"Id": "int", "Name": "nvarchar"}), ("D", {"Id": "int"})))
+    assert (stats["added"], stats["updated"], stats["deleted"], stats["unchanged"]) == (1, 1, 1, 1)
+    assert sorted(d.split(". ")[1] for d in embed.seen) == ["Table: dbo.B", "Table: dbo.D"]
+    assert [rec["table"] for rec in r.index.records] == ["dbo.A", "dbo.B", "dbo.D"]
+
+    # a restart against the same schema embeds nothing
+    embed.seen.clear()
+    SchemaRetriever(_schema(("A", {"Id": "int"}), ("B", {"Id": "int", "Name": "nvarchar"}), ("D", {"Id": "int"})),
+                    persist_path=str(tmp_path), backend="numpy", embedding_fn=embed)
+    assert embed.seen == []
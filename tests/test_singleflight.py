@@ -0,0 +1,43 @@
+import asyncio
+import pytest
+from helpers.singleflight import SingleFlight
+
+def test_concurrent_callers_share_one_run():
+    sf, calls = SingleFlight(), []
+
+    async def work(tag):
+        calls.append(tag)
+        await asyncio.sleep(0.01)
+        return tag
+
+    async def main():
+        same = await asyncio.gather(*(sf.do("q", lambda: work("a")) for _ in range(5)))
+        other = await sf.do("q", lambda: work("b"))   # first run finished → new run
+        return same, other
+
+    same, other = asyncio.run(main())
+    assert same == ["a"] * 5 and other == "b" and calls == ["a", "b"]
+    assert sf.stats() == {"leaders": 2, "followers": 4, "inflight": 0}
+
+def test_errors_are_shared_and_cancelled_waiters_do_not_cancel_the_run():
+    sf = SingleFlight()
+
+    async def boom():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def slow():
+        await asyncio.sleep(0.02)
+        return 42
+
+    async def main():
+        results = await asyncio.gather(sf.do("e", boom), sf.do("e", boom), return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+        leader = asyncio.ensure_future(sf.do("s", slow))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(sf.do("s", slow))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(main()) == 42
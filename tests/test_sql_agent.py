@@ -0,0 +1,340 @@
+import asyncio
+import orjson
+import pandas as pd
+import pyarrow as pa
+import pytest
+import agents.sql_agent as agent
+from helpers.errors import ExecutionError
+from helpers.formatting import format_sse
+from tools.cost_guard import CostGuard, StaticPlanProvider
+
+SQL = "SELECT Id, LastUpdateDate, LastUser FROM BS.ApprovedTestBudgets"
+
+
+class StubLLM:
+    def __init__(self, sql=SQL):
+        self.sql = sql
+
+    async def agenerate_sql_json(self, messages, temperature=0.0):
+        return {"sql": self.sql, "confidence": 1.0, "needs_clarification": False, "notes": ""}
+
+    async def amarkdown(self, messages, temperature=0.0):
+        return "summary"
+
+    async def amarkdown_stream(self, messages, temperature=0.0):
+        for token in ("sum", "mary"):
+            yield token
+
+
+class StubExecutor:
+    result_cache = None
+
+    def __init__(self, rows=3):
+        self.rows = rows
+        self.sqls = []
+
+    async def arun_select(self, sql, page, page_size, hard_cap):
+        self.sqls.append(sql)
+        await asyncio.sleep(0)
+        return pd.DataFrame({"Id": range(self.rows), "LastUser": [f"u{i}" for i in range(self.rows)]})
+
+    def iter_export(self, sql, max_rows):
+        self.sqls.append(sql)
+        yield pa.RecordBatch.from_pydict({"Id": list(range(self.rows))})
+
+    async def aiterate(self, iterator):
+        for item in iterator:
+            yield item
+
+
+class StubHistory:
+    def __init__(self):
+        self.messages = {}
+
+    async def aappend(self, session_id, role, content, provider=None, model=None):
+        self.messages.setdefault(session_id, []).append({"role": role, "content": content})
+
+    async def arecent(self, session_id, limit=None):
+        return list(self.messages.get(session_id, []))[-(limit or 10):]
+
+
+class StubGraph:
+    """query_graph stand-in: replays node updates, then optionally raises."""
+
+    def __init__(self, updates, error=None):
+        self.updates, self.error = updates, error
+
+    async def astream(self, state, stream_mode="updates"):
+        for update in self.updates:
+            yield update
+        if self.error is not None:
+            raise self.error
+
+
+def _node_updates(rows=3):
+    df = pd.DataFrame({"Id": range(rows), "LastUser": [f"u{i}" for i in range(rows)]})
+    return [{"generate_sql": {"sql": SQL}}, {"validate": {"sql": SQL}},
+            {"cost_guard": {"exec_sql": None, "limit_reason": None}},
+            {"execute": {"df": df, "query_id": "q1", "has_more": False}}]
+
+
+def _collect(stream):
+    async def run():
+        return [item async for item in stream]
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def stubs():
+    llm, executor, history = StubLLM(), StubExecutor(), StubHistory()
+    for name, value in (("llm", llm), ("executor", executor), ("history", history), ("retriever", None),
+                        ("sql_cache", None), ("result_cache", None), ("cost_guard", None)):
+        agent.components.override(name, value)
+    return llm, executor, history
+
+
+def test_cost_guard_limit_is_execution_only(stubs):
+    _, executor, _ = stubs
+    # page 1 (TOP 200) costs 0.2 > 0.15 → limited to TOP 100; the handle keeps the validated SQL
+    guard = CostGuard(StaticPlanProvider({"BS.ApprovedTestBudgets": 50_000_000}, cost_per_row=0.001),
+                      max_subtree_cost=0.15, limit_rows=100)
+    agent.components.override("cost_guard", guard)
+    response = asyncio.run(agent.run_agent("guard", "show budgets"))
+    assert response["ok"] and response["limit_reason"].startswith("Limited to 100 rows")
+    assert "TOP 100" in executor.sqls[-1]
+    assert agent.query_registry.get(response["query_id"]).sql == SQL
+
+    async def export():
+        stream, reason = await agent.export_query(response["query_id"], "csv")
+        return b"".join([chunk async for chunk in stream]), reason
+    body, reason = asyncio.run(export())
+    assert body.startswith(b'"Id"') and reason and "TOP 100" in executor.sqls[-1]
+
+
+def test_stream_agent_event_order(stubs, monkeypatch):
+    monkeypatch.setattr(agent, "query_graph", StubGraph(_node_updates()))
+    # "summarize" keeps the template answer out of the way: the tokens come from the LLM stream
+    events = _collect(agent.stream_agent("stream", "summarize budgets"))
+    assert [e for e, _ in events] == ["status", "status", "sql", "status", "preview", "status",
+                                      "token", "token", "done"]
+    assert [d["stage"] for e, d in events if e == "status"] == ["generate_sql", "validate", "execute", "beautify"]
+    data = dict(events)
+    assert data["sql"] == {"sql": SQL, "limit_reason": None}
+    assert data["preview"]["columns"] == ["Id", "LastUser"] and data["preview"]["row_count"] == 3
+    assert [d["text"] for e, d in events if e == "token"] == ["sum", "mary"]
+    assert data["done"]["ok"] and data["done"]["markdown"] == "summary" and data["done"]["query_id"] == "q1"
+    assert data["done"]["answer_source"] == "llm"
+    _, _, history = stubs
+    assert [m["role"] for m in history.messages["stream"]] == ["user", "assistant"]
+
+
+def test_stream_agent_error_event(stubs, monkeypatch):
+    monkeypatch.setattr(agent, "query_graph", StubGraph(_node_updates()[:1], error=ExecutionError("db down")))
+    events = _collect(agent.stream_agent("stream-err", "summarize budgets"))
+    assert [e for e, _ in events] == ["status", "status", "error"]
+    assert events[-1][1] == {"ok": False, "error": "Execution error: db down"}
+
+
+def test_chat_stream_endpoint_sse_frames(stubs, monkeypatch):
+    import httpx
+    import main
+    monkeypatch.setattr(agent, "query_graph", StubGraph(_node_updates()))
+    assert format_sse("token", {"text": "hé"}) == b'event: token\ndata: {"text":"h\xc3\xa9"}\n\n'
+
+    async def post():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/api/chat/stream", json={"session_id": "sse", "message": "summarize budgets"})
+    response = asyncio.run(post())
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/event-stream")
+    assert response.headers["cache-control"] == "no-cache"
+    frames = response.content.split(b"\n\n")
+    assert frames[-1] == b""   # every frame ends with a blank line
+    events = []
+    for frame in frames[:-1]:
+        event, data = frame.split(b"\n")
+        assert event.startswith(b"event: ") and data.startswith(b"data: ")
+        events.append((event[7:].decode(), orjson.loads(data[6:])))
+    assert [e for e, _ in events][-3:] == ["token", "token", "done"]
+    assert response.content == b"".join(format_sse(e, d) for e, d in events)
+
+
+class BatchLLM(StubLLM):
+    """Blocked SQL for questions that mention "drop"."""
+
+    async def agenerate_sql_json(self, messages, temperature=0.0):
+        response = await super().agenerate_sql_json(messages, temperature)
+        if "drop" in messages[-1]["content"]:
+            response["sql"] = "DELETE FROM BS.ApprovedTestBudgets"
+        return response
+
+
+class SlowExecutor(StubExecutor):
+    def __init__(self):
+        super().__init__()
+        self.active = self.peak = 0
+
+    async def arun_select(self, sql, page, page_size, hard_cap):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(0.01)
+            return await super().arun_select(sql, page, page_size, hard_cap)
+        finally:
+            self.active -= 1
+
+
+def test_run_batch_sessions_concurrency_and_failures(stubs):
+    executor = SlowExecutor()
+    agent.components.override("executor", executor)
+    agent.components.override("llm", BatchLLM())
+    questions = [f"summarize budgets of team {i}" for i in range(6)] + ["drop the budgets"]
+    items = _collect(agent.run_batch("b", questions, concurrency=2))
+
+    assert sorted(item["index"] for item in items) == list(range(7))
+    assert executor.peak == 2   # six executed questions, never more than two at once
+    failed = [item for item in items if not item["ok"]]
+    assert [(f["index"], f["question"]) for f in failed] == [(6, "drop the budgets")]
+    assert failed[0]["error"].startswith("Query blocked by safety validator")
+    _, _, history = stubs
+    assert set(history.messages) == {f"b:{i}" for i in range(7)}
+    assert all(m[0]["content"] == questions[int(sid.split(":")[1])] for sid, m in history.messages.items())
+
+
+def test_run_batch_cancels_pending_questions_when_the_consumer_stops(stubs, monkeypatch):
+    started, cancelled = [], []
+
+    async def fake_run_agent(session_id, question):
+        started.append(session_id)
+        if question != "fast":
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(session_id)
+                raise
+        return {"ok": True}
+
+    monkeypatch.setattr(agent, "run_agent", fake_run_agent)
+
+    async def first_then_stop():
+        batch = agent.run_batch("c", ["slow", "fast", "slow", "slow"], concurrency=2)
+        first = await batch.__anext__()
+        await batch.aclose()
+        await asyncio.sleep(0)   # let the cancellations land
+        return first
+
+    assert asyncio.run(first_then_stop())["index"] == 1
+    assert "c:3" not in started   # never got a slot
+    assert sorted(cancelled) == sorted(sid for sid in started if sid != "c:1") and "c:0" in cancelled
+
+
+def test_chat_batch_endpoint_reports_done_counts(stubs):
+    import httpx
+    import main
+    agent.components.override("llm", BatchLLM())
+
+    async def post():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/api/chat/batch", json={
+                "session_id": "nd", "questions": ["summarize budgets", "drop the budgets", "summarize users"]})
+    response = asyncio.run(post())
+    assert response.status_code == 200 and response.headers["content-type"] == "application/x-ndjson"
+    lines = [orjson.loads(line) for line in response.content.splitlines()]
+    assert sorted(line["index"] for line in lines[:-1]) == [0, 1, 2]
+    assert lines[-1] == {"done": True, "total": 3, "failed": 1}
+
+
+class RecordingLLM(StubLLM):
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    async def agenerate_sql_json(self, messages, temperature=0.0):
+        self.calls.append(("sql", messages))
+        return await super().agenerate_sql_json(messages, temperature)
+
+    async def amarkdown(self, messages, temperature=0.0):
+        self.calls.append(("markdown", messages))
+        return await super().amarkdown(messages, temperature)
+
+
+def test_run_agent_end_to_end_through_ainvoke(stubs, monkeypatch):
+    _, executor, history = stubs
+    llm = RecordingLLM()
+    agent.components.override("llm", llm)
+    invocations = []
+    ainvoke = agent.app_graph.ainvoke
+
+    async def spy(state, *args, **kwargs):
+        invocations.append(state["user_query"])
+        return await ainvoke(state, *args, **kwargs)
+    monkeypatch.setattr(agent.app_graph, "ainvoke", spy)
+
+    first = asyncio.run(agent.run_agent("e2e", "show budgets"))
+    assert invocations == ["show budgets"]
+    assert first["ok"] and first["sql"] == SQL and first["answer_source"] == "template"
+    assert first["markdown"].startswith("3 rows in BS.ApprovedTestBudgets") and not first["has_more"]
+    assert agent.query_registry.get(first["query_id"]).sql == SQL
+    assert executor.sqls == [SQL]
+
+    second = asyncio.run(agent.run_agent("e2e", "summarize budgets"))
+    assert second["ok"] and second["markdown"] == "summary" and second["answer_source"] == "llm"
+    assert [kind for kind, _ in llm.calls] == ["sql", "sql", "markdown"]
+    # the second question's SQL prompt carries the first exchange from the history stub
+    prompt = "\n".join(m["content"] for m in llm.calls[1][1])
+    assert "show budgets" in prompt and "3 rows in BS.ApprovedTestBudgets" in prompt
+    assert [m["role"] for m in history.messages["e2e"]] == ["user", "assistant", "user", "assistant"]
+
+
+class PagingExecutor(StubExecutor):
+    """An endless table keyed on Id for keyset pages."""
+
+    async def arun_keyset_page(self, sql, key_columns, after, page_size):
+        self.sqls.append(sql)
+        start = after[0] + 1 if after else 0
+        return pd.DataFrame({"Id": range(start, start + page_size)})
+
+    async def arun_offset_page(self, sql, page, page_size):
+        self.sqls.append(sql)
+        return pd.DataFrame({"Id": range((page - 1) * page_size, page * page_size)})
+
+
+def _walk(query_id, page_size):
+    async def run():
+        pages, cursor = [], None
+        while True:
+            page = await agent.fetch_page(query_id, cursor, page_size)
+            pages.append(len(page["rows"]))
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return pages
+    return asyncio.run(run())
+
+
+def test_pages_stay_within_the_cost_guard_limit_and_row_cap(stubs, monkeypatch):
+    agent.components.override("executor", PagingExecutor())
+    guard = CostGuard(StaticPlanProvider({"BS.ApprovedTestBudgets": 50_000_000}, cost_per_row=0.001),
+                      max_subtree_cost=0.15, limit_rows=100)
+    agent.components.override("cost_guard", guard)
+    limited = asyncio.run(agent.run_agent("pages", "show budgets"))
+    handle = agent.query_registry.get(limited["query_id"])
+    assert handle.key_columns == ["Id"] and handle.row_limit == 100
+    assert _walk(limited["query_id"], 40) == [40, 40, 20]
+
+    agent.components.override("cost_guard", None)
+    monkeypatch.setitem(agent.cfg.limits, "hard_row_cap", 50)
+    unlimited = asyncio.run(agent.run_agent("pages", "show all budgets"))
+    assert agent.query_registry.get(unlimited["query_id"]).row_limit is None
+    assert _walk(unlimited["query_id"], 20) == [20, 20, 10]   # keyset pages stop at hard_row_cap too
+
+
+def test_page_statement_is_cost_guarded(stubs):
+    from helpers.errors import QueryTooExpensive
+    agent.components.override("executor", PagingExecutor())
+    response = asyncio.run(agent.run_agent("pages-guard", "show budgets"))
+    # the sorted derived table every keyset page runs is over budget even with the page's TOP
+    agent.components.override("cost_guard", CostGuard(StaticPlanProvider(default_rows=1000), max_subtree_cost=1e-9,
+                                                      action="reject"))
+    with pytest.raises(QueryTooExpensive):
+        asyncio.run(agent.fetch_page(response["query_id"], None, 10))
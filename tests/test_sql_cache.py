@@ -0,0 +1,65 @@
+import os
+from tools.sql_cache import SqlGenerationCache, normalize_question
+
+OUT = {"sql": "SELECT COUNT(*) FROM Students", "confidence": 0.9, "needs_clarification": False, "notes": ""}
+
+def fake_embed(texts):
+    # bag-of-words over a tiny vocabulary, good enough to tell paraphrases apart
+    vocab = ["how", "many", "students", "count", "payments", "total"]
+    return [[float(w in t.split()) for w in vocab] for t in texts]
+
+def make_cache(tmp_path, **kw):
+    schema = tmp_path / "schema.json"
+    schema.write_text('{"DatabaseSchema": []}')
+    return SqlGenerationCache(str(schema), embed_fn=fake_embed, **kw), schema
+
+def test_normalize_question():
+    assert normalize_question("  How many   Students? ") == "how many students"
+
+def test_exact_hit(tmp_path):
+    cache, _ = make_cache(tmp_path)
+    key = cache.key_for("How many students?", "excerpt")
+    assert cache.get(key) is None
+    cache.put(key, OUT)
+    assert cache.get(cache.key_for("how many students", "excerpt"))["sql"] == OUT["sql"]
+    assert cache.stats()["exact_hits"] == 1
+
+def test_similar_hit_requires_same_context(tmp_path):
+    cache, _ = make_cache(tmp_path, similarity_threshold=0.8)
+    cache.put(cache.key_for("how many students", "excerpt"), OUT)
+    assert cache.get(cache.key_for("students count how many", "other excerpt")) is not None
+    assert cache.stats()["similar_hits"] == 1
+    history = [{"role": "user", "content": "show payments"}]
+    assert cache.get(cache.key_for("students count how many", "other excerpt", history)) is None
+
+def test_clarifications_not_cached(tmp_path):
+    cache, _ = make_cache(tmp_path)
+    key = cache.key_for("what?", "excerpt")
+    cache.put(key, {"sql": None, "needs_clarification": True})
+    assert cache.get(key) is None
+
+def test_schema_change_invalidates(tmp_path):
+    cache, schema = make_cache(tmp_path)
+    key = cache.key_for("how many students", "excerpt")
+    cache.put(key, OUT)
+    schema.write_text('{"DatabaseSchema": [{"TableName": "Students"}]}')
+    os.utime(schema, ns=(1, 1))
+    assert cache.get(key) is None
+    assert cache.stats()["schema_invalidations"] == 1
+
+def test_similarity_index_follows_evictions(tmp_path):
+    cache, _ = make_cache(tmp_path, max_entries=2, similarity_threshold=0.8)
+    history = [{"role": "user", "content": "show payments"}]
+    cache.put(cache.key_for("how many students", "excerpt"), OUT)
+    cache.put(cache.key_for("total payments", "excerpt", history), OUT)
+    cache.put(cache.key_for("count payments", "excerpt"), OUT)          # evicts "how many students"
+    assert len(cache._index) == 2
+    assert cache.get(cache.key_for("students count how many", "other")) is None
+    assert cache.get(cache.key_for("payments total", "other", history)) is not None
+    cache.put(cache.key_for("count payments", "excerpt"), OUT)          # replacing keeps one row
+    assert len(cache._index) == 2
+
+    expiring, _ = make_cache(tmp_path, ttl_seconds=1e-9, similarity_threshold=0.8)
+    expiring.put(expiring.key_for("how many students", "excerpt"), OUT)
+    assert expiring.get(expiring.key_for("students count how many", "other")) is None
+    assert len(expiring._index) == 0
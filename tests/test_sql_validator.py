@@ -1,5 +1,6 @@
 import pytest
-from tools.sql_validator import validate_read_only
+from helpers.errors import ValidationError
+from tools.sql_validator import SqlValidator, validate_read_only
 
 ALLOW_TABLES = {"Students", "Enrollments"}
 ALLOW_COLS = {"Students": {"ID","Name"}, "Enrollments": {"StudentID","Date"}}
@@ -17,3 +18,19 @@ def test_block_update():
 def test_block_unknown_table():
     with pytest.raises(Exception):
         validate_read_only("SELECT * FROM Hack", "tsql", ALLOW_TABLES, ALLOW_COLS, BLOCK_KW, BLOCK_FN, True)
+
+def test_qualified_names_and_ctes():
+    v = SqlValidator("tsql", {"epay.Payments", "dbo.Students"}, {}, BLOCK_KW, {"OPENROWSET", "sp_OA%"})
+    v.validate("SELECT p.Amount FROM epay.Payments p JOIN Students s ON s.Id = p.StudentId")
+    v.validate("WITH paid AS (SELECT StudentId FROM epay.Payments) SELECT * FROM paid")
+    with pytest.raises(ValidationError):
+        v.validate("SELECT * FROM hr.Payments")
+    with pytest.raises(ValidationError):
+        v.validate("SELECT sp_OACreate('x')")
+
+def test_verdict_cache_replays_result():
+    v = SqlValidator("tsql", ALLOW_TABLES, ALLOW_COLS, BLOCK_KW, BLOCK_FN, cache_size=8)
+    for _ in range(2):
+        with pytest.raises(ValidationError, match="Hack"):
+            v.validate("SELECT * FROM Hack")
+    assert v.stats()["hits"] == 1
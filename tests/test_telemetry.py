@@ -0,0 +1,39 @@
+import asyncio
+import pytest
+from helpers.telemetry import Telemetry
+
+def _value(t, name, **labels):
+    return t.registry.get_sample_value(name, labels) or 0
+
+def test_nodes_stages_and_outcomes_are_recorded():
+    t = Telemetry()
+
+    async def ok_node(state):
+        with t.stage("retrieval"):
+            return state
+
+    def bad_node(state):
+        raise ValueError("boom")
+
+    asyncio.run(t.node("generate_sql", ok_node)({}))
+    with pytest.raises(ValueError):
+        t.node("validate", bad_node)({})
+    with pytest.raises(ValueError), t.request("chat", "s1"):
+        raise ValueError("boom")
+
+    assert _value(t, "sql_agent_node_seconds_count", node="generate_sql", outcome="ok") == 1
+    assert _value(t, "sql_agent_node_seconds_count", node="validate", outcome="error") == 1
+    assert _value(t, "sql_agent_stage_seconds_count", stage="retrieval") == 1
+    assert _value(t, "sql_agent_requests_total", endpoint="chat", outcome="exception") == 1
+
+def test_tokens_fetch_and_cache_counters():
+    t = Telemetry()
+    t.record_tokens("openai", prompt=1200, completion=80, cached=1024)
+    t.record_fetch({"rows": 200, "bytes": 4096})
+    t.record_fetch({"rows": 200, "bytes": 0, "cached": True})   # served from cache: nothing read
+    t.record_cache("results", True)
+    assert _value(t, "sql_agent_llm_tokens_total", provider="openai", kind="cached") == 1024
+    assert _value(t, "sql_agent_rows_fetched_total") == 200
+    assert _value(t, "sql_agent_cache_lookups_total", cache="results", result="hit") == 1
+    body, content_type = t.render()
+    assert b"sql_agent_bytes_fetched_total 4096.0" in body and content_type.startswith("text/plain")
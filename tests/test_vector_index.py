@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+from tools.vector_index import NumpyVectorIndex
+from tools.schema_retriever import SchemaRetriever
+
+@pytest.mark.parametrize("quantization", ["float32", "int8"])
+def test_top_k_matches_brute_force(tmp_path, quantization):
+    vecs = np.random.default_rng(0).normal(size=(300, 32))
+    index = NumpyVectorIndex(str(tmp_path), quantization)
+    index.build(vecs, [{"i": i} for i in range(300)])
+    reopened = NumpyVectorIndex(str(tmp_path)).load()
+    assert reopened.quantization == quantization
+    assert [r["i"] for r in reopened.query(vecs[7], 3)][0] == 7
+    unit = vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+    expected = np.argsort(-(unit @ unit[7]))[:5].tolist()
+    got = [i for i, _ in reopened.search(vecs[7], 5)]
+    # int8 rounding may swap near-ties further down the list
+    assert got == expected if quantization == "float32" else got[:3] == expected[:3]
+
+def test_numpy_backend_returns_prebuilt_records(tmp_path):
+    schema = {"DatabaseSchema": [
+        {"SchemaName": "dbo", "TableName": "Students", "Columns": {"Id": "int", "Name": "nvarchar"}},
+        {"SchemaName": "epay", "TableName": "Payments", "Columns": {"Id": "int"},
+         "ForeignKeys": [{"ParentColumn": "StudentId", "ReferencedTable": "dbo.Students", "ReferencedColumn": "Id"}]},
+    ]}
+    embed = lambda texts: np.array([[1.0, 0.0] if "Student" in t and "Payment" not in t else [0.0, 1.0] for t in texts])
+    r = SchemaRetriever(schema, persist_path=str(tmp_path), top_k=1, backend="numpy", embedding_fn=embed)
+    [hit] = r.query("payments")
+    assert hit["table"] == "epay.Payments"
+    assert hit["foreign_keys"] == ["StudentId -> dbo.Students.Id"]
@@ -0,0 +1,220 @@
+import numbers
+import re
+from decimal import Decimal
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional
+
+import pandas as pd
+import sqlglot
+from sqlglot import exp
+
+from helpers.formatting import to_markdown
+
+_AGG_WORDS = {
+    exp.Count: "number of",
+    exp.Sum: "total",
+    exp.Avg: "average",
+    exp.Min: "lowest",
+    exp.Max: "highest",
+}
+_COMPARISONS = {exp.EQ: "=", exp.NEQ: "≠", exp.GT: ">", exp.GTE: "≥", exp.LT: "<", exp.LTE: "≤"}
+_NOW = (exp.CurrentTimestamp, exp.CurrentDate, exp.CurrentDatetime)
+
+
+@dataclass
+class QueryFacts:
+    """What a SELECT asks for, read from the AST (used to phrase template answers)."""
+    tables: List[str] = field(default_factory=list)
+    aggregates: List[str] = field(default_factory=list)   # "number of rows", "total Amount"
+    values: List[Optional[str]] = field(default_factory=list)   # per projection; None = unnamed expression
+    filters: List[str] = field(default_factory=list)      # "Status = 3", "TransactionDate in the last 60 days"
+    group_by: List[str] = field(default_factory=list)
+    order_by: List[str] = field(default_factory=list)      # "Score descending", "Id"
+    limit: Optional[int] = None
+
+
+def _name(node: exp.Expression) -> str:
+    return node.name if isinstance(node, exp.Column) else node.sql(dialect="tsql")
+
+
+def _literal(node: exp.Expression) -> str:
+    if isinstance(node, exp.Literal):
+        return f"'{node.this}'" if node.is_string else str(node.this)
+    if isinstance(node, exp.Null):
+        return "NULL"
+    return node.sql(dialect="tsql")
+
+
+def _relative_date(node: exp.Expression) -> Optional[str]:
+    """`DATEADD(DAY, -60, GETDATE())` → "the last 60 days"."""
+    if not isinstance(node, exp.DateAdd) or not isinstance(node.this, _NOW):
+        return None
+    amount = node.expression
+    if not isinstance(amount, exp.Neg) or not isinstance(amount.this, exp.Literal):
+        return None
+    n, unit = amount.this.this, (node.unit.name if node.unit else "DAY").lower()
+    unit = {"dd": "day", "d": "day", "mm": "month", "m": "month", "yy": "year", "yyyy": "year",
+            "wk": "week", "ww": "week", "hh": "hour"}.get(unit, unit)
+    return f"the last {n} {unit}{'' if str(n) == '1' else 's'}"
+
+
+def _describe_predicate(p: exp.Expression) -> str:
+    if isinstance(p, exp.Paren):
+        return _describe_predicate(p.this)
+    if isinstance(p, (exp.GT, exp.GTE)) and _relative_date(p.expression):
+        return f"{_name(p.this)} in {_relative_date(p.expression)}"
+    if type(p) in _COMPARISONS:
+        return f"{_name(p.this)} {_COMPARISONS[type(p)]} {_literal(p.expression)}"
+    if isinstance(p, exp.Between):
+        return f"{_name(p.this)} between {_literal(p.args['low'])} and {_literal(p.args['high'])}"
+    if isinstance(p, exp.In):
+        values = p.expressions
+        shown = ", ".join(_literal(v) for v in values[:5]) + (", …" if len(values) > 5 else "")
+        return f"{_name(p.this)} in ({shown})"
+    if isinstance(p, exp.Like):
+        return f"{_name(p.this)} like {_literal(p.expression)}"
+    if isinstance(p, exp.Is):
+        return f"{_name(p.this)} has no value"
+    if isinstance(p, exp.Not) and isinstance(p.this, exp.Is):
+        return f"{_name(p.this.this)} has a value"
+    return p.sql(dialect="tsql")
+
+
+def _conjuncts(node: exp.Expression) -> Iterable[exp.Expression]:
+    if isinstance(node, exp.And):
+        yield from _conjuncts(node.this)
+        yield from _conjuncts(node.expression)
+    else:
+        yield node
+
+
+def describe_sql(sql: str, dialect: str = "tsql") -> Optional[QueryFacts]:
+    """Facts for a single plain SELECT; None for anything else (unions, parse errors)."""
+    try:
+        tree = sqlglot.parse_one(sql, read=dialect)
+    except sqlglot.errors.ParseError:
+        return None
+    if not isinstance(tree, exp.Select):
+        return None
+
+    facts = QueryFacts()
+    from_ = tree.args.get("from") or tree.args.get("from_")
+    joins = tree.args.get("joins") or []
+    for source in ([from_.this] if from_ else []) + [j.this for j in joins]:
+        if isinstance(source, exp.Table) and source.name:
+            facts.tables.append(f"{source.db}.{source.name}" if source.db else source.name)
+
+    for projection in tree.expressions:
+        node = projection.unalias()
+        if isinstance(node, exp.Star):
+            continue
+        # only a projection that *is* the aggregate gets its wording: SUM(Amount)/12 is not "total Amount"
+        if type(node) in _AGG_WORDS:
+            arg = node.this
+            if isinstance(arg, exp.Distinct):
+                target = "distinct " + ", ".join(_name(e) for e in arg.expressions)
+            elif arg is None or isinstance(arg, exp.Star):
+                target = "rows"
+            else:
+                target = _name(arg)
+            facts.aggregates.append(f"{_AGG_WORDS[type(node)]} {target}")
+            facts.values.append(facts.aggregates[-1])
+        elif isinstance(projection, exp.Alias) or isinstance(node, exp.Column):
+            facts.values.append(projection.alias_or_name)
+        else:
+            facts.values.append(None)
+
+    where = tree.args.get("where")
+    if where is not None:
+        facts.filters = [_describe_predicate(p) for p in _conjuncts(where.this)]
+    group = tree.args.get("group")
+    if group is not None:
+        facts.group_by = [_name(e) for e in group.expressions]
+    order = tree.args.get("order")
+    if order is not None:
+        facts.order_by = [_name(o.this) + (" descending" if o.args.get("desc") else "") for o in order.expressions]
+    limit = tree.args.get("limit")
+    if limit is not None and isinstance(limit.expression, exp.Literal):
+        facts.limit = int(limit.expression.this)
+    return facts
+
+
+def _format_value(value) -> str:
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return "no value"
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, numbers.Integral):
+        return f"{int(value):,}"
+    if isinstance(value, (numbers.Real, Decimal)):
+        value = float(value)
+        return f"{int(value):,}" if value.is_integer() and abs(value) < 1e15 else f"{value:,.2f}"
+    return str(value)
+
+
+class AnswerRenderer:
+    """
+    Template answers for results that do not need an LLM to explain them:
+    empty results, a single value, and small tables. `render` returns None
+    when the policy wants the LLM summary instead.
+    """
+
+    def __init__(self, enabled: bool = True, max_table_rows: int = 10, max_table_cols: int = 6,
+                 llm_keywords: Iterable[str] = (), dialect: str = "tsql"):
+        self.enabled = enabled
+        self.max_table_rows = max_table_rows
+        self.max_table_cols = max_table_cols
+        words = [re.escape(w.lower()) for w in llm_keywords if w]
+        self._llm_re = re.compile(r"\b(" + "|".join(words) + r")", re.I) if words else None
+        self.dialect = dialect
+
+    @classmethod
+    def from_config(cls, cfg) -> "AnswerRenderer":
+        answers = getattr(cfg, "answers", None) or {}
+        return cls(
+            enabled=answers.get("fast_path", True),
+            max_table_rows=answers.get("max_table_rows", 10),
+            max_table_cols=answers.get("max_table_cols", 6),
+            llm_keywords=answers.get("llm_keywords", []),
+            dialect=cfg.schema.get("dialect", "tsql"),
+        )
+
+    def kind(self, df: Optional[pd.DataFrame]) -> Optional[str]:
+        if df is None or df.empty:
+            return "empty"
+        if df.shape == (1, 1):
+            return "scalar"
+        if df.shape[0] <= self.max_table_rows and df.shape[1] <= self.max_table_cols:
+            return "table"
+        return None
+
+    def wants_llm(self, user_query: str) -> bool:
+        return self._llm_re is not None and self._llm_re.search(user_query or "") is not None
+
+    def render(self, user_query: str, sql: str, df: Optional[pd.DataFrame], has_more: bool = False) -> Optional[str]:
+        if not self.enabled or has_more or self.wants_llm(user_query):
+            return None
+        kind = self.kind(df)
+        if kind is None:
+            return None
+        facts = describe_sql(sql, self.dialect) or QueryFacts()
+
+        source = " and ".join(facts.tables) or "the data"
+        where = f" where {' and '.join(facts.filters)}" if facts.filters else ""
+        if kind == "empty":
+            return f"No rows found in {source}{where}."
+
+        if kind == "scalar":
+            if facts.order_by:
+                return None   # TOP 1 … ORDER BY: "the Name" would drop the ranking it was picked by
+            what = facts.values[0] if len(facts.values) == 1 else str(df.columns[0])
+            if what is None:
+                return None   # unnamed computed value: let the LLM describe it
+            return f"The {what} in {source}{where} is **{_format_value(df.iat[0, 0])}**."
+
+        n = df.shape[0]
+        what = " and ".join(facts.aggregates) if facts.aggregates else f"{n} row{'s' if n != 1 else ''}"
+        per = f" per {', '.join(facts.group_by)}" if facts.group_by else ""
+        order = f" by {', '.join(facts.order_by)}" if facts.order_by else ""
+        capped = f" (top {facts.limit}{order})" if facts.limit and n >= facts.limit else ""
+        return f"{what[0].upper()}{what[1:]}{per} in {source}{where}{capped}:\n\n{to_markdown(df)}"
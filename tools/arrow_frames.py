@@ -0,0 +1,99 @@
+import datetime
+import decimal
+from typing import List, Optional, Sequence
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+def _to_array(values: Sequence) -> pa.Array:
+    try:
+        return pa.array(values, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        # UUIDs, mixed types, driver-specific objects → keep them as text
+        return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+
+
+def rows_to_batch(rows: Sequence[Sequence], columns: Sequence[str]) -> pa.RecordBatch:
+    """Transpose one fetchmany() chunk of row tuples into a columnar record batch."""
+    arrays = [_to_array(col) for col in zip(*rows)] if rows else [pa.array([]) for _ in columns]
+    return pa.RecordBatch.from_arrays(arrays, names=[str(c) for c in columns])
+
+
+# Python types pyodbc reports in cursor.description → Arrow types
+_DESCRIPTION_TYPES = {
+    bool: pa.bool_(),
+    int: pa.int64(),
+    float: pa.float64(),
+    str: pa.string(),
+    bytes: pa.binary(),
+    bytearray: pa.binary(),
+    datetime.datetime: pa.timestamp("us"),
+    datetime.date: pa.date32(),
+    datetime.time: pa.time64("us"),
+}
+
+
+def schema_from_description(description) -> Optional[pa.Schema]:
+    """Arrow schema from a DB-API cursor.description; None when a column type is not reported (e.g. SQLite)."""
+    fields = []
+    for name, type_code, _display, _internal, precision, scale, _nullable in description:
+        if type_code is decimal.Decimal and precision:
+            arrow_type = pa.decimal128(min(int(precision), 38), int(scale or 0))
+        elif type_code in _DESCRIPTION_TYPES:
+            arrow_type = _DESCRIPTION_TYPES[type_code]
+        else:
+            return None
+        fields.append(pa.field(str(name), arrow_type))
+    return pa.schema(fields)
+
+
+def stream_schema(first: pa.RecordBatch) -> pa.Schema:
+    """Fixed schema for a stream when the driver reports no types: first chunk, all-NULL columns as text."""
+    return pa.schema([pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f for f in first.schema])
+
+
+def conform_batch(batch: pa.RecordBatch, schema: pa.Schema) -> pa.RecordBatch:
+    """Cast one chunk to a stream's fixed schema (raises ArrowInvalid if a value does not fit)."""
+    if batch.schema.equals(schema):
+        return batch
+    arrays = [col if col.type == field.type else col.cast(field.type) for col, field in zip(batch.columns, schema)]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def concat_batches(batches: List[pa.RecordBatch], columns: Sequence[str]) -> pa.Table:
+    """Concatenate batches whose inferred types may differ (e.g. all-NULL first chunk)."""
+    if not batches:
+        return pa.table({str(c): pa.array([], type=pa.null()) for c in columns})
+    tables = [pa.Table.from_batches([b]) for b in batches]
+    try:
+        return pa.concat_tables(tables, promote_options="permissive")
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # incompatible types across chunks → fall back to text for the whole result
+        return pa.concat_tables(
+            [t.cast(pa.schema([(f.name, pa.string()) for f in t.schema])) for t in tables]
+        )
+
+
+def dictionary_encode_strings(table: pa.Table, max_ratio: float = 0.5, min_rows: int = 32) -> pa.Table:
+    """Dictionary-encode low-cardinality string columns (→ pandas categoricals)."""
+    if table.num_rows < min_rows:
+        return table
+    for i, field in enumerate(table.schema):
+        if not (pa.types.is_string(field.type) or pa.types.is_large_string(field.type)):
+            continue
+        column = table.column(i)
+        if pc.count_distinct(column).as_py() <= max_ratio * table.num_rows:
+            table = table.set_column(i, field.name, column.dictionary_encode())
+    return table
+
+
+def _types_mapper(arrow_type: pa.DataType):
+    # dictionary columns fall through to pandas' default conversion, i.e. Categorical
+    return None if pa.types.is_dictionary(arrow_type) else pd.ArrowDtype(arrow_type)
+
+
+def table_to_frame(table: pa.Table) -> pd.DataFrame:
+    """Arrow table → DataFrame with Arrow-backed dtypes (no per-cell Python objects)."""
+    return table.to_pandas(types_mapper=_types_mapper)
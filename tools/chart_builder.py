@@ -1,8 +1,274 @@
-import pandas as pd
-import plotly.express as px
 import base64
+import hashlib
+import re
+from typing import Dict, List, Optional
+
+import numpy as np
+import orjson
+import pandas as pd
+import pyarrow as pa
+
+from helpers.cache import TTLCache
+from helpers.errors import ComponentUnavailable
+
+# Chart spec (compact, columnar; the UI draws it client-side):
+#   {"type": "line" | "bar" | "scatter",
+#    "x": {"field": "TransactionDate", "type": "temporal" | "nominal" | "quantitative"},
+#    "y": [{"field": "Amount"}, ...],
+#    "data": {"TransactionDate": [...], "Amount": [...]},
+#    "points": 1000, "rows": 250000, "downsampled": "lttb" | "minmax" | "stride" | null, "truncated": false}
+
+DOWNSAMPLE_METHODS = ("lttb", "minmax")
+# Id / ID closing a camel-case or snake_case name (StudentId, CustomerID, student_id), not AmountPaid / Valid
+_ID_NAME = re.compile(r"(?:^|[a-z0-9_])(?:Id|ID)$|(?:^|_)id$")
+
+
+# ---- Downsampling (indices into the x-sorted input) ----
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: keeps first/last point and, per bucket, the point
+    forming the largest triangle with the previously kept point and the next bucket's
+    mean. Bucket means are computed in one pass; the per-bucket pick is a vector op.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.nan_to_num(np.asarray(y, dtype=np.float64))
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)   # n_out - 2 buckets over the inner points
+    starts, ends = edges[:-1], edges[1:]
+    sizes = np.maximum(ends - starts, 1)
+    mean_x = np.add.reduceat(x[:n - 1], starts) / sizes
+    mean_y = np.add.reduceat(y[:n - 1], starts) / sizes
+    # the last bucket's "next bucket" is the final point
+    next_x, next_y = np.append(mean_x[1:], x[-1]), np.append(mean_y[1:], y[-1])
+
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        bx, by = x[start:end], y[start:end]
+        area = np.abs((x[a] - next_x[i]) * (by - y[a]) - (x[a] - bx) * (next_y[i] - y[a]))
+        a = start + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def minmax_indices(values: np.ndarray, n_buckets: int) -> np.ndarray:
+    """
+    Min and max of every bucket for one or more series (2-D: rows × series), plus the
+    first/last point. Buckets are rows of a padded (n_buckets × size) view, so each
+    series is two argmin/argmax calls. Keeps every spike that LTTB might smooth over.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, None]
+    n = values.shape[0]
+    if n <= 2 * n_buckets * values.shape[1] + 2:
+        return np.arange(n)
+    size = -(-n // n_buckets)
+    offsets = np.arange(n_buckets) * size
+    keep = [np.array([0, n - 1])]
+    for series in values.T:
+        padded = np.full(n_buckets * size, np.nan)
+        padded[:n] = series
+        grid = padded.reshape(n_buckets, size)
+        # NaNs (and the padding) never win unless a whole bucket is empty
+        keep.append(offsets + np.argmin(np.where(np.isnan(grid), np.inf, grid), axis=1))
+        keep.append(offsets + np.argmax(np.where(np.isnan(grid), -np.inf, grid), axis=1))
+    keep = np.concatenate(keep)
+    return np.unique(keep[keep < n])
+
+
+# ---- Column roles ----
+def is_temporal(s: pd.Series) -> bool:
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return True
+    if not (pd.api.types.is_object_dtype(s) or pd.api.types.is_string_dtype(s)
+            or isinstance(s.dtype, pd.CategoricalDtype)):
+        return False
+    sample = s.dropna().head(20).astype(str)
+    # SQLite / some drivers hand dates back as ISO strings
+    if sample.empty or not sample.str.match(r"^\d{4}-\d{2}-\d{2}").all():
+        return False
+    return not pd.to_datetime(sample, errors="coerce", format="ISO8601").isna().any()
+
+
+def as_datetime(s: pd.Series) -> pd.Series:
+    """
+    A temporal column as NumPy datetime64. Arrow-backed columns are converted
+    inside Arrow (pd.to_datetime walks them value by value); ISO strings are parsed.
+    """
+    if isinstance(s.dtype, pd.ArrowDtype) and pa.types.is_temporal(s.dtype.pyarrow_dtype):
+        values = pa.array(s.array)
+        if pa.types.is_date(values.type):
+            values = values.cast(pa.timestamp("ms"))
+        return pd.Series(values.to_pandas(), index=s.index, name=s.name)
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s
+    return pd.to_datetime(s.astype(str), errors="coerce", format="ISO8601")
+
+
+def is_id_name(name: str) -> bool:
+    """Key/FK column by naming convention, the same `Id` / `<Table>Id` columns keyset paging keys on."""
+    return _ID_NAME.search(str(name)) is not None
+
+
+def _is_measure(name: str, s: pd.Series) -> bool:
+    if pd.api.types.is_bool_dtype(s) or not pd.api.types.is_numeric_dtype(s):
+        return False
+    return not is_id_name(name)   # surrogate keys are numbers, not quantities
+
+
+def _column_roles(df: pd.DataFrame) -> Dict[str, List[str]]:
+    roles = {"temporal": [], "measure": [], "nominal": []}
+    for name in df.columns:
+        s = df[name]
+        if is_temporal(s):
+            roles["temporal"].append(name)
+        elif _is_measure(name, s):
+            roles["measure"].append(name)
+        elif not pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+            roles["nominal"].append(name)
+    return roles
+
+
+def _json_column(s: pd.Series) -> list:
+    if pd.api.types.is_datetime64_any_dtype(s):
+        if getattr(s.dt, "tz", None) is not None:
+            s = s.dt.tz_convert("UTC").dt.tz_localize(None)
+        return np.datetime_as_string(s.to_numpy(dtype="datetime64[ms]"), unit="ms").tolist()
+    if pd.api.types.is_numeric_dtype(s):
+        values = s.to_numpy(dtype=np.float64, na_value=np.nan)
+        return [None if v != v else (int(v) if v.is_integer() else v) for v in values.tolist()]
+    return [None if v is None or v != v else str(v) for v in s.tolist()]
+
+
+# ---- Spec inference ----
+def infer_chart_spec(df: Optional[pd.DataFrame], max_points: int = 1000, method: str = "lttb",
+                     max_categories: int = 50, max_series: int = 5) -> Optional[dict]:
+    """
+    Chart spec for a result set from its dtypes, or None when it is not chartable
+    (no measure, a single row, ...):
+      - date/time column + numbers → line, sorted by time and downsampled to max_points
+        (LTTB for one series, min/max buckets for several or method="minmax")
+      - text/categorical column + numbers → bar, summed per category, top max_categories
+      - two or more numbers → scatter, evenly thinned to max_points
+    """
+    if df is None or df.shape[0] < 2:
+        return None
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"Unknown downsample method: {method}")
+    roles = _column_roles(df)
+    measures = roles["measure"][:max_series]
+    if not measures:
+        return None
+    rows = int(df.shape[0])
+
+    if roles["temporal"]:
+        x = roles["temporal"][0]
+        frame = pd.DataFrame({x: as_datetime(df[x])}).join(df[measures].astype("float64"))
+        frame = frame[frame[x].notna()].sort_values(x, kind="stable").reset_index(drop=True)
+        downsampled = None
+        if frame.shape[0] > max_points:
+            if method == "lttb" and len(measures) == 1:
+                keep = lttb_indices(frame[x].to_numpy(dtype="datetime64[ns]").astype(np.int64),
+                                    frame[measures[0]].to_numpy(), max_points)
+            else:
+                method = "minmax"
+                keep = minmax_indices(frame[measures].to_numpy(), max(1, (max_points - 2) // (2 * len(measures))))
+            frame, downsampled = frame.iloc[keep], method
+        return _spec("line", x, "temporal", measures, frame, rows, downsampled)
+
+    if roles["nominal"]:
+        x = roles["nominal"][0]
+        frame = df[[x]].astype(str).join(df[measures].astype("float64"))   # Arrow decimals overflow a grouped sum
+        grouped = frame.groupby(x, sort=False, observed=True)[measures].sum()
+        truncated = grouped.shape[0] > max_categories
+        if truncated:
+            grouped = grouped.nlargest(max_categories, measures[0])
+        return _spec("bar", x, "nominal", measures, grouped.reset_index(), rows, None, truncated)
+
+    if len(measures) >= 2:
+        x, ys = measures[0], measures[1:]
+        frame, downsampled = df[measures], None
+        if rows > max_points:
+            frame = frame.iloc[np.linspace(0, rows - 1, max_points).astype(np.int64)]
+            downsampled = "stride"
+        return _spec("scatter", x, "quantitative", ys, frame, rows, downsampled)
+    return None
+
+
+def _spec(kind: str, x: str, x_type: str, ys: List[str], frame: pd.DataFrame, rows: int,
+          downsampled: Optional[str], truncated: bool = False) -> dict:
+    return {
+        "type": kind,
+        "x": {"field": str(x), "type": x_type},
+        "y": [{"field": str(y)} for y in ys],
+        "data": {str(c): _json_column(frame[c]) for c in [x] + list(ys)},
+        "points": int(frame.shape[0]),
+        "rows": rows,
+        "downsampled": downsampled,
+        "truncated": truncated,
+    }
+
+
+def spec_hash(spec: dict) -> str:
+    """Content hash of a spec (type, encodings and data): same chart → same key."""
+    return hashlib.blake2b(orjson.dumps(spec, option=orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
+
+
+# ---- Optional PNG rendering ----
+def render_png(spec: dict, width: int = 900, height: int = 500, scale: float = 2.0) -> bytes:
+    """Static image of a spec (already downsampled, so the exporter gets few points). Needs plotly + kaleido."""
+    try:
+        import plotly.graph_objects as go
+    except ImportError as e:
+        raise ComponentUnavailable("PNG charts need plotly and kaleido installed") from e
+
+    data, x = spec["data"], spec["x"]["field"]
+    fig = go.Figure()
+    for y in spec["y"]:
+        name = y["field"]
+        if spec["type"] == "bar":
+            fig.add_trace(go.Bar(x=data[x], y=data[name], name=name))
+        else:
+            fig.add_trace(go.Scattergl(x=data[x], y=data[name], name=name,
+                                       mode="lines" if spec["type"] == "line" else "markers"))
+    fig.update_layout(width=width, height=height, margin=dict(l=40, r=20, t=20, b=40),
+                      showlegend=len(spec["y"]) > 1)
+    try:
+        return fig.to_image(format="png", scale=scale)
+    except (ValueError, ImportError) as e:   # kaleido missing / no browser for the exporter
+        raise ComponentUnavailable(f"PNG export unavailable: {e}") from e
+
+
+class ChartRenderer:
+    """PNG renders cached by spec hash: the same data is never rasterized twice."""
+
+    def __init__(self, max_entries: int = 256, max_bytes: Optional[int] = 64 * 1024 * 1024,
+                 width: int = 900, height: int = 500, scale: float = 2.0):
+        self.cache = TTLCache(max_entries=max_entries, max_bytes=max_bytes, sizeof=len)
+        self.width, self.height, self.scale = width, height, scale
+        self.renders = 0
+
+    def png(self, spec: dict) -> bytes:
+        key = (spec_hash(spec), self.width, self.height, self.scale)
+        image = self.cache.get(key)
+        if image is None:
+            image = render_png(spec, self.width, self.height, self.scale)
+            self.renders += 1
+            self.cache.put(key, image)
+        return image
+
+    def stats(self) -> dict:
+        return {**self.cache.stats(), "renders": self.renders}
+
 
-def chart_png_base64(df: pd.DataFrame, x: str, y: str) -> str:
-    fig = px.line(df, x=x, y=y)
-    png = fig.to_image(format="png", scale=2)
-    return base64.b64encode(png).decode("utf-8")
+def chart_png_base64(df: pd.DataFrame, x: str, y: str, max_points: int = 1000) -> str:
+    spec = _spec("line", x, "temporal", [y], df, int(df.shape[0]), None)
+    if df.shape[0] > max_points:
+        frame = df.reset_index(drop=True)
+        keep = lttb_indices(np.arange(len(frame)), frame[y].to_numpy(dtype=np.float64), max_points)
+        spec = _spec("line", x, "temporal", [y], frame.iloc[keep], int(df.shape[0]), "lttb")
+    return base64.b64encode(render_png(spec)).decode("utf-8")
@@ -0,0 +1,207 @@
+import logging
+import threading
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from typing import Dict, Optional, Protocol
+
+import sqlglot
+from sqlglot import exp
+
+from helpers.cache import TTLCache
+from helpers.errors import QueryTooExpensive
+from tools.result_cache import sql_fingerprint
+
+logger = logging.getLogger("ai-sql-agent")
+
+_SHOWPLAN_NS = "{http://schemas.microsoft.com/sqlserver/2004/07/showplan}"
+
+
+@dataclass(frozen=True)
+class PlanEstimate:
+    estimated_rows: float
+    subtree_cost: float          # optimizer cost units (SQL Server "estimated subtree cost")
+    source: str = "showplan"
+
+
+@dataclass(frozen=True)
+class GuardVerdict:
+    sql: str                     # SQL to execute (TOP-limited when action == "limited")
+    action: str                  # "pass" | "limited"
+    estimate: Optional[PlanEstimate] = None
+    reason: str = ""
+
+
+class PlanProvider(Protocol):
+    def estimate(self, sql: str) -> PlanEstimate: ...
+
+
+def parse_showplan_xml(plan_xml: str) -> PlanEstimate:
+    """Estimated rows / subtree cost of the first statement in a SHOWPLAN_XML document."""
+    root = ET.fromstring(plan_xml)
+    stmt = next(root.iter(f"{_SHOWPLAN_NS}StmtSimple"), None)
+    if stmt is None:
+        raise ValueError("No StmtSimple element in showplan XML")
+    return PlanEstimate(
+        estimated_rows=float(stmt.get("StatementEstRows", 0)),
+        subtree_cost=float(stmt.get("StatementSubTreeCost", 0)),
+    )
+
+
+class ShowplanProvider:
+    """
+    SQL Server estimated plans: SET SHOWPLAN_XML ON makes the server compile the
+    batch and return the plan instead of running it. Nothing is executed.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def estimate(self, sql: str) -> PlanEstimate:
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql("SET SHOWPLAN_XML ON")
+            try:
+                plan_xml = conn.exec_driver_sql(sql).scalar()
+            finally:
+                # the connection goes back to the pool: never leave showplan mode on
+                conn.exec_driver_sql("SET SHOWPLAN_XML OFF")
+        return parse_showplan_xml(plan_xml)
+
+
+class StaticPlanProvider:
+    """
+    Rough stand-in for tests and the SQLite benchmark backend: rows = largest
+    referenced table (known row counts, else `default_rows`), a WHERE clause
+    keeps 10%, cost grows linearly with the rows read (TOP stops the scan early).
+    """
+
+    def __init__(self, table_rows: Optional[Dict[str, int]] = None, default_rows: int = 1000,
+                 cost_per_row: float = 0.0001, dialect: str = "tsql"):
+        self.table_rows = {k.lower(): v for k, v in (table_rows or {}).items()}
+        self.default_rows = default_rows
+        self.cost_per_row = cost_per_row
+        self.dialect = dialect
+
+    def estimate(self, sql: str) -> PlanEstimate:
+        tree = sqlglot.parse_one(sql, read=self.dialect)
+        scanned = [
+            self.table_rows.get(f"{t.db}.{t.name}".lower(), self.table_rows.get(t.name.lower(), self.default_rows))
+            for t in tree.find_all(exp.Table) if t.name
+        ] or [0]
+        selectivity = 0.1 if tree.args.get("where") is not None else 1.0
+        out, read = max(scanned) * selectivity, float(sum(scanned))
+        limit = tree.args.get("limit")
+        if limit is not None and isinstance(limit.expression, exp.Literal) and limit.expression.is_int:
+            # row goal: the scan stops once TOP rows qualified
+            out = min(out, float(limit.expression.name))
+            read = min(read, float(limit.expression.name) / selectivity)
+        return PlanEstimate(estimated_rows=out, subtree_cost=read * self.cost_per_row, source="static")
+
+
+def _can_limit(tree: exp.Expression) -> bool:
+    """TOP only bounds the work for plain row selections; aggregates, sorts and DISTINCT still read everything."""
+    if not isinstance(tree, exp.Select) or tree.args.get("offset") is not None:
+        return False
+    if tree.args.get("group") or tree.args.get("order") or tree.args.get("distinct"):
+        return False
+    return not any(p.find(exp.AggFunc) for p in tree.expressions)
+
+
+class CostGuard:
+    """
+    Pre-execution check on the estimated plan:
+      - estimated rows over `max_estimated_rows` → inject TOP (`limit_rows`) when
+        that actually bounds the work, else reject
+      - estimated subtree cost over `max_subtree_cost` (after any TOP) → reject
+    Estimates are cached by SQL fingerprint. Provider errors pass the query
+    through when `fail_open` (the executor's query timeout still applies).
+    """
+
+    def __init__(self, provider: PlanProvider, max_estimated_rows: float = 5_000_000,
+                 max_subtree_cost: float = 500.0, limit_rows: int = 10000, action: str = "limit",
+                 fail_open: bool = True, cache_size: int = 2048, cache_ttl_seconds: Optional[float] = 600,
+                 dialect: str = "tsql"):
+        if action not in ("limit", "reject"):
+            raise ValueError(f"Unknown cost guard action: {action}")
+        self.provider = provider
+        self.max_estimated_rows = max_estimated_rows
+        self.max_subtree_cost = max_subtree_cost
+        self.limit_rows = limit_rows
+        self.action = action
+        self.fail_open = fail_open
+        self.dialect = dialect
+        self._plans = TTLCache(max_entries=cache_size, ttl_seconds=cache_ttl_seconds) if cache_size else None
+        self._counts = {"checked": 0, "passed": 0, "limited": 0, "rejected": 0, "provider_errors": 0}
+        self._counts_lock = threading.Lock()   # check() runs on executor threads
+
+    @classmethod
+    def from_config(cls, cfg, provider: PlanProvider) -> "CostGuard":
+        guard = cfg.cost_guard
+        return cls(
+            provider,
+            max_estimated_rows=guard.get("max_estimated_rows", 5_000_000),
+            max_subtree_cost=guard.get("max_subtree_cost", 500.0),
+            limit_rows=guard.get("limit_rows") or cfg.limits["hard_row_cap"],
+            action=guard.get("action", "limit"),
+            fail_open=guard.get("fail_open", True),
+            cache_size=guard.get("plan_cache_size", 2048),
+            cache_ttl_seconds=guard.get("plan_cache_ttl_seconds", 600),
+            dialect=cfg.schema.get("dialect", "tsql"),
+        )
+
+    def estimate(self, sql: str) -> PlanEstimate:
+        key = sql_fingerprint(sql, self.dialect)
+        plan = self._plans.get(key) if self._plans is not None else None
+        if plan is None:
+            plan = self.provider.estimate(sql)
+            if self._plans is not None:
+                self._plans.put(key, plan)
+        return plan
+
+    def _count(self, name: str) -> None:
+        with self._counts_lock:
+            self._counts[name] += 1
+
+    def _reject(self, reason: str):
+        self._count("rejected")
+        raise QueryTooExpensive(reason)
+
+    def check(self, sql: str) -> GuardVerdict:
+        self._count("checked")
+        try:
+            plan = self.estimate(sql)
+        except Exception as e:
+            self._count("provider_errors")
+            if not self.fail_open:
+                raise QueryTooExpensive(f"Could not estimate the query plan: {e}") from e
+            logger.warning("⚠️ Cost guard skipped (plan estimate failed): %s", e)
+            return GuardVerdict(sql, "pass", reason="estimate failed")
+
+        if plan.estimated_rows <= self.max_estimated_rows and plan.subtree_cost <= self.max_subtree_cost:
+            self._count("passed")
+            return GuardVerdict(sql, "pass", plan)
+
+        reason = (f"estimated {plan.estimated_rows:,.0f} rows / cost {plan.subtree_cost:,.1f} "
+                  f"(limits {self.max_estimated_rows:,.0f} rows / cost {self.max_subtree_cost:,.1f})")
+        try:
+            tree = sqlglot.parse_one(sql, read=self.dialect)
+        except sqlglot.errors.ParseError:
+            tree = None
+        if self.action == "reject" or tree is None or not _can_limit(tree):
+            self._reject(f"Query too expensive: {reason}. Add filters or aggregate over a smaller range.")
+
+        current = tree.args.get("limit")
+        if current is not None and isinstance(current.expression, exp.Literal) and current.expression.is_int \
+                and int(current.expression.name) <= self.limit_rows:
+            self._reject(f"Query too expensive: {reason}.")
+        limited_sql = tree.limit(self.limit_rows).sql(dialect=self.dialect)
+        limited = self.estimate(limited_sql)
+        if limited.subtree_cost > self.max_subtree_cost:
+            self._reject(f"Query too expensive even with TOP {self.limit_rows}: {reason}.")
+        self._count("limited")
+        return GuardVerdict(limited_sql, "limited", limited, reason)
+
+    def stats(self) -> dict:
+        with self._counts_lock:
+            out = dict(self._counts)
+        out["plan_cache"] = self._plans.stats() if self._plans is not None else None
+        return out
@@ -0,0 +1,166 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from helpers.cache import TTLCache
+from tools.sql_cache import normalize_question
+
+
+def normalize_rows(vectors) -> np.ndarray:
+    """L2-normalize a batch of vectors (rows) so cosine similarity becomes a dot product."""
+    mat = np.asarray(vectors, dtype=np.float32)
+    if mat.ndim == 1:
+        mat = mat[None, :]
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+class SentenceTransformerEmbedder:
+    """
+    Local sentence-transformers model, loaded on first use.
+    Returns L2-normalized float32 rows, one per input text.
+    """
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+        self.model_name = model_name
+        self._model = None
+
+    def _load(self):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def __call__(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = self._load().encode(list(texts), convert_to_numpy=True, normalize_embeddings=True)
+        return np.asarray(vectors, dtype=np.float32)
+
+    def dimension(self) -> int:
+        return int(self._load().get_sentence_embedding_dimension())
+
+
+class MicroBatcher:
+    """
+    Merges concurrent embed requests into one model forward pass.
+
+    Callers block on a Future; a single worker thread takes the first waiting
+    text, keeps collecting for up to window_ms (or max_batch texts), embeds
+    the unique texts once and fans the rows back out.
+    """
+
+    def __init__(self, embed_fn: Callable[[List[str]], Sequence], window_ms: float = 5.0, max_batch: int = 64):
+        self.embed_fn = embed_fn
+        self.window = max(0.0, window_ms) / 1000.0
+        self.max_batch = max(1, int(max_batch))
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.texts = 0
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._start_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+                    self._worker.start()
+
+    def submit(self, text: str) -> Future:
+        self._ensure_worker()
+        fut: Future = Future()
+        self._queue.put((text, fut))
+        return fut
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        futures = [self.submit(t) for t in texts]
+        return np.stack([f.result() for f in futures]) if futures else np.zeros((0, 0), dtype=np.float32)
+
+    def _collect(self) -> List[tuple]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            waiting: Dict[str, List[Future]] = {}
+            for text, fut in batch:
+                waiting.setdefault(text, []).append(fut)
+            texts = list(waiting)
+            try:
+                rows = normalize_rows(self.embed_fn(texts))
+                rows.setflags(write=False)  # rows end up shared through the LRU
+            except Exception as e:  # surface the model error to every caller
+                for futs in waiting.values():
+                    for fut in futs:
+                        fut.set_exception(e)
+                continue
+            self.batches += 1
+            self.texts += len(texts)
+            for text, row in zip(texts, rows):
+                for fut in waiting[text]:
+                    fut.set_result(row)
+
+
+class CachedQueryEmbedder:
+    """
+    Query-side embedder: LRU of vectors keyed by normalized question text,
+    misses go through a MicroBatcher. Not meant for indexing documents.
+    """
+
+    def __init__(self, embed_fn: Callable[[List[str]], Sequence], max_entries: int = 2048,
+                 window_ms: float = 5.0, max_batch: int = 64):
+        self.embed_fn = embed_fn
+        self._vectors = TTLCache(max_entries=max_entries) if max_entries else None
+        self._batcher = MicroBatcher(embed_fn, window_ms=window_ms, max_batch=max_batch)
+        self.primed = 0
+
+    def __call__(self, texts: Sequence[str]) -> np.ndarray:
+        keys = [normalize_question(t) or t for t in texts]
+        rows: List[Optional[np.ndarray]] = [
+            self._vectors.get(k) if self._vectors is not None else None for k in keys
+        ]
+        pending = {i: self._batcher.submit(texts[i]) for i, row in enumerate(rows) if row is None}
+        for i, fut in pending.items():
+            rows[i] = fut.result()
+            if self._vectors is not None:
+                self._vectors.put(keys[i], rows[i])
+        return np.stack(rows) if rows else np.zeros((0, 0), dtype=np.float32)
+
+    def prime(self, texts: Sequence[str]) -> int:
+        """
+        Seed the LRU for questions known up front (a /api/chat/batch request): the
+        uncached ones go to embed_fn in one call, past the micro-batcher's max_batch.
+        Returns how many texts were embedded.
+        """
+        if self._vectors is None:
+            return 0
+        missing: Dict[str, str] = {}
+        for text in texts:
+            key = normalize_question(text) or text
+            if key not in missing and self._vectors.get(key) is None:
+                missing[key] = text
+        if not missing:
+            return 0
+        rows = normalize_rows(self.embed_fn(list(missing.values())))
+        rows.setflags(write=False)
+        for key, row in zip(missing, rows):
+            self._vectors.put(key, row)
+        self.primed += len(missing)
+        return len(missing)
+
+    def stats(self) -> dict:
+        out = self._vectors.stats() if self._vectors is not None else {}
+        out.update({"batches": self._batcher.batches, "embedded": self._batcher.texts, "primed": self.primed})
+        return out
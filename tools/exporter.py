@@ -0,0 +1,87 @@
+import zlib
+from typing import Iterable, Iterator, List
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+# format → (media type, file extension)
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+
+
+class _Sink:
+    """Write-only file object the pyarrow writers push into; drained after every batch."""
+
+    closed = False
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def drain(self) -> bytes:
+        out = b"".join(self._chunks)
+        self._chunks.clear()
+        return out
+
+
+def encode_batches(batches: Iterable[pa.RecordBatch], fmt: str, row_group_rows: int = 65536) -> Iterator[bytes]:
+    """
+    Encode a stream of same-schema record batches as CSV, Parquet or an Arrow IPC
+    stream, yielding bytes as they are produced. Parquet buffers up to
+    `row_group_rows` rows per row group; the other formats hold one batch.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    sink = _Sink()
+    out = pa.PythonFile(sink, mode="w")
+    writer, pending, pending_rows = None, [], 0
+    for batch in batches:
+        if writer is None:
+            if fmt == "csv":
+                writer = pa_csv.CSVWriter(out, batch.schema)
+            elif fmt == "parquet":
+                writer = pq.ParquetWriter(out, batch.schema, compression="zstd")
+            else:
+                writer = pa.ipc.new_stream(out, batch.schema)
+        if fmt == "parquet":
+            pending.append(batch)
+            pending_rows += batch.num_rows
+            if pending_rows < row_group_rows:
+                continue
+            writer.write_table(pa.Table.from_batches(pending))
+            pending, pending_rows = [], 0
+        else:
+            writer.write_batch(batch)
+        chunk = sink.drain()
+        if chunk:
+            yield chunk
+    if writer is not None:
+        if pending:
+            writer.write_table(pa.Table.from_batches(pending))
+        writer.close()
+    tail = sink.drain()
+    if tail:
+        yield tail
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Gzip a byte stream incrementally (one compressor, flushed per chunk so output keeps flowing)."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31 → gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
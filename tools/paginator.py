@@ -1,3 +1,10 @@
+import base64
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import orjson
+import sqlglot
+from sqlglot import exp
+
 from helpers.errors import PaginationError
 
 def wrap_with_pagination(sql: str, page: int, page_size: int) -> str:
@@ -7,3 +14,190 @@ def wrap_with_pagination(sql: str, page: int, page_size: int) -> str:
         return normalized
     # Wrap in derived table to not alter user semantics; ORDER BY 1 is acceptable for pagination baseline.
     return f"SELECT * FROM ({normalized}) AS _q ORDER BY 1 OFFSET {max(0,(page-1)*page_size)} ROWS FETCH NEXT {page_size} ROWS ONLY"
+
+
+def _parse_select(sql: str, dialect: str) -> Optional[exp.Select]:
+    try:
+        tree = sqlglot.parse_one(sql.strip().rstrip(";"), read=dialect)
+    except Exception:
+        return None
+    return tree if isinstance(tree, exp.Select) else None
+
+
+def first_page_sql(sql: str, page_size: int, dialect: str = "tsql") -> str:
+    """
+    Page 1 as a plain TOP (n) on the query itself: no derived table and no
+    sort unless the user asked for one. Falls back to wrap_with_pagination
+    for shapes TOP cannot be injected into (UNIONs, OFFSET/FETCH, parse errors).
+    """
+    tree = _parse_select(sql, dialect)
+    if tree is None or tree.args.get("offset") is not None:
+        return wrap_with_pagination(sql, 1, page_size)
+
+    limit = tree.args.get("limit")
+    if limit is not None:
+        current = limit.expression
+        if isinstance(current, exp.Literal) and current.is_int and int(current.name) <= page_size:
+            return tree.sql(dialect=dialect)
+        if not isinstance(current, exp.Literal):
+            return tree.sql(dialect=dialect)  # TOP (@var) / PERCENT etc. — leave as written
+    return tree.limit(page_size).sql(dialect=dialect)
+
+
+# ---------------------------------------------------------------------- #
+# Keyset (seek) pagination
+# ---------------------------------------------------------------------- #
+def _key_column_for(table: str, columns: Set[str]) -> Optional[str]:
+    """Best guess at a table's unique key: `Id`, else `<Table>Id` / `<Singular>Id`."""
+    bare = table.split(".")[-1]
+    lowered = {c.lower(): c for c in columns}
+    for candidate in ("id", f"{bare}id", f"{bare.rstrip('s')}id"):
+        if candidate.lower() in lowered:
+            return lowered[candidate.lower()]
+    return None
+
+
+def _conjuncts(condition: exp.Expression) -> List[exp.Expression]:
+    """Top-level AND terms of a condition (parentheses unwrapped); anything under OR/NOT stays whole."""
+    condition = condition.unnest()
+    if isinstance(condition, exp.And):
+        return _conjuncts(condition.left) + _conjuncts(condition.right)
+    return [condition]
+
+
+def _resolve_table(table: exp.Table, columns_by_table: Dict[str, Set[str]]) -> Optional[str]:
+    if table.db:
+        full = f"{table.db}.{table.name}"
+        return next((t for t in columns_by_table if t.lower() == full.lower()), None)
+    matches = [t for t in columns_by_table if t.split(".")[-1].lower() == table.name.lower()]
+    return matches[0] if len(matches) == 1 else None
+
+
+def derive_key_columns(
+    sql: str,
+    columns_by_table: Dict[str, Set[str]],
+    foreign_keys: Dict[str, List[Tuple[str, str, str]]],
+    dialect: str = "tsql",
+) -> Optional[List[str]]:
+    """
+    Output column names that uniquely identify each result row, or None if
+    the query shape does not allow keyset paging (aggregates, DISTINCT,
+    user ORDER BY/TOP, unions, subqueries in FROM, unnamed projections).
+
+    Uses each table's `Id`-style column from the schema. When every JOIN
+    follows a schema foreign key towards its parent (many-to-one), the root
+    table's key alone is unique; otherwise every table's key is required.
+    """
+    tree = _parse_select(sql, dialect)
+    if tree is None or tree.args.get("with") or tree.args.get("with_"):
+        return None
+    if any(tree.args.get(k) for k in ("group", "distinct", "order", "limit", "offset", "having")):
+        return None
+    if tree.find(exp.AggFunc):
+        return None
+
+    # Source tables, by alias
+    from_ = tree.args.get("from") or tree.args.get("from_")
+    joins = tree.args.get("joins") or []
+    sources = [from_.this if from_ else None] + [j.this for j in joins]
+    if not sources or any(not isinstance(s, exp.Table) for s in sources):
+        return None
+    tables = {}  # alias -> full schema table name
+    for src in sources:
+        full = _resolve_table(src, columns_by_table)
+        if full is None:
+            return None
+        tables[(src.alias or src.name).lower()] = full
+    root_alias = (sources[0].alias or sources[0].name).lower()
+
+    # Output column names and which (alias, column) each one projects
+    outputs: Dict[Tuple[str, str], str] = {}
+    names: List[str] = []
+    for proj in tree.expressions:
+        if isinstance(proj, exp.Star):
+            if len(tables) != 1:
+                return None
+            for col in columns_by_table[tables[root_alias]]:
+                outputs[(root_alias, col.lower())] = col
+                names.append(col)
+            continue
+        name = proj.alias_or_name
+        if not name:
+            return None
+        names.append(name)
+        inner = proj.this if isinstance(proj, exp.Alias) else proj
+        if isinstance(inner, exp.Column):
+            alias = (inner.table or (root_alias if len(tables) == 1 else "")).lower()
+            outputs.setdefault((alias, inner.name.lower()), name)
+    if len({n.lower() for n in names}) != len(names):
+        return None  # duplicate output names can't be addressed from a derived table
+
+    keys = {}
+    for alias, full in tables.items():
+        key = _key_column_for(full, columns_by_table[full])
+        keys[alias] = outputs.get((alias, key.lower())) if key else None
+
+    def _is_many_to_one(join: exp.Join) -> bool:
+        """JOIN parent ON child.fk = parent.key, with the FK declared in the schema."""
+        parent_alias = (join.this.alias or join.this.name).lower()
+        parent = tables[parent_alias]
+        parent_key = _key_column_for(parent, columns_by_table[parent])
+        on = join.args.get("on")
+        if parent_key is None or on is None:
+            return False
+        # an equality under OR does not constrain every joined row
+        for eq in _conjuncts(on):
+            if not isinstance(eq, exp.EQ):
+                continue
+            left, right = eq.left, eq.right
+            if not (isinstance(left, exp.Column) and isinstance(right, exp.Column)):
+                continue
+            for child_col, parent_col in ((left, right), (right, left)):
+                if (parent_col.table or "").lower() != parent_alias or parent_col.name.lower() != parent_key.lower():
+                    continue
+                child = tables.get((child_col.table or "").lower())
+                for fk_col, ref_table, ref_col in foreign_keys.get(child or "", []):
+                    if (fk_col.lower() == child_col.name.lower() and ref_table.lower() == parent.lower()
+                            and ref_col.lower() == parent_key.lower()):
+                        return True
+        return False
+
+    if all(_is_many_to_one(j) for j in joins):
+        return [keys[root_alias]] if keys[root_alias] else None
+    if any(j.side for j in joins) or not all(keys.values()):
+        return None  # outer joins can null out a key; every key must be projected
+    return [keys[alias] for alias in tables]
+
+
+def keyset_page_sql(sql: str, key_columns: Sequence[str], after: Optional[Sequence], page_size: int) -> Tuple[str, dict]:
+    """
+    Seek page: rows strictly after `after` in key order, as SQL + bind params.
+    (k1 > :k0) OR (k1 = :k0 AND k2 > :k1) ... lets SQL Server seek on the key index.
+    """
+    normalized = sql.strip().rstrip(";")
+    cols = [f"_q.[{c}]" for c in key_columns]
+    where, params = "", {}
+    if after is not None:
+        if len(after) != len(key_columns):
+            raise PaginationError("Cursor does not match this query's key columns.")
+        clauses = []
+        for i in range(len(cols)):
+            eqs = [f"{cols[j]} = :k{j}" for j in range(i)]
+            clauses.append("(" + " AND ".join(eqs + [f"{cols[i]} > :k{i}"]) + ")")
+        where = " WHERE " + " OR ".join(clauses)
+        params = {f"k{i}": v for i, v in enumerate(after)}
+    return (
+        f"SELECT TOP ({int(page_size)}) * FROM ({normalized}) AS _q{where} ORDER BY {', '.join(cols)}",
+        params,
+    )
+
+
+def encode_cursor(state: dict) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps(state, default=str)).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str) -> dict:
+    try:
+        return orjson.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except Exception as e:
+        raise PaginationError(f"Invalid cursor: {e}") from e
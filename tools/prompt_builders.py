@@ -1,5 +1,8 @@
 import json
-from typing import Dict, List
+import re
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from helpers.tokens import estimate_tokens
 
 # def build_sql_generation_messages(user_query: str, schema_json: Dict) -> List[Dict]:
 #     schema_excerpt = json.dumps(schema_json["DatabaseSchema"][:50])
@@ -25,18 +28,132 @@ from typing import Dict, List
 #         {"role": "user", "content": user},
 #     ]
 
-def build_sql_generation_messages(user_query: str, schema_json: Dict, retriever=None) -> List[Dict]:
-    if retriever:
-     
-        matches = retriever.query(user_query)
+_IDENT_SPLIT = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+")
 
-    
-        
-        schema_excerpt = json.dumps(matches, indent=2)
-    else:
-        schema_excerpt = json.dumps(schema_json["DatabaseSchema"][:50])
+SCHEMA_HEADER = "Tables (schema.table: column type, ...):\n"
+FK_HEADER = "Foreign keys (child.column -> parent.column):\n"
 
-    system = (
+
+def _words(text: str) -> Set[str]:
+    """Lower-cased identifier words: "StudentPayments_2024" → {"student", "payments", "2024"}."""
+    words = {w.lower() for w in _IDENT_SPLIT.findall(text or "")}
+    # crude singular form so "payments" also matches "Payment"
+    return words | {w[:-1] for w in words if len(w) > 3 and w.endswith("s")}
+
+
+def _full_name(t: Dict) -> str:
+    return t.get("FullTableName") or f"{t.get('SchemaName') or ''}.{t.get('TableName') or ''}".strip(".")
+
+
+def _columns(t: Dict) -> List[Tuple[str, str]]:
+    cols = t.get("Columns") or {}
+    if isinstance(cols, dict):
+        return [(c, str(typ or "")) for c, typ in cols.items()]
+    # older exports: [{"ColumnName": ..., "DataType": ...}]
+    return [(c.get("ColumnName", ""), str(c.get("DataType") or "")) for c in cols if isinstance(c, dict)]
+
+
+class SchemaRenderer:
+    """
+    Compact, token-budgeted schema text for the SQL prompt.
+
+    One line per table ("schema.table: col type, ..."), FKs listed once in a
+    trailing block; tables are added in rank order and the lowest-ranked
+    ones are dropped first when the budget runs out.
+    """
+
+    def __init__(self, schema_json: Dict):
+        self._lines: Dict[str, str] = {}
+        self._fks: Dict[str, List[str]] = {}
+        self._words: Dict[str, Set[str]] = {}
+        for t in schema_json.get("DatabaseSchema", []):
+            name = _full_name(t)
+            if name in self._lines:
+                continue
+            cols = _columns(t)
+            self._lines[name] = f"{name}: " + ", ".join(f"{c} {typ}".strip() for c, typ in cols)
+            self._fks[name] = [
+                f"{name}.{fk['ParentColumn']} -> {fk['ReferencedTable']}.{fk['ReferencedColumn']}"
+                for fk in t.get("ForeignKeys") or []
+                if fk.get("ParentColumn") and fk.get("ReferencedTable") and fk.get("ReferencedColumn")
+            ]
+            self._words[name] = _words(name).union(*(_words(c) for c, _ in cols))
+
+    def rank_lexical(self, user_query: str, limit: int = 25) -> List[str]:
+        """Fallback ranking without a retriever: identifier-word overlap with the question."""
+        q = _words(user_query) | _words((user_query or "").lower())
+        scored = [(len(q & words), i, name) for i, (name, words) in enumerate(self._words.items())]
+        scored.sort(key=lambda x: (-x[0], x[1]))
+        return [name for _, _, name in scored[:limit]]
+
+    def render(self, ranked: Sequence, token_budget: Optional[int] = None) -> Tuple[str, Dict]:
+        """
+        ranked: table names (or retriever matches) best-first.
+        Returns (text, {"tables", "dropped_tables", "tokens"}).
+        """
+        lines: List[str] = []
+        fks: List[str] = []
+        seen_fk: Set[str] = set()
+        used = estimate_tokens(SCHEMA_HEADER) + estimate_tokens(FK_HEADER)
+        dropped = 0
+        for item in ranked:
+            if isinstance(item, dict):
+                # retriever match; prefer the typed line from the schema file
+                name = item.get("table") or ""
+                line = self._lines.get(name) or f"{name}: " + ", ".join(item.get("columns") or [])
+                table_fks = self._fks.get(name) or [f"{name}.{fk}" for fk in item.get("foreign_keys") or []]
+            else:
+                name, line, table_fks = item, self._lines.get(item), self._fks.get(item, [])
+                if line is None:
+                    continue
+            new_fks = [fk for fk in table_fks if fk not in seen_fk]
+            cost = estimate_tokens(line) + sum(estimate_tokens(fk) for fk in new_fks)
+            # the best match is always kept, even if it alone exceeds the budget
+            if token_budget is not None and lines and used + cost > token_budget:
+                dropped += 1
+                continue
+            used += cost
+            lines.append(line)
+            fks.extend(new_fks)
+            seen_fk.update(new_fks)
+
+        text = SCHEMA_HEADER + "\n".join(lines)
+        if fks:
+            text += "\n" + FK_HEADER + "\n".join(fks)
+        return text, {"tables": len(lines), "dropped_tables": dropped, "tokens": estimate_tokens(text)}
+
+
+def build_schema_excerpt_with_stats(user_query: str, schema_json: Dict, retriever=None,
+                                    mode: str = "json", token_budget: Optional[int] = None,
+                                    max_tables: int = 50,
+                                    renderer: Optional[SchemaRenderer] = None) -> Tuple[str, Dict]:
+    """
+    Schema text for the SQL prompt plus size stats.
+
+    mode="json" keeps the original dump; mode="compact" renders through
+    SchemaRenderer under token_budget and reports tokens saved vs. the dump.
+    """
+    matches = retriever.query(user_query) if retriever else None
+    legacy = json.dumps(matches, indent=2) if matches is not None else json.dumps(schema_json["DatabaseSchema"][:50])
+    legacy_tokens = estimate_tokens(legacy)
+    if mode != "compact":
+        return legacy, {"mode": mode, "tokens": legacy_tokens, "tokens_saved": 0}
+
+    renderer = renderer or SchemaRenderer(schema_json)
+    ranked = matches if matches is not None else renderer.rank_lexical(user_query, limit=max_tables)
+    text, stats = renderer.render(ranked, token_budget)
+    stats.update({"mode": mode, "baseline_tokens": legacy_tokens,
+                  "tokens_saved": max(0, legacy_tokens - stats["tokens"])})
+    return text, stats
+
+
+def build_schema_excerpt(user_query: str, schema_json: Dict, retriever=None, **kwargs) -> str:
+    return build_schema_excerpt_with_stats(user_query, schema_json, retriever, **kwargs)[0]
+
+
+# Byte-stable: no interpolation, so every request starts with the same prefix
+# and provider-side prompt caching (OpenAI, DeepSeek) can reuse it.
+SQL_SYSTEM_PROMPT = (
     "You are a SQL code generator for a Ministry of Education database.\n"
     "Your ONLY job is to return one valid JSON object with a safe T-SQL SELECT query.\n\n"
     "❌ Forbidden:\n"
@@ -44,11 +161,10 @@ def build_sql_generation_messages(user_query: str, schema_json: Dict, retriever=
     "- Providing explanations, text, or markdown outside of JSON.\n"
     "- Returning answers unrelated to the provided schema.\n\n"
     "✅ Required:\n"
-    "- Use ONLY the provided schema excerpt.\n"
+    "- Use ONLY the schema excerpt given in the next message.\n"
     "- If no relevant table exists, return sql=null, needs_clarification=true, and explain why in notes.\n"
     "- Always include all 5 keys: sql, confidence, needs_clarification, notes, message.\n"
     "- SQL must be a single-line string (use \\n for newlines).\n\n"
-    f"Schema excerpt:\n{schema_excerpt}\n\n"
     "⚠️ STRICT OUTPUT FORMAT:\n"
     "{\n"
     "  \"sql\": string or null,\n"
@@ -61,20 +177,45 @@ def build_sql_generation_messages(user_query: str, schema_json: Dict, retriever=
 )
 
 
+def build_sql_generation_messages(user_query: str, schema_json: Dict, retriever=None,
+                                  schema_excerpt: Optional[str] = None,
+                                  history: Optional[List[Dict]] = None) -> List[Dict]:
+    """
+    Layout, most stable first: static rules/format → schema excerpt →
+    chat history → current question.
+    """
+    if schema_excerpt is None:
+        schema_excerpt = build_schema_excerpt(user_query, schema_json, retriever)
+
     user = f"User request: {user_query}"
     return [
-        {"role": "system", "content": system},
+        {"role": "system", "content": SQL_SYSTEM_PROMPT},
+        {"role": "system", "content": f"Schema excerpt:\n{schema_excerpt}"},
+        *(history or []),
         {"role": "user", "content": user},
     ]
 
 
-
-def build_beautify_messages(user_query: str, sql: str, preview_markdown: str) -> List[Dict]:
+def build_beautify_messages(user_query: str, sql: str, preview_markdown: str,
+                            result_format: str = "table") -> List[Dict]:
+    """
+    `preview_markdown`: the result as text; a markdown table (result_format="table")
+    or a column profile + sample rows (result_format="profile").
+    """
+    if result_format == "profile":
+        result_rules = (
+            "- Take totals, ranges, counts and distributions from the column profile "
+            "(it covers every fetched row); the sample rows are only examples.\n"
+            "- Show a small markdown table of the sample rows only if it helps the answer.\n"
+        )
+    else:
+        result_rules = "- Show a clean markdown table of the preview (already provided as markdown).\n"
+    label = "Result" if result_format == "profile" else "Preview"
     system = (
         "You are a senior data analyst and presenter. Produce a clear, accurate, user-friendly summary.\n"
         "Requirements:\n"
         "- Explain what the query returns in simple business language.\n"
-        "- Show a clean markdown table of the preview (already provided as markdown).\n"
+        + result_rules +
         "- Mention filters/date ranges, grouping, and any caveats.\n"
         "- If appropriate, propose 1-2 follow-up questions.\n"
         "Return markdown only."
@@ -82,7 +223,7 @@ def build_beautify_messages(user_query: str, sql: str, preview_markdown: str) ->
     user = (
         f"Original request: {user_query}\n\n"
         f"SQL used:\n```\n{sql}\n```\n\n"
-        f"Preview:\n{preview_markdown}\n"
+        f"{label}:\n{preview_markdown}\n"
     )
     return [
         {"role": "system", "content": system},
@@ -0,0 +1,47 @@
+import uuid
+from dataclasses import dataclass
+from typing import List, Optional
+
+from helpers.cache import TTLCache
+
+
+@dataclass(frozen=True)
+class QueryHandle:
+    query_id: str
+    session_id: str
+    sql: str                           # validated SQL, before any paging rewrite
+    key_columns: Optional[List[str]]   # None → OFFSET fallback
+    page_size: int
+    question: str = ""               # original user question (for on-demand summaries)
+    row_limit: Optional[int] = None    # cost guard TOP when page 1 was limited; further pages stop there
+
+
+class QueryRegistry:
+    """
+    Short-lived handles for validated queries returned by /api/chat, so
+    further pages (and later exports/summaries) can be fetched without
+    regenerating SQL. Entries are LRU/TTL bounded and never persisted.
+    """
+
+    def __init__(self, max_entries: int = 5000, ttl_seconds: Optional[float] = 3600):
+        self._handles = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+    def register(self, session_id: str, sql: str, key_columns: Optional[List[str]], page_size: int,
+                 question: str = "", row_limit: Optional[int] = None) -> QueryHandle:
+        handle = QueryHandle(
+            query_id=uuid.uuid4().hex,
+            session_id=session_id,
+            sql=sql,
+            key_columns=list(key_columns) if key_columns else None,
+            page_size=page_size,
+            question=question,
+            row_limit=row_limit,
+        )
+        self._handles.put(handle.query_id, handle)
+        return handle
+
+    def get(self, query_id: str) -> Optional[QueryHandle]:
+        return self._handles.get(query_id)
+
+    def stats(self) -> dict:
+        return self._handles.stats()
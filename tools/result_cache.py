@@ -0,0 +1,158 @@
+import hashlib
+from dataclasses import dataclass
+from typing import FrozenSet, Iterable, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import sqlglot
+from sqlglot import exp
+
+from helpers.cache import TTLCache
+from tools.arrow_frames import table_to_frame
+
+
+def _parse(sql: str, dialect: str) -> Optional[exp.Expression]:
+    try:
+        return sqlglot.parse_one(sql, read=dialect)
+    except Exception:
+        return None
+
+
+def _canonicalize(tree: exp.Expression, dialect: str) -> exp.Expression:
+    """Rename table aliases to t0, t1, ... and sort commutative AND/OR operands and IN lists."""
+    tree = tree.copy()
+
+    aliases = {}
+    for i, table in enumerate(tree.find_all(exp.Table)):
+        alias = table.alias
+        if alias and alias not in aliases:
+            aliases[alias] = f"t{i}"
+            table.set("alias", exp.TableAlias(this=exp.to_identifier(aliases[alias])))
+    if aliases:
+        for col in tree.find_all(exp.Column):
+            if col.table in aliases:
+                col.set("table", exp.to_identifier(aliases[col.table]))
+
+    def _key(node: exp.Expression) -> str:
+        return node.sql(dialect=dialect)
+
+    for node in tree.find_all(exp.In):
+        if node.expressions:
+            node.set("expressions", sorted(node.expressions, key=_key))
+
+    # Deepest chains first so outer sort keys see already-canonical operands.
+    chains = [n for n in tree.find_all(exp.And, exp.Or) if type(n.parent) is not type(n)]
+    for node in reversed(chains):
+        ops = sorted((op.unnest() for op in node.flatten()), key=_key)
+        combine = exp.and_ if isinstance(node, exp.And) else exp.or_
+        combined = combine(*ops, copy=False)
+        if node is tree:
+            tree = combined
+        else:
+            node.replace(combined)
+    return tree
+
+
+def sql_fingerprint(sql: str, dialect: str = "tsql") -> str:
+    """
+    Canonical hash of a SELECT: insensitive to whitespace, keyword case,
+    table alias names and the order of AND/OR operands and IN-list literals.
+    """
+    tree = _parse(sql, dialect)
+    if tree is None:
+        canonical = " ".join(sql.lower().rstrip().rstrip(";").split())
+    else:
+        canonical = _canonicalize(tree, dialect).sql(dialect=dialect, normalize=True)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+def referenced_tables(sql: str, dialect: str = "tsql") -> FrozenSet[str]:
+    """Lower-cased bare table names referenced by the query (used for invalidation)."""
+    tree = _parse(sql, dialect)
+    if tree is None:
+        return frozenset()
+    return frozenset(t.name.lower() for t in tree.find_all(exp.Table) if t.name)
+
+
+@dataclass(frozen=True)
+class CachedResult:
+    payload: bytes             # Arrow IPC stream (compressed record batches)
+    tables: FrozenSet[str]
+    rows: int
+
+
+class ResultCache:
+    """
+    Result cache for MsSqlExecutor.run_select.
+
+    Keys are the canonical SQL fingerprint plus paging arguments. Frames are
+    stored as compressed Arrow IPC buffers, so the byte budget reflects the
+    real memory held rather than pickled Python objects.
+    """
+
+    def __init__(
+        self,
+        dialect: str = "tsql",
+        ttl_seconds: Optional[float] = 60,
+        max_bytes: int = 256 * 1024 * 1024,
+        max_entries: int = 10000,
+        compression: Optional[str] = "zstd",
+    ):
+        self.dialect = dialect
+        self.compression = compression
+        self._cache = TTLCache(
+            max_entries=max_entries,
+            ttl_seconds=ttl_seconds,
+            max_bytes=max_bytes,
+            sizeof=lambda r: len(r.payload),
+        )
+        self.invalidations = 0
+
+    def make_key(self, sql: str, *parts) -> Tuple:
+        return (sql_fingerprint(sql, self.dialect),) + tuple(parts)
+
+    # ------------------------------------------------------------------ #
+    def _encode(self, df: pd.DataFrame) -> Optional[bytes]:
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowException, TypeError, ValueError):
+            return None  # e.g. mixed-type object columns; just don't cache
+        sink = pa.BufferOutputStream()
+        options = pa.ipc.IpcWriteOptions(compression=self.compression)
+        with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    @staticmethod
+    def _decode(payload: bytes) -> pd.DataFrame:
+        return table_to_frame(pa.ipc.open_stream(payload).read_all())
+
+    # ------------------------------------------------------------------ #
+    def get(self, sql: str, *parts) -> Optional[pd.DataFrame]:
+        entry = self._cache.get(self.make_key(sql, *parts))
+        return None if entry is None else self._decode(entry.payload)
+
+    def put(self, sql: str, *parts, df: pd.DataFrame, ttl_seconds: Optional[float] = None) -> bool:
+        payload = self._encode(df)
+        if payload is None:
+            return False
+        entry = CachedResult(payload=payload, tables=referenced_tables(sql, self.dialect), rows=len(df))
+        return self._cache.put(self.make_key(sql, *parts), entry, ttl_seconds=ttl_seconds)
+
+    def invalidate_tables(self, tables: Iterable[str]) -> int:
+        """Drop every cached result that reads from any of the given tables ("schema.table" or bare)."""
+        names = {t.split(".")[-1].strip("[]").lower() for t in tables if t}
+        dropped = self._cache.remove_where(lambda _, entry: bool(entry.tables & names))
+        self.invalidations += dropped
+        return dropped
+
+    def invalidate_table(self, table: str) -> int:
+        return self.invalidate_tables([table])
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        out = self._cache.stats()
+        out["invalidations"] = self.invalidations
+        return out
@@ -0,0 +1,162 @@
+from typing import Dict, List, Tuple
+
+import pandas as pd
+
+from helpers.formatting import to_markdown
+from helpers.tokens import estimate_tokens
+from tools.chart_builder import as_datetime, is_id_name, is_temporal
+
+MAX_CELL_CHARS = 60   # sample cells longer than this are clipped in the prompt
+
+
+def _num(value: float) -> str:
+    if value is None or value != value:
+        return "n/a"
+    if float(value).is_integer():
+        return f"{value:,.0f}"
+    return f"{value:,.2f}" if abs(value) >= 1000 else f"{value:.4g}"
+
+
+def _dtype(s: pd.Series) -> str:
+    """Column dtype as the prompt shows it: the Arrow type for Arrow-backed columns."""
+    if isinstance(s.dtype, pd.ArrowDtype):
+        return str(s.dtype.pyarrow_dtype)
+    return "category" if isinstance(s.dtype, pd.CategoricalDtype) else str(s.dtype)
+
+
+def profile_frame(df: pd.DataFrame, top_k: int = 5) -> Dict:
+    """
+    Per-column profile of a whole result: dtype, kind, null rate, min/max/mean/sum for numbers,
+    range for dates, distinct count and top-k values for text. Null rates and the
+    numeric stats are one vectorized pass over all columns.
+    """
+    rows = int(df.shape[0])
+    columns: List[Dict] = []
+    if rows == 0:
+        return {"rows": 0, "columns": [{"name": str(c), "dtype": _dtype(df[c]), "kind": "empty", "nulls": 0.0}
+                                       for c in df.columns]}
+
+    null_rates = df.isna().mean()
+    numeric = [c for c in df.columns
+               if pd.api.types.is_numeric_dtype(df[c]) and not pd.api.types.is_bool_dtype(df[c])]
+    # Arrow decimals/ints → float64 once, then all columns at once
+    numeric_stats = df[numeric].astype("float64").agg(["min", "max", "mean", "sum"]) if numeric else None
+
+    for name in df.columns:
+        s = df[name]
+        col = {"name": str(name), "dtype": _dtype(s), "nulls": round(float(null_rates[name]), 4)}
+        if name in numeric:
+            if is_id_name(name):
+                col.update(kind="id", distinct=int(s.nunique()))
+            else:
+                stats = numeric_stats[name]
+                col.update(kind="number", min=float(stats["min"]), max=float(stats["max"]),
+                           mean=float(stats["mean"]), sum=float(stats["sum"]))
+        elif pd.api.types.is_bool_dtype(s):
+            col.update(kind="bool", true=round(float(s.astype("float64").mean()), 4))
+        elif is_temporal(s):
+            ts = as_datetime(s)
+            col.update(kind="datetime", min=ts.min(), max=ts.max())
+        else:
+            counts = s.value_counts(dropna=True)   # categoricals count their codes
+            counts = counts[counts > 0]
+            col.update(kind="text", distinct=int(counts.size),
+                       top=[(str(v), int(n)) for v, n in counts.head(top_k).items()])
+        columns.append(col)
+    return {"rows": rows, "columns": columns}
+
+
+def _date(value) -> str:
+    if value is None or pd.isna(value):
+        return "n/a"
+    return value.strftime("%Y-%m-%d" if value == value.normalize() else "%Y-%m-%d %H:%M")
+
+
+def describe_column(col: Dict, rows: int) -> str:
+    kind, nulls = col["kind"], col["nulls"]
+    if kind == "number":
+        text = f"min {_num(col['min'])}, max {_num(col['max'])}, mean {_num(col['mean'])}, sum {_num(col['sum'])}"
+    elif kind == "id":
+        text = "all distinct" if col["distinct"] == rows else f"{col['distinct']:,} distinct"
+    elif kind == "bool":
+        text = f"{col['true']:.0%} true"
+    elif kind == "datetime":
+        text = f"{_date(col['min'])} → {_date(col['max'])}"
+    elif kind == "text":
+        non_null = max(1, rows - round(nulls * rows))
+        if col["distinct"] == non_null:
+            text = "all distinct"
+        else:
+            top = ", ".join(f"{v[:MAX_CELL_CHARS]} {n / non_null:.0%}" for v, n in col["top"])
+            text = f"{col['distinct']:,} distinct; top: {top}"
+    else:
+        text = "no rows"
+    return f"- {col['name']} ({kind}, {col['dtype']}): {text}" + (f"; nulls {nulls:.1%}" if nulls else "")
+
+
+def _clip(df: pd.DataFrame) -> pd.DataFrame:
+    """Sample rows as prompt text: long cells clipped, missing values shown as NULL (never "nan")."""
+    text = [c for c in df.columns if not pd.api.types.is_numeric_dtype(df[c])]
+    holey = [c for c in df.columns if c not in text and df[c].isna().any()]
+    if not text and not holey:
+        return df
+    df = df.copy()
+    for c in text:
+        missing = df[c].isna()
+        s = df[c].astype(str)
+        s = s.where(s.str.len() <= MAX_CELL_CHARS, s.str[:MAX_CELL_CHARS - 1] + "…")
+        df[c] = s.astype(object).where(~missing, "NULL")
+    for c in holey:
+        df[c] = df[c].astype(object).where(df[c].notna(), "NULL")
+    return df
+
+
+def build_result_context(df: pd.DataFrame, has_more: bool = False, token_budget: int = 1200,
+                         sample_rows: int = 10, top_k: int = 5) -> Tuple[str, Dict]:
+    """
+    Result text for the beautify prompt: row/column counts, one profile line per column
+    (computed over every fetched row) and as many sample rows as fit in token_budget.
+    Columns that do not fit are named in a closing note instead of silently dropped.
+    """
+    profile = profile_frame(df, top_k=top_k)
+    rows = profile["rows"]
+    scope = "more rows exist beyond these" if has_more else "complete result"
+    header = [f"Rows fetched: {rows:,} ({scope}); columns: {len(profile['columns'])}",
+              "Column profile (computed over all fetched rows):"]
+    lines, used = list(header), estimate_tokens("\n".join(header))
+    shown = 0
+    for col in profile["columns"]:
+        line = describe_column(col, rows)
+        cost = estimate_tokens(line) + 1
+        if used + cost > token_budget:
+            break
+        lines.append(line)
+        used += cost
+        shown += 1
+    while shown < len(profile["columns"]):
+        rest = [c["name"] for c in profile["columns"][shown:]]
+        names = ", ".join(rest)
+        if len(names) > 300:
+            names = names[:names.rfind(", ", 0, 300)] + ", …"
+        note = f"- … {len(rest)} more columns not profiled: {names}"
+        if used + estimate_tokens(note) <= token_budget or shown == 0:
+            lines.append(note)
+            used += estimate_tokens(note)
+            break
+        used -= estimate_tokens(lines.pop()) + 1   # make room for the note
+        shown -= 1
+
+    sampled = 0
+    k = min(sample_rows, rows)
+    while k > 0:
+        sample = f"\nSample rows ({k} of {rows:,}):\n" + to_markdown(_clip(df.head(k)), max_rows=k)
+        if used + estimate_tokens(sample) <= token_budget:
+            lines.append(sample)
+            used += estimate_tokens(sample)
+            sampled = k
+            break
+        k //= 2
+
+    text = "\n".join(lines)
+    return text, {"tokens": estimate_tokens(text), "rows": rows, "columns_profiled": shown,
+                  "sample_rows": sampled}
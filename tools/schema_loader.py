@@ -1,5 +1,5 @@
 import json
-from typing import Dict, Set, Tuple
+from typing import Dict, List, Set, Tuple
 
 def load_schema(schema_path: str) -> Dict:
     """Load the entire database schema JSON file."""
@@ -42,3 +42,22 @@ def extract_allowlists(schema_json: Dict) -> Tuple[Set[str], Dict[str, Set[str]]
             }
 
     return tables, columns_by_table
+
+def extract_foreign_keys(schema_json: Dict) -> Dict[str, List[Tuple[str, str, str]]]:
+    """Map each table to its (ParentColumn, ReferencedTable, ReferencedColumn) foreign keys."""
+    fks_by_table = {}
+
+    for t in schema_json.get("DatabaseSchema", []):
+        full_table = t.get("FullTableName") or (
+            f"{t.get('SchemaName', 'dbo')}.{t.get('TableName')}" if t.get("TableName") else None
+        )
+        if not full_table:
+            continue
+
+        fks_by_table[full_table] = [
+            (fk["ParentColumn"], fk["ReferencedTable"], fk["ReferencedColumn"])
+            for fk in t.get("ForeignKeys", [])
+            if fk.get("ParentColumn") and fk.get("ReferencedTable") and fk.get("ReferencedColumn")
+        ]
+
+    return fks_by_table
@@ -1,132 +1,246 @@
-# ✅ Patch sqlite3 if system version is too old
-__import__('pysqlite3')
-import sys
-sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from tools.embeddings import CachedQueryEmbedder, SentenceTransformerEmbedder
+from tools.sql_cache import content_hash
+from tools.vector_index import NumpyVectorIndex
+
+logger = logging.getLogger("ai-sql-agent")
+
+
+def _use_pysqlite3():
+    # ✅ Patch sqlite3 if system version is too old
+    import sys
+    __import__('pysqlite3')
+    sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
+
+
+def table_records(schema_json: Dict) -> List[Dict]:
+    """One prebuilt retrieval record (+ embedding text in "doc") per table."""
+    records = []
+    for t in schema_json.get("DatabaseSchema", []):
+        schema_name = t.get("SchemaName") or ""
+        table_name = t.get("TableName") or ""
+        full_name = t.get("FullTableName") or f"{schema_name}.{table_name}".strip(".")
+        cols = list(t.get("Columns", {}).keys())
+        fks = [
+            f"{fk['ParentColumn']} -> {fk['ReferencedTable']}.{fk['ReferencedColumn']}"
+            for fk in t.get("ForeignKeys", [])
+            if fk.get("ParentColumn") and fk.get("ReferencedTable") and fk.get("ReferencedColumn")
+        ]
+        text_parts = [
+            f"Schema: {schema_name}",
+            f"Table: {full_name}",
+            f"Columns: {', '.join(cols)}"
+        ]
+        if fks:
+            text_parts.append(f"Foreign Keys: {', '.join(fks)}")
+        records.append({
+            "schema": schema_name,
+            "table": full_name,
+            "columns": cols,
+            "foreign_keys": fks,
+            "doc": ". ".join(text_parts),
+            "content_hash": content_hash(". ".join(text_parts)),
+        })
+    return records
 
-import chromadb
-from chromadb.utils import embedding_functions
-from typing import Dict, List
 
 class SchemaRetriever:
+    """
+    Top-k relevant tables for a question.
+
+    backend="chroma": persistent Chroma collection (SQLite + HNSW)
+    backend="numpy":  in-process memory-mapped matrix (tools/vector_index.py)
+
+    Each table is stored under its full name with a content hash, so sync()
+    only re-embeds new/changed tables and deletes dropped ones.
+    """
+
     def __init__(
         self,
         schema_json: Dict,
         persist_path: str = "./chroma_schema_index",
-        top_k: int = 10
+        top_k: int = 10,
+        backend: str = "chroma",
+        embedding_model: str = "all-MiniLM-L6-v2",
+        quantization: str = "float32",
+        embedding_fn: Optional[Callable] = None,
+        sync_batch_size: int = 64,
+        sync_on_start: bool = True,
+        query_cache_size: int = 2048,
+        embed_batch_window_ms: float = 5.0,
+        embed_max_batch: int = 64,
     ):
         self.top_k = top_k
-        self.client = chromadb.PersistentClient(path=persist_path)
+        self.backend = backend
+        self.embedding_model = embedding_model
+        self.quantization = quantization
+        self.sync_batch_size = sync_batch_size
+        self._sync_lock = threading.Lock()
+
+        if backend == "numpy":
+            self.embedding_fn = embedding_fn or SentenceTransformerEmbedder(embedding_model)
+            self.index = NumpyVectorIndex(persist_path, quantization=quantization)
+            if self.index.exists():
+                try:
+                    self.index.load()
+                except ValueError as e:
+                    logger.warning("⚠️ Rebuilding vector index: %s", e)
+                    self.index = NumpyVectorIndex(persist_path, quantization=quantization)
+        elif backend == "chroma":
+            _use_pysqlite3()
+            import chromadb
+            from chromadb.utils import embedding_functions
 
-        # ✅ Sentence Transformer embeddings (fast & local)
-        self.embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name="all-MiniLM-L6-v2"
+            self.client = chromadb.PersistentClient(path=persist_path)
+
+            # ✅ Sentence Transformer embeddings (fast & local)
+            self.embedding_fn = embedding_fn or embedding_functions.SentenceTransformerEmbeddingFunction(
+                model_name=embedding_model
+            )
+
+            self.collection = self.client.get_or_create_collection(
+                name="schema", embedding_function=self.embedding_fn
+            )
+        else:
+            raise ValueError(f"Unknown retriever backend: {backend}")
+
+        # question embeddings: LRU by normalized text + micro-batched model calls
+        self.query_embedder = CachedQueryEmbedder(
+            self.embedding_fn,
+            max_entries=query_cache_size,
+            window_ms=embed_batch_window_ms,
+            max_batch=embed_max_batch,
         )
 
-        self.collection = self.client.get_or_create_collection(
-            name="schema", embedding_function=self.embedding_fn
+        if sync_on_start:
+            self.sync(schema_json)
+
+    @classmethod
+    def from_config(cls, cfg, schema_json: Dict, **kwargs) -> "SchemaRetriever":
+        backend = cfg.retriever.get("backend", "chroma")
+        return cls(
+            schema_json,
+            persist_path=cfg.retriever["numpy_path"] if backend == "numpy" else cfg.retriever["persist_path"],
+            top_k=cfg.retriever["top_k"],
+            backend=backend,
+            embedding_model=cfg.retriever.get("embedding_model", "all-MiniLM-L6-v2"),
+            quantization=cfg.retriever.get("quantization", "float32"),
+            sync_batch_size=cfg.retriever.get("sync_batch_size", 64),
+            query_cache_size=cfg.retriever.get("query_cache_size", 2048),
+            embed_batch_window_ms=cfg.retriever.get("embed_batch_window_ms", 5.0),
+            embed_max_batch=cfg.retriever.get("embed_max_batch", 64),
+            **kwargs,
         )
 
-        # Only index once (first run)
-        if self.collection.count() == 0:
-            self._index_schema(schema_json)
-
-    def _index_schema(self, schema_json: Dict):
-        docs, ids, metas = [], [], []
-
-        for i, t in enumerate(schema_json.get("DatabaseSchema", [])):
-            schema_name = t.get("SchemaName")
-            table_name = t.get("TableName")
-            full_name = t.get("FullTableName", f"{schema_name}.{table_name}")
-
-            # ✅ Columns are now a dict {col: type}
-            cols = list(t.get("Columns", {}).keys())
-
-            # ✅ Foreign keys (same as before)
-            fks = [
-                f"{fk['ParentColumn']} -> {fk['ReferencedTable']}.{fk['ReferencedColumn']}"
-                for fk in t.get("ForeignKeys", [])
-            ]
-
-            # ✅ Text content for embeddings
-            text_parts = [
-                f"Schema: {schema_name}",
-                f"Table: {full_name}",
-                f"Columns: {', '.join(cols)}"
-            ]
-            if fks:
-                text_parts.append(f"Foreign Keys: {', '.join(fks)}")
-
-            text = ". ".join(text_parts)
-
-            unique_id = f"{full_name}_{i}"
-
-            docs.append(text)
-            ids.append(unique_id)
-            metas.append({
-                "schema": schema_name,
-                "table": full_name,
-                "columns": ", ".join(cols),
-                "foreign_keys": ", ".join(fks) if fks else ""
-            })
+    # ------------------------------------------------------------------ #
+    def sync(self, schema_json: Dict) -> Dict:
+        """Bring the index in line with schema_json; returns counts per change type."""
+        started = time.perf_counter()
+        records = {}
+        for r in table_records(schema_json):
+            records.setdefault(r["table"], r)  # first definition wins on duplicates
 
-        self.collection.add(documents=docs, ids=ids, metadatas=metas)
-
-    def _index_schema(self, schema_json: Dict):
-        docs, ids, metas = [], [], []
-
-        for i, t in enumerate(schema_json.get("DatabaseSchema", [])):
-            schema_name = t.get("SchemaName") or ""  # ✅ ensure not None
-            table_name = t.get("TableName") or ""
-            full_name = t.get("FullTableName") or f"{schema_name}.{table_name}".strip(".")
-
-            # ✅ Columns are dict {col: type}
-            cols = list(t.get("Columns", {}).keys())
-
-            # ✅ Handle missing FK keys safely
-            fks = []
-            for fk in t.get("ForeignKeys", []):
-                parent = fk.get("ParentColumn")
-                ref_table = fk.get("ReferencedTable")
-                ref_col = fk.get("ReferencedColumn")
-                if not (parent and ref_table and ref_col):
-                    continue
-                fks.append(f"{parent} -> {ref_table}.{ref_col}")
-
-            # ✅ Text content for embeddings
-            text_parts = [
-                f"Schema: {schema_name}",
-                f"Table: {full_name}",
-                f"Columns: {', '.join(cols)}"
-            ]
-            if fks:
-                text_parts.append(f"Foreign Keys: {', '.join(fks)}")
-
-            text = ". ".join(text_parts)
-            unique_id = f"{full_name}_{i}"
-
-            docs.append(text)
-            ids.append(unique_id)
-            metas.append({
-                # ✅ ensure all are strings (Chroma requires)
-                "schema": str(schema_name or ""),
-                "table": str(full_name or ""),
-                "columns": str(", ".join(cols) or ""),
-                "foreign_keys": str(", ".join(fks) or "")
-            })
+        with self._sync_lock:
+            if self.backend == "numpy":
+                stats = self._sync_numpy(records)
+            else:
+                stats = self._sync_chroma(records)
 
-        # ✅ Double-check no None remains
-        metas = [
-            {k: ("" if v is None else v) for k, v in meta.items()}
-            for meta in metas
-        ]
+        stats["seconds"] = round(time.perf_counter() - started, 3)
+        if stats["added"] or stats["updated"] or stats["deleted"]:
+            logger.info("🔄 Retriever sync: %s", stats)
+        return stats
+
+    def _batches(self, items: List) -> Iterator[List]:
+        for i in range(0, len(items), self.sync_batch_size):
+            yield items[i:i + self.sync_batch_size]
+
+    def _sync_chroma(self, records: Dict[str, Dict]) -> Dict:
+        existing = self.collection.get(include=["metadatas"])
+        current = {
+            id_: (meta or {}).get("content_hash")
+            for id_, meta in zip(existing.get("ids", []), existing.get("metadatas") or [])
+        }
+        # legacy "<table>_<i>" ids carry no table key → dropped and re-added
+        stale = [id_ for id_ in current if id_ not in records]
+        changed = [r for name, r in records.items() if current.get(name) != r["content_hash"]]
+
+        for batch in self._batches(stale):
+            self.collection.delete(ids=batch)
+        for batch in self._batches(changed):
+            self.collection.upsert(
+                ids=[r["table"] for r in batch],
+                documents=[r["doc"] for r in batch],
+                metadatas=[{
+                    # ✅ Chroma metadata must be flat strings
+                    "schema": r["schema"],
+                    "table": r["table"],
+                    "columns": ", ".join(r["columns"]),
+                    "foreign_keys": ", ".join(r["foreign_keys"]),
+                    "content_hash": r["content_hash"],
+                } for r in batch],
+            )
+
+        added = sum(1 for r in changed if r["table"] not in current)
+        return {"added": added, "updated": len(changed) - added, "deleted": len(stale),
+                "unchanged": len(records) - len(changed)}
+
+    def _sync_numpy(self, records: Dict[str, Dict]) -> Dict:
+        old = self.index
+        reuse = len(old) and old.meta.get("model") == self.embedding_model
+        old_rows = {r["table"]: i for i, r in enumerate(old.records)} if reuse else {}
+        changed = [r for name, r in records.items()
+                   if name not in old_rows or old.records[old_rows[name]].get("content_hash") != r["content_hash"]]
+        deleted = [name for name in old_rows if name not in records]
+        if not changed and not deleted and old.meta.get("quantization") == self.quantization:
+            return {"added": 0, "updated": 0, "deleted": 0, "unchanged": len(records)}
+
+        fresh = {}
+        for batch in self._batches(changed):
+            for r, vec in zip(batch, self.embedding_fn([r["doc"] for r in batch])):
+                fresh[r["table"]] = vec
 
-        self.collection.add(documents=docs, ids=ids, metadatas=metas)
+        ordered = list(records.values())
+        if ordered:
+            old_vectors = old.vectors() if old_rows else None
+            vectors = np.stack([
+                np.asarray(fresh[r["table"]], dtype=np.float32) if r["table"] in fresh
+                else old_vectors[old_rows[r["table"]]]
+                for r in ordered
+            ])
+        else:
+            vectors = []
 
+        # build beside the live index, then swap (queries keep using the old mmap meanwhile)
+        index = NumpyVectorIndex(old.path, quantization=self.quantization)
+        index.build(vectors, ordered, meta={"model": self.embedding_model})
+        self.index = index
 
+        added = sum(1 for r in changed if r["table"] not in old_rows)
+        return {"added": added, "updated": len(changed) - added, "deleted": len(deleted),
+                "unchanged": len(records) - len(changed)}
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed question text with the index model (cached, micro-batched)."""
+        return self.query_embedder(texts)
+
+    def prime(self, texts: List[str]) -> int:
+        """Embed a known batch of questions in one forward pass, so their query() calls hit the LRU."""
+        return self.query_embedder.prime(texts)
 
     def query(self, user_query: str) -> List[Dict]:
         """Return top-k relevant tables for a user question."""
-        results = self.collection.query(query_texts=[user_query], n_results=self.top_k)
+        vector = self.embed([user_query])[0]
+        if self.backend == "numpy":
+            return [dict(r) for r in self.index.query(vector, self.top_k)]
+
+        results = self.collection.query(query_embeddings=[vector.tolist()], n_results=self.top_k)
 
         matches = []
         for doc, meta in zip(results["documents"][0], results["metadatas"][0]):
@@ -139,3 +253,21 @@ class SchemaRetriever:
             })
 
         return matches
+
+    def stats(self) -> dict:
+        return {"backend": self.backend, "query_embeddings": self.query_embedder.stats()}
+
+
+if __name__ == "__main__":
+    import argparse
+    from helpers.config import get_config
+    from tools.schema_loader import load_schema
+
+    parser = argparse.ArgumentParser(description="Schema retriever maintenance")
+    parser.add_argument("command", choices=["resync"], help="re-embed new/changed tables, drop removed ones")
+    args = parser.parse_args()
+
+    cfg = get_config()
+    schema_json = load_schema(cfg.schema["path"])
+    retriever = SchemaRetriever.from_config(cfg, schema_json, sync_on_start=False)
+    print(retriever.sync(schema_json))
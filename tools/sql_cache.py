@@ -0,0 +1,222 @@
+import hashlib
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from helpers.cache import TTLCache
+
+
+def normalize_question(question: str) -> str:
+    """Lower-case, strip punctuation and collapse whitespace."""
+    q = re.sub(r"[^\w\s]", " ", (question or "").lower())
+    return " ".join(q.split())
+
+
+def content_hash(*parts: str) -> str:
+    h = hashlib.sha1()
+    for p in parts:
+        h.update((p or "").encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def history_hash(messages: Sequence[Dict]) -> str:
+    """Hash of the chat-history context a question is asked in ("" for a fresh session)."""
+    if not messages:
+        return ""
+    return content_hash(*(f"{m.get('role')}:{m.get('content')}" for m in messages))
+
+
+@dataclass
+class SqlCacheKey:
+    question: str
+    excerpt_hash: str
+    context_hash: str
+    vector: Optional[np.ndarray] = field(default=None, repr=False)
+
+    @property
+    def exact(self) -> tuple:
+        return (self.question, self.excerpt_hash, self.context_hash)
+
+
+class _VectorIndex:
+    """
+    Unit vectors grouped by context hash: one preallocated float32 matrix per group
+    plus its row -> key map. Rows stay dense (a removed row is refilled with the
+    group's last row), so a lookup is a single matrix @ vector over the live rows.
+    """
+
+    def __init__(self, initial_rows: int = 64):
+        self.initial_rows = max(1, int(initial_rows))
+        self._groups: Dict[str, Tuple[np.ndarray, List[Hashable]]] = {}   # context_hash -> (matrix, row -> key)
+        self._rows: Dict[Hashable, Tuple[str, int]] = {}                  # key -> (context_hash, row)
+        self._lock = threading.Lock()
+
+    def add(self, key: Hashable, context_hash: str, vec: np.ndarray) -> None:
+        with self._lock:
+            if key in self._rows:
+                self._remove(key)
+            matrix, keys = self._groups.get(context_hash) or (
+                np.empty((self.initial_rows, vec.shape[0]), dtype=np.float32), [])
+            n = len(keys)
+            if n == matrix.shape[0]:
+                grown = np.empty((2 * n, matrix.shape[1]), dtype=np.float32)
+                grown[:n] = matrix
+                matrix = grown
+            matrix[n] = vec
+            keys.append(key)
+            self._groups[context_hash] = (matrix, keys)
+            self._rows[key] = (context_hash, n)
+
+    def _remove(self, key: Hashable) -> None:
+        context_hash, row = self._rows.pop(key)
+        matrix, keys = self._groups[context_hash]
+        last = len(keys) - 1
+        if row != last:
+            matrix[row] = matrix[last]
+            keys[row] = keys[last]
+            self._rows[keys[row]] = (context_hash, row)
+        keys.pop()
+        if not keys:
+            del self._groups[context_hash]
+
+    def remove(self, key: Hashable) -> None:
+        with self._lock:
+            if key in self._rows:
+                self._remove(key)
+
+    def best(self, context_hash: str, vec: np.ndarray) -> Tuple[Optional[Hashable], float]:
+        """Closest key (cosine similarity) among vectors of the same context."""
+        with self._lock:
+            group = self._groups.get(context_hash)
+            if group is None:
+                return None, 0.0
+            matrix, keys = group
+            scores = matrix[:len(keys)] @ vec
+            row = int(np.argmax(scores))
+            return keys[row], float(scores[row])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._groups.clear()
+            self._rows.clear()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+class SqlGenerationCache:
+    """
+    Two-tier question -> SQL cache wrapped around `llm.generate_sql_json`.
+
+    Tier 1: exact match on normalized question + schema excerpt hash + history hash.
+    Tier 2: embedding similarity between questions asked in the same history context.
+    Both tiers are dropped whenever the schema file changes on disk.
+    """
+
+    def __init__(
+        self,
+        schema_path: str,
+        embed_fn: Optional[Callable[[List[str]], Sequence[Sequence[float]]]] = None,
+        max_entries: int = 1000,
+        ttl_seconds: Optional[float] = 86400,
+        similarity_threshold: float = 0.93,
+    ):
+        self.schema_path = schema_path
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+        self._exact = TTLCache(max_entries, ttl_seconds)
+        # (question, context_hash) -> out; the vectors live in _index, which follows evictions/expiry
+        self._index = _VectorIndex()
+        self._similar = TTLCache(max_entries, ttl_seconds, on_drop=lambda key, _: self._index.remove(key))
+        self._lock = threading.Lock()
+        self._schema_version = self._file_version()
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    # ------------------------------------------------------------------ #
+    def _file_version(self):
+        try:
+            st = os.stat(self.schema_path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _check_schema(self) -> None:
+        version = self._file_version()
+        if version != self._schema_version:
+            with self._lock:
+                if version != self._schema_version:
+                    self.clear()
+                    self._schema_version = version
+                    self.invalidations += 1
+
+    def _embed(self, key: SqlCacheKey) -> Optional[np.ndarray]:
+        if key.vector is None and self.embed_fn is not None and key.question:
+            vec = np.asarray(self.embed_fn([key.question])[0], dtype=np.float32)
+            norm = float(np.linalg.norm(vec))
+            key.vector = vec / norm if norm else vec
+        return key.vector
+
+    # ------------------------------------------------------------------ #
+    def key_for(self, question: str, schema_excerpt: str, history: Sequence[Dict] = ()) -> SqlCacheKey:
+        return SqlCacheKey(
+            question=normalize_question(question),
+            excerpt_hash=content_hash(schema_excerpt),
+            context_hash=history_hash(history),
+        )
+
+    def get(self, key: SqlCacheKey) -> Optional[dict]:
+        self._check_schema()
+
+        out = self._exact.get(key.exact)
+        if out is not None:
+            self.exact_hits += 1
+            return dict(out)
+
+        vec = self._embed(key)
+        if vec is not None:
+            best, score = self._index.best(key.context_hash, vec)
+            if best is not None and score >= self.similarity_threshold:
+                out = self._similar.get(best)   # None if it just expired (its row is dropped with it)
+                if out is not None:
+                    self.similar_hits += 1
+                    return dict(out)
+
+        self.misses += 1
+        return None
+
+    def put(self, key: SqlCacheKey, out: dict) -> None:
+        # Only cache usable answers; clarifications and failures must hit the LLM again.
+        if not out or not out.get("sql") or out.get("needs_clarification"):
+            return
+        self._exact.put(key.exact, dict(out))
+        vec = self._embed(key)
+        if vec is not None:
+            similar_key = (key.question, key.context_hash)
+            with self._lock:   # an eviction by a concurrent put must not land between the two
+                self._similar.put(similar_key, dict(out))
+                self._index.add(similar_key, key.context_hash, vec)
+
+    def clear(self) -> None:
+        self._exact.clear()
+        self._similar.clear()
+        self._index.clear()
+
+    def stats(self) -> dict:
+        lookups = self.exact_hits + self.similar_hits + self.misses
+        return {
+            "entries": len(self._exact),
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.exact_hits + self.similar_hits) / lookups, 4) if lookups else 0.0,
+            "evictions": self._exact.evictions,
+            "schema_invalidations": self.invalidations,
+        }
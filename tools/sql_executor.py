@@ -1,36 +1,218 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Iterator, Optional, Sequence
 from urllib.parse import quote_plus
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.engine import URL
 import pandas as pd
-from tools.paginator import wrap_with_pagination
+import pyarrow as pa
+from tools.paginator import wrap_with_pagination, first_page_sql, keyset_page_sql
 from helpers.errors import ExecutionError
+from tools.result_cache import ResultCache
+from tools.arrow_frames import (rows_to_batch, concat_batches, dictionary_encode_strings, table_to_frame,
+                                schema_from_description, stream_schema, conform_batch)
+
+logger = logging.getLogger("ai-sql-agent")
 
 class MsSqlExecutor:
-    def __init__(self, odbc_connect_str: str, timeout: int = 60):
-        # Use ODBC connection string pass-through with SQLAlchemy. :contentReference[oaicite:9]{index=9}
-        odbc_url = URL.create(
-            "mssql+pyodbc",
-            query={"odbc_connect": quote_plus(odbc_connect_str)},
-        )
-        self.engine = create_engine(
-            odbc_url,
-            pool_pre_ping=True,
-            pool_size=5,
-            max_overflow=10,
-            fast_executemany=False,  # selects only
-        )
+    def __init__(self, odbc_connect_str: str, timeout: int = 60, result_cache: Optional[ResultCache] = None,
+                 pool_size: int = 5, max_overflow: int = 10, fetch_batch_size: int = 1000,
+                 categorical_max_ratio: float = 0.5, engine=None):
+        if engine is not None:
+            # pre-built engine (e.g. the SQLite stand-in used by benchmarks)
+            self.engine = engine
+        else:
+            # Use ODBC connection string pass-through with SQLAlchemy. :contentReference[oaicite:9]{index=9}
+            odbc_url = URL.create(
+                "mssql+pyodbc",
+                query={"odbc_connect": quote_plus(odbc_connect_str)},
+            )
+            self.engine = create_engine(
+                odbc_url,
+                pool_pre_ping=True,
+                pool_size=pool_size,
+                max_overflow=max_overflow,
+                fast_executemany=False,  # selects only
+            )
         self.timeout = timeout
+        event.listen(self.engine, "connect", self._apply_timeout)
+        self.dialect = "tsql"
+        self.fetch_batch_size = fetch_batch_size
+        self.categorical_max_ratio = categorical_max_ratio
+        self.result_cache = result_cache
+        # pyodbc is blocking: async callers are offloaded to a thread pool no larger than
+        # the connection pool, so excess requests queue here instead of on the engine.
+        self._pool = ThreadPoolExecutor(max_workers=pool_size + max_overflow, thread_name_prefix="mssql")
 
-    def run_select(self, sql: str, page: int, page_size: int, hard_cap: int) -> pd.DataFrame:
-        paged_sql = wrap_with_pagination(sql, page, page_size)
+    def _apply_timeout(self, dbapi_conn, _record):
+        # pyodbc applies Connection.timeout as the query timeout of every cursor it opens
+        dbapi_conn.timeout = self.timeout
+
+    @staticmethod
+    def _timed_out(error: Exception) -> bool:
+        return "HYT00" in str(error)  # ODBC "Query timeout expired"
+
+    async def _offload(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, fn, *args)
+
+    async def arun_select(self, sql: str, page: int, page_size: int, hard_cap: int) -> pd.DataFrame:
+        return await self._offload(self.run_select, sql, page, page_size, hard_cap)
+
+    async def arun_offset_page(self, sql: str, page: int, page_size: int) -> pd.DataFrame:
+        return await self._offload(self.run_offset_page, sql, page, page_size)
+
+    async def arun_keyset_page(self, sql: str, key_columns: Sequence[str], after: Optional[Sequence],
+                               page_size: int) -> pd.DataFrame:
+        return await self._offload(self.run_keyset_page, sql, key_columns, after, page_size)
+
+    async def aiterate(self, iterator: Iterator) -> AsyncIterator:
+        """Drive a blocking iterator (e.g. iter_export) on the DB thread pool, one item per hop."""
+        done = object()
+        try:
+            while True:
+                item = await self._offload(next, iterator, done)
+                if item is done:
+                    break
+                yield item
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                # client went away mid-stream: release the cursor and connection now
+                await self._offload(close)
+
+    def _iter_batches(self, sql: str, params: Optional[dict] = None, max_rows: Optional[int] = None,
+                      on_open: Optional[Callable] = None) -> Iterator[pa.RecordBatch]:
+        """
+        fetchmany() chunks as Arrow record batches; stops reading the cursor once
+        `max_rows` is reached. The connection is held until the generator ends or is
+        closed. on_open(columns, cursor.description) is called once the query runs.
+        """
         try:
             with self.engine.connect() as conn:
-                conn = conn.execution_options(stream_results=True)
-                result = conn.execute(text(paged_sql))
-                df = pd.DataFrame(result.fetchall(), columns=result.keys())
+                result = conn.execution_options(stream_results=True).execute(text(sql), params or {})
+                try:
+                    columns = list(result.keys())
+                    if on_open is not None:
+                        on_open(columns, result.cursor.description if result.cursor is not None else None)
+                    rows = 0
+                    while max_rows is None or rows < max_rows:
+                        size = self.fetch_batch_size if max_rows is None else min(self.fetch_batch_size, max_rows - rows)
+                        chunk = result.fetchmany(size)
+                        if not chunk:
+                            break
+                        rows += len(chunk)
+                        yield rows_to_batch(chunk, columns)
+                finally:
+                    result.close()  # discards whatever the server still has buffered
+        except ExecutionError:
+            raise
         except Exception as e:
+            if self._timed_out(e):
+                raise ExecutionError(f"Query cancelled after {self.timeout}s (limits.query_timeout_seconds)") from e
             raise ExecutionError(str(e)) from e
 
-        if df.shape[0] > hard_cap:
-            df = df.head(hard_cap)
+    def _fetch(self, paged_sql: str, params: Optional[dict] = None, max_rows: Optional[int] = None) -> pd.DataFrame:
+        """
+        Pull rows in fetchmany() batches straight into Arrow record batches and stop
+        reading the cursor once `max_rows` is reached. Stats land in df.attrs["fetch_stats"].
+        """
+        started = time.perf_counter()
+        opened = {}
+        batches = list(self._iter_batches(paged_sql, params, max_rows,
+                                          on_open=lambda cols, _description: opened.update(columns=cols)))
+        columns = opened["columns"]
+        rows = sum(b.num_rows for b in batches)
+
+        table = dictionary_encode_strings(concat_batches(batches, columns), max_ratio=self.categorical_max_ratio)
+        df = table_to_frame(table)
+        df.attrs["fetch_stats"] = {
+            "rows": rows,
+            "bytes": int(table.nbytes),
+            "batches": len(batches),
+            "truncated": max_rows is not None and rows >= max_rows,
+            "seconds": round(time.perf_counter() - started, 4),
+        }
+        logger.debug("fetched %s rows / %s bytes in %s batches", rows, table.nbytes, len(batches))
+        return df
+
+    def iter_export(self, sql: str, max_rows: int) -> Iterator[pa.RecordBatch]:
+        """
+        The whole result (TOP max_rows) as record batches with one fixed schema,
+        straight from the cursor: memory stays at one fetch batch however many rows.
+        Bypasses the result cache. Blocking; use aiterate() from async code.
+        """
+        opened = {}
+
+        def on_open(columns, description):
+            opened["columns"] = columns
+            opened["schema"] = schema_from_description(description) if description else None
+
+        export_sql = first_page_sql(sql, max_rows, dialect=self.dialect)
+        schema = None
+        for batch in self._iter_batches(export_sql, max_rows=max_rows, on_open=on_open):
+            if schema is None:
+                schema = opened["schema"] or stream_schema(batch)
+            try:
+                yield conform_batch(batch, schema)
+            except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+                raise ExecutionError(f"Column type changed mid-export: {e}") from e
+        if schema is None:
+            # no rows: still one (empty) batch so encoders can write a header / schema
+            schema = opened.get("schema") or pa.schema([(str(c), pa.string()) for c in opened.get("columns", [])])
+            yield pa.RecordBatch.from_pylist([], schema=schema)
+
+    @staticmethod
+    def _from_cache(df: pd.DataFrame) -> pd.DataFrame:
+        df.attrs["fetch_stats"] = {"rows": int(df.shape[0]), "bytes": 0, "batches": 0, "cached": True}
+        return df
+
+    def run_select(self, sql: str, page: int, page_size: int, hard_cap: int) -> pd.DataFrame:
+        if self.result_cache is not None:
+            cached = self.result_cache.get(sql, page, page_size, hard_cap)
+            if cached is not None:
+                return self._from_cache(cached)
+
+        # Page 1 is a plain TOP (n) (no derived-table sort); deeper OFFSET pages only as a fallback —
+        # prefer run_keyset_page when the query has key columns.
+        if page == 1:
+            paged_sql = first_page_sql(sql, page_size, dialect=self.dialect)
+        else:
+            paged_sql = wrap_with_pagination(sql, page, page_size)
+        df = self._fetch(paged_sql, max_rows=hard_cap)
+
+        if self.result_cache is not None:
+            self.result_cache.put(sql, page, page_size, hard_cap, df=df)
+        return df
+
+    def run_offset_page(self, sql: str, page: int, page_size: int) -> pd.DataFrame:
+        """OFFSET/FETCH paging with a stable ORDER BY for every page (used when no key columns exist)."""
+        cache_parts = ("offset", page, page_size)
+        if self.result_cache is not None:
+            cached = self.result_cache.get(sql, *cache_parts)
+            if cached is not None:
+                return self._from_cache(cached)
+
+        df = self._fetch(wrap_with_pagination(sql, page, page_size), max_rows=page_size)
+
+        if self.result_cache is not None:
+            self.result_cache.put(sql, *cache_parts, df=df)
+        return df
+
+    def run_keyset_page(self, sql: str, key_columns: Sequence[str], after: Optional[Sequence],
+                        page_size: int) -> pd.DataFrame:
+        """Rows strictly after `after` (None → from the start), ordered by the key columns."""
+        cache_parts = ("keyset", tuple(key_columns), tuple(after) if after is not None else None, page_size)
+        if self.result_cache is not None:
+            cached = self.result_cache.get(sql, *cache_parts)
+            if cached is not None:
+                return self._from_cache(cached)
+
+        paged_sql, params = keyset_page_sql(sql, key_columns, after, page_size)
+        df = self._fetch(paged_sql, params, max_rows=page_size)
+
+        if self.result_cache is not None:
+            self.result_cache.put(sql, *cache_parts, df=df)
         return df
@@ -1,7 +1,9 @@
-from typing import Dict, Set
+from typing import Dict, Iterable, Optional, Set
+import hashlib
 import re
 import sqlglot
 from sqlglot import exp
+from helpers.cache import TTLCache
 from helpers.errors import ValidationError
 
 WRITE_EXPRESSIONS = (
@@ -16,61 +18,150 @@ WRITE_EXPRESSIONS = (
     exp.Revoke,
 )
 
-def _has_forbidden_funcs(root: exp.Expression, forbidden: Set[str]) -> bool:
-    for fn in root.find_all(exp.Func):
-        name = (fn.name or "").upper()
-        if any(_match_like(name, pat) for pat in forbidden):
-            return True
-    return False
+SELECT_LIKE = (exp.Select, exp.Subquery, exp.Union, exp.Paren)
+
+_OK = ""  # verdict-cache marker for a query that passed
+
+
+class SqlValidator:
+    """
+    Read-only SQL validator compiled once from the security config.
+
+    - one alternation regex for all blocked keywords
+    - block_functions split into an exact-name set and one compiled LIKE regex
+    - a single AST walk collecting write nodes, function calls, tables and columns
+    - a bounded cache of verdicts keyed by SQL hash (same SQL → same answer)
+    """
+
+    def __init__(self, dialect: str, allow_tables: Set[str], allow_cols: Dict[str, Set[str]],
+                 block_keywords: Iterable[str], block_functions: Iterable[str],
+                 allow_ctes: bool = True, cache_size: int = 4096):
+        self.dialect = dialect
+        self.allow_ctes = allow_ctes
+        self.allow_cols = allow_cols
+        self._allowed_tables = {t.lower() for t in allow_tables}
+
+        keywords = sorted({k.upper() for k in block_keywords}, key=len, reverse=True)
+        self._keyword_re = re.compile(r"\b(" + "|".join(map(re.escape, keywords)) + r")\b") if keywords else None
+
+        functions = {f.upper() for f in block_functions}
+        self._blocked_fn_names = {f for f in functions if "%" not in f}
+        like = [re.escape(f).replace("%", ".*") for f in functions if "%" in f]
+        self._blocked_fn_re = re.compile("|".join(like)) if like else None
+
+        self._verdicts = TTLCache(max_entries=cache_size) if cache_size else None
+
+    @classmethod
+    def from_config(cls, cfg, allow_tables: Set[str], allow_cols: Dict[str, Set[str]]) -> "SqlValidator":
+        return cls(
+            dialect=cfg.schema["dialect"],
+            allow_tables=allow_tables,
+            allow_cols=allow_cols,
+            block_keywords=cfg.security["block_keywords"],
+            block_functions=cfg.security["block_functions"],
+            allow_ctes=cfg.security["allow_ctes"],
+            cache_size=cfg.security.get("verdict_cache_size", 4096),
+        )
+
+    # ------------------------------------------------------------------ #
+    def _fn_blocked(self, name: str) -> bool:
+        return name in self._blocked_fn_names or (
+            self._blocked_fn_re is not None and self._blocked_fn_re.fullmatch(name) is not None
+        )
+
+    def _table_allowed(self, table: exp.Table) -> bool:
+        name = table.name.lower()
+        if table.db:
+            return f"{table.db.lower()}.{name}" in self._allowed_tables
+        # bare names resolve to the default schema
+        return name in self._allowed_tables or f"dbo.{name}" in self._allowed_tables
+
+    def _check(self, sql: str) -> None:
+        # No multiple statements
+        trees = sqlglot.parse(sql, read=self.dialect)
+        if len(trees) != 1:
+            raise ValidationError("Multiple statements detected; only a single SELECT is allowed.")
+
+        tree = trees[0]
+
+        # Ensure SELECT (or WITH->SELECT, UNIONs of SELECT)
+        if not (isinstance(tree, SELECT_LIKE) or (self.allow_ctes and isinstance(tree, exp.With))):
+            raise ValidationError("Only SELECT (and WITH CTEs leading to a SELECT) are allowed.")
+
+        # Single pass over the AST; violations are raised afterwards in the documented order
+        write_node: Optional[exp.Expression] = None
+        forbidden_fn = False
+        cte_names: Set[str] = set()
+        tables = []
+        bad_column: Optional[str] = None
+        for node in tree.walk():
+            if isinstance(node, WRITE_EXPRESSIONS):
+                write_node = write_node or node
+            elif isinstance(node, exp.Func):
+                forbidden_fn = forbidden_fn or self._fn_blocked((node.name or "").upper())
+            elif isinstance(node, exp.CTE):
+                cte_names.add(node.alias_or_name.lower())
+            elif isinstance(node, exp.Table):
+                if node.name:
+                    tables.append(node)
+            elif isinstance(node, exp.Column) and bad_column is None:
+                # (Skip strict column check for SELECT * and complex joins; still block unknown qualified refs)
+                if node.table and node.name:
+                    allowed_for_t = self.allow_cols.get(node.table, set())
+                    if allowed_for_t and node.name not in allowed_for_t:
+                        bad_column = f"{node.table}.{node.name}"
+
+        # Block any write/DDL/command expressions anywhere in AST
+        if write_node is not None:
+            raise ValidationError(f"Write/DDL operation detected: {write_node.key}")
+
+        # Block obvious keywords (string check)
+        if self._keyword_re is not None:
+            m = self._keyword_re.search(sql.upper())
+            if m:
+                raise ValidationError(f"Forbidden keyword detected: {m.group(1)}")
+
+        # Forbidden function calls
+        if forbidden_fn:
+            raise ValidationError("Forbidden function/proc detected (blocked).")
+
+        # Allow-list tables (CTE names are local to the query)
+        unknown = sorted({
+            t.sql(dialect=self.dialect) if t.db else t.name
+            for t in tables
+            if not (not t.db and t.name.lower() in cte_names) and not self._table_allowed(t)
+        })
+        if unknown:
+            raise ValidationError(f"Unknown or disallowed table(s): {', '.join(unknown)}")
+
+        if bad_column is not None:
+            raise ValidationError(f"Column '{bad_column}' not in schema allow-list.")
+
+    def validate(self, sql: str) -> str:
+        if self._verdicts is None:
+            self._check(sql)
+            return sql
+
+        key = hashlib.sha1(sql.encode("utf-8")).hexdigest()
+        verdict = self._verdicts.get(key)
+        if verdict is None:
+            try:
+                self._check(sql)
+                verdict = _OK
+            except ValidationError as e:
+                verdict = str(e)
+            self._verdicts.put(key, verdict)
+        if verdict != _OK:
+            raise ValidationError(verdict)
+        return sql
+
+    def stats(self) -> Optional[dict]:
+        return self._verdicts.stats() if self._verdicts is not None else None
 
-def _match_like(value: str, pattern: str) -> bool:
-    if "%" in pattern:
-        return re.fullmatch(pattern.replace("%", ".*"), value) is not None
-    return value == pattern.upper()
 
 def validate_read_only(sql: str, dialect: str, allow_tables: Set[str],
                        allow_cols: Dict[str, Set[str]],
                        block_keywords: Set[str], block_functions: Set[str], allow_ctes: bool = True) -> str:
-    # No multiple statements
-    trees = sqlglot.parse(sql, read=dialect)
-    if len(trees) != 1:
-        raise ValidationError("Multiple statements detected; only a single SELECT is allowed.")
-
-    tree = trees[0]
-
-    # Ensure SELECT (or WITH->SELECT, UNIONs of SELECT)
-    def _is_select_like(node: exp.Expression) -> bool:
-        return isinstance(node, (exp.Select, exp.Subquery, exp.Union, exp.Paren)) or (allow_ctes and isinstance(node, exp.With))
-    if not _is_select_like(tree):
-        raise ValidationError("Only SELECT (and WITH CTEs leading to a SELECT) are allowed.")
-
-    # Block any write/DDL/command expressions anywhere in AST
-    for node in tree.walk():
-        if isinstance(node, WRITE_EXPRESSIONS):
-            raise ValidationError(f"Write/DDL operation detected: {node.key}")
-
-    # Block obvious keywords (string check)
-    upper_sql = sql.upper()
-    for kw in block_keywords:
-        if re.search(rf"\b{re.escape(kw)}\b", upper_sql):
-            raise ValidationError(f"Forbidden keyword detected: {kw}")
-
-    # Forbidden function calls
-    if _has_forbidden_funcs(tree, {k.upper() for k in block_functions}):
-        raise ValidationError("Forbidden function/proc detected (blocked).")
-
-    # Allow-list tables & columns
-    referenced_tables = {t.name for t in tree.find_all(exp.Table) if t.name}
-    if not referenced_tables.issubset(allow_tables):
-        diff = referenced_tables - allow_tables
-        raise ValidationError(f"Unknown or disallowed table(s): {', '.join(sorted(diff))}")
-
-    # Optional: check columns under each table where resolvable
-    # (Skip strict column check for SELECT * and complex joins; still block unknown bare column refs)
-    for col in tree.find_all(exp.Column):
-        if col.table and col.name:
-            t, c = col.table, col.name
-            allowed_for_t = allow_cols.get(t, set())
-            if allowed_for_t and c not in allowed_for_t:
-                raise ValidationError(f"Column '{t}.{c}' not in schema allow-list.")
-    return sql
+    """One-shot validation; long-lived callers should keep a SqlValidator instead."""
+    return SqlValidator(dialect, allow_tables, allow_cols, block_keywords, block_functions,
+                        allow_ctes=allow_ctes, cache_size=0).validate(sql)
@@ -0,0 +1,108 @@
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import orjson
+
+from tools.embeddings import normalize_rows
+
+VECTORS_FILE = "vectors.npy"
+SCALES_FILE = "scales.npy"
+RECORDS_FILE = "records.json"
+META_FILE = "meta.json"
+
+
+class NumpyVectorIndex:
+    """
+    Flat in-process vector index.
+
+    - normalized embeddings stored as one .npy matrix, opened memory-mapped
+    - "int8" quantization keeps one float32 scale per row (4x smaller on disk/RAM)
+    - a parallel list of prebuilt records (whatever the caller wants returned)
+    - top-k = one matrix-vector product + argpartition
+    """
+
+    def __init__(self, path: str, quantization: str = "float32"):
+        if quantization not in ("float32", "int8"):
+            raise ValueError(f"Unsupported quantization: {quantization}")
+        self.path = path
+        self.quantization = quantization
+        self.meta: Dict = {}
+        self.records: List[Dict] = []
+        self._vectors: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def exists(self) -> bool:
+        return all(os.path.exists(os.path.join(self.path, f)) for f in (VECTORS_FILE, RECORDS_FILE, META_FILE))
+
+    # ------------------------------------------------------------------ #
+    def build(self, vectors, records: Sequence[Dict], meta: Optional[Dict] = None) -> None:
+        """Write a fresh index (vectors row i ↔ records[i]) and load it."""
+        mat = normalize_rows(vectors) if len(records) else np.zeros((0, 0), dtype=np.float32)
+        if mat.shape[0] != len(records):
+            raise ValueError(f"{mat.shape[0]} vectors for {len(records)} records")
+
+        os.makedirs(self.path, exist_ok=True)
+        if self.quantization == "int8":
+            scales = np.abs(mat).max(axis=1) / 127.0 if len(mat) else np.zeros(0, dtype=np.float32)
+            scales[scales == 0] = 1.0
+            self._write(SCALES_FILE, lambda f: np.save(f, scales.astype(np.float32)))
+            mat = np.round(mat / scales[:, None]).astype(np.int8)
+        self._write(VECTORS_FILE, lambda f: np.save(f, mat))
+        self._write(RECORDS_FILE, lambda f: f.write(orjson.dumps(list(records))))
+
+        meta = dict(meta or {})
+        meta.update({"count": len(records), "dim": int(mat.shape[1]) if mat.ndim == 2 else 0,
+                     "quantization": self.quantization})
+        # written last; load() rejects files whose counts disagree with it
+        self._write(META_FILE, lambda f: f.write(orjson.dumps(meta)))
+        self.load()
+
+    def _write(self, name: str, writer) -> None:
+        # write-then-rename: a live mmap of the previous file stays valid
+        target = os.path.join(self.path, name)
+        with open(target + ".tmp", "wb") as f:
+            writer(f)
+        os.replace(target + ".tmp", target)
+
+    def load(self) -> "NumpyVectorIndex":
+        with open(os.path.join(self.path, META_FILE), "rb") as f:
+            self.meta = orjson.loads(f.read())
+        with open(os.path.join(self.path, RECORDS_FILE), "rb") as f:
+            self.records = orjson.loads(f.read())
+        self.quantization = self.meta.get("quantization", self.quantization)
+        self._vectors = np.load(os.path.join(self.path, VECTORS_FILE), mmap_mode="r")
+        self._scales = (np.load(os.path.join(self.path, SCALES_FILE))
+                        if self.quantization == "int8" else None)
+        count = self.meta.get("count")
+        if not (count == len(self.records) == self._vectors.shape[0]):
+            raise ValueError(f"Inconsistent index at {self.path}: meta={count} records={len(self.records)} "
+                             f"vectors={self._vectors.shape[0]}")
+        return self
+
+    def vectors(self) -> np.ndarray:
+        """All rows as float32 (dequantized); used to carry unchanged rows into a rebuild."""
+        if self._vectors is None:
+            return np.zeros((0, 0), dtype=np.float32)
+        mat = np.asarray(self._vectors, dtype=np.float32)
+        return mat * self._scales[:, None] if self._scales is not None else mat
+
+    # ------------------------------------------------------------------ #
+    def search(self, query_vector, k: int) -> List[Tuple[int, float]]:
+        """Return [(row, cosine score)] for the k best rows, best first."""
+        if self._vectors is None or not len(self.records) or k <= 0:
+            return []
+        q = normalize_rows(query_vector)[0]
+        scores = self._vectors @ q
+        if self._scales is not None:
+            scores = scores * self._scales
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(i), float(scores[i])) for i in top]
+
+    def query(self, query_vector, k: int) -> List[Dict]:
+        return [self.records[i] for i, _ in self.search(query_vector, k)]